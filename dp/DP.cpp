@@ -1,6 +1,7 @@
 #pragma clang diagnostic push
 #pragma ide diagnostic ignored "modernize-use-nodiscard"
 //---------------------------------------------------------------------------
+#include <cstdlib>
 #include <cstring>
 #include <string_view>
 #include <fstream>
@@ -17,7 +18,10 @@
 #include <chrono>
 #include <random>
 #include <thread>
+#include <algorithm>
+#include <functional>
 #include "lleaves_header.hpp"
+#include "feature_layout.hpp" // generated by dp/feature_layout.py
 //---------------------------------------------------------------------------
 namespace fs = std::filesystem;
 //---------------------------------------------------------------------------
@@ -92,21 +96,22 @@ struct Features {
 };
 //---------------------------------------------------------------------------
 void Features::add_to_vector(std::span<double> vec) const {
-    vec[0] += TableScan_Scan_const;
-    vec[1] += TableScan_Scan_in_card;
-    vec[3] += TableScan_Scan_out_percentage;
-    vec[5] += 1.0; // TableScan_Scan_compare_percentage is always set to 1, so we have a plausible filter
-    vec[10] += TableScan_Scan_empty_output;
+    namespace layout = feature_layout;
+    vec[layout::TableScan_Scan_const] += TableScan_Scan_const;
+    vec[layout::TableScan_Scan_in_card] += TableScan_Scan_in_card;
+    vec[layout::TableScan_Scan_out_percentage] += TableScan_Scan_out_percentage;
+    vec[layout::TableScan_Scan_compare_percentage] += 1.0; // always set to 1, so we have a plausible filter
+    vec[layout::TableScan_Scan_empty_output] += TableScan_Scan_empty_output;
 
-    vec[39] += HashJoin_Build_const;
-    vec[40] += HashJoin_Build_out_card;
-    vec[41] += HashJoin_Build_out_size;
-    vec[42] += HashJoin_Build_in_percentage;
+    vec[layout::HashJoin_Build_const] += HashJoin_Build_const;
+    vec[layout::HashJoin_Build_out_card] += HashJoin_Build_out_card;
+    vec[layout::HashJoin_Build_out_size] += HashJoin_Build_out_size;
+    vec[layout::HashJoin_Build_in_percentage] += HashJoin_Build_in_percentage;
 
-    vec[43] += HashJoin_Probe_const;
-    vec[44] += HashJoin_Probe_in_card;
-    vec[45] += HashJoin_Probe_right_percentage;
-    vec[46] += HashJoin_Probe_out_percentage;
+    vec[layout::HashJoin_Probe_const] += HashJoin_Probe_const;
+    vec[layout::HashJoin_Probe_in_card] += HashJoin_Probe_in_card;
+    vec[layout::HashJoin_Probe_right_percentage] += HashJoin_Probe_right_percentage;
+    vec[layout::HashJoin_Probe_out_percentage] += HashJoin_Probe_out_percentage;
 }
 //---------------------------------------------------------------------------
 void Features::operator+=(const Features& o) {
@@ -127,7 +132,7 @@ void Features::operator+=(const Features& o) {
 }
 //---------------------------------------------------------------------------
 void Features::print() const {
-    std::array<double, 110> vec{};
+    std::array<double, feature_layout::nFeatures> vec{};
     add_to_vector(vec);
     auto& wrtr = std::cout;
     wrtr << "[";
@@ -140,22 +145,27 @@ void Features::print() const {
 struct Model {
     std::vector<double> data;
     std::vector<double> out;
-    static constexpr uint64_t nFeatures = 110;
+    static constexpr uint64_t nFeatures = feature_layout::nFeatures;
     uint64_t currentlyFilled = 0;
     uint64_t callsToPredict = 0;
 
 
+    // Smallest number of rows per thread in predictBatchCompiled
+    static constexpr uint64_t minRowsPerThread = 256;
+
     void prepare();
     double predictCompiled();
     void predictManyCompiled();
+    void predictBatchCompiled(uint64_t nThreads = 0);
     void resize(uint64_t n);
+    void reserve(uint64_t n);
     double* registerFeatures(const Features& features);
     void resetInput();
 };
 //---------------------------------------------------------------------------
 double Model::predictCompiled() {
     forest_root(data.data(), out.data(), 0, 1);
-    out[0] = std::exp(-out[0]) * data[1];
+    out[0] = std::exp(-out[0]) * data[feature_layout::TableScan_Scan_in_card];
     resetInput();
     currentlyFilled = 0;
     ++callsToPredict;
@@ -164,28 +174,55 @@ double Model::predictCompiled() {
 //---------------------------------------------------------------------------
 void
 processChunk(std::vector<double>& data, std::vector<double>& out, uint64_t start, uint64_t end, int nFeatures) {
-    int nCurrent = static_cast<int>(end - start);
-    forest_root(data.data(), out.data(), static_cast<int>(start), nCurrent);
+    // forest_root evaluates the rows [start, end)
+    forest_root(data.data(), out.data(), static_cast<int>(start), static_cast<int>(end));
     for (uint64_t i = start; i < end; ++i) {
-        out[i] = std::exp(-out[i]) * data[i * nFeatures + 1];
+        out[i] = std::exp(-out[i]) * data[i * nFeatures + feature_layout::TableScan_Scan_in_card];
     }
 }
 //---------------------------------------------------------------------------
 void Model::predictManyCompiled() {
     forest_root(data.data(), out.data(), 0, static_cast<int>(currentlyFilled));
     for (uint64_t i = 0; i < currentlyFilled; ++i) {
-        out[i] = std::exp(-out[i]) * data[i * nFeatures + 1];
+        out[i] = std::exp(-out[i]) * data[i * nFeatures + feature_layout::TableScan_Scan_in_card];
     }
     resetInput();
     currentlyFilled = 0;
     ++callsToPredict;
 }
 //---------------------------------------------------------------------------
+void Model::predictBatchCompiled(uint64_t nThreads) {
+    // Like predictManyCompiled, but large batches are split into chunks that are evaluated in parallel
+    // by nThreads threads (all hardware threads if 0)
+    if (nThreads == 0) {
+        nThreads = std::max(1u, std::thread::hardware_concurrency());
+    }
+    uint64_t chunkSize = std::max(minRowsPerThread, (currentlyFilled + nThreads - 1) / nThreads);
+    std::vector<std::thread> threads;
+    for (uint64_t start = chunkSize; start < currentlyFilled; start += chunkSize) {
+        threads.emplace_back(processChunk, std::ref(data), std::ref(out), start,
+                             std::min(start + chunkSize, currentlyFilled), static_cast<int>(nFeatures));
+    }
+    processChunk(data, out, 0, std::min(chunkSize, currentlyFilled), static_cast<int>(nFeatures));
+    for (auto& thread: threads) {
+        thread.join();
+    }
+    resetInput();
+    ++callsToPredict;
+}
+//---------------------------------------------------------------------------
 void Model::resize(uint64_t n) {
     data.resize(n * nFeatures);
     out.resize(n);
 }
 //---------------------------------------------------------------------------
+void Model::reserve(uint64_t n) {
+    // Growing keeps the input zeroed, registered rows stay valid
+    if (out.size() < n) {
+        resize(n);
+    }
+}
+//---------------------------------------------------------------------------
 double* Model::registerFeatures(const Features& features) {
     assert(currentlyFilled < out.size());
     assert(out.size() * nFeatures == data.size());
@@ -197,7 +234,8 @@ double* Model::registerFeatures(const Features& features) {
 }
 //---------------------------------------------------------------------------
 void Model::resetInput() {
-    std::memset(data.data(), 0, data.size() * sizeof(double));
+    // Only the registered rows are not zero
+    std::memset(data.data(), 0, currentlyFilled * nFeatures * sizeof(double));
     currentlyFilled = 0;
 }
 //---------------------------------------------------------------------------
@@ -244,8 +282,10 @@ struct QueryGraph {
     std::vector<Join> joins;
     std::unordered_map<uint64_t, double> cardinalities;
     std::vector<std::vector<const Join*> > joinLookup;
+    std::vector<uint64_t> neighbors; // bitset of the relations joined with each relation
 
     bool isConnected(uint64_t leftClass, uint64_t rightClass) const;
+    uint64_t getNeighborhood(uint64_t relations) const;
     void prepareLookup();
 };
 //---------------------------------------------------------------------------
@@ -264,11 +304,26 @@ bool QueryGraph::isConnected(uint64_t leftClass, uint64_t rightClass) const {
     return false;
 }
 //---------------------------------------------------------------------------
+uint64_t QueryGraph::getNeighborhood(uint64_t relations) const {
+    uint64_t result = 0;
+    for (auto it = BitsetIterator{relations}, end = BitsetIterator::end(); it != end; ++it) {
+        result |= neighbors[*it];
+    }
+    return result & ~relations;
+}
+//---------------------------------------------------------------------------
 void QueryGraph::prepareLookup() {
     joinLookup.resize(relations.size());
+    neighbors.assign(relations.size(), 0);
     for (const auto& j: joins) {
         joinLookup[std::countr_zero(j.left)].push_back(&j);
         joinLookup[std::countr_zero(j.right)].push_back(&j);
+        for (auto it = BitsetIterator{j.left}, end = BitsetIterator::end(); it != end; ++it) {
+            neighbors[*it] |= j.right;
+        }
+        for (auto it = BitsetIterator{j.right}, end = BitsetIterator::end(); it != end; ++it) {
+            neighbors[*it] |= j.left;
+        }
     }
 }
 //---------------------------------------------------------------------------
@@ -482,6 +537,41 @@ CostModelReturnVal cost_model(Plan* leftPlan, Plan* rightPlan, double outCard, M
     return res;
 }
 //---------------------------------------------------------------------------
+// A join of a DP level whose cost is evaluated together with all other joins of the level
+struct JoinCandidate {
+    Plan* leftPlan;
+    Plan* rightPlan;
+    uint64_t newClass;
+    double card;
+    CostModelReturnVal result;
+};
+//---------------------------------------------------------------------------
+void cost_cout_batch(std::vector<JoinCandidate>& candidates, Model& model) {
+    for (auto& c: candidates) {
+        c.result = cost_cout(c.leftPlan, c.rightPlan, c.card, model);
+    }
+}
+//---------------------------------------------------------------------------
+void cost_model_batch(std::vector<JoinCandidate>& candidates, Model& model) {
+    // Register build and probe pipeline of all candidates, then evaluate them with a single forest call
+    model.reserve(2 * candidates.size());
+    for (auto& c: candidates) {
+        model.registerFeatures(c.leftPlan->buildHashTable());
+        c.result.openPipelineFeatures = getProbeFeatures(c.rightPlan, c.leftPlan, c.card);
+        model.registerFeatures(c.result.openPipelineFeatures);
+    }
+    model.predictBatchCompiled();
+    for (uint64_t i = 0; i < candidates.size(); ++i) {
+        auto& c = candidates[i];
+        double leftBuildCost = model.out[2 * i];
+        double probeCost = model.out[2 * i + 1];
+        c.result.matCost = c.leftPlan->matCost + c.rightPlan->matCost + leftBuildCost;
+        c.result.cost = c.result.matCost + probeCost;
+    }
+}
+//---------------------------------------------------------------------------
+using ClassPairs = std::vector<std::pair<uint64_t, uint64_t> >;
+//---------------------------------------------------------------------------
 template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
 class PlanGenerator {
     // Mapping from bitset of relations to plan
@@ -491,6 +581,17 @@ class PlanGenerator {
     // Model for cost prediction
     Plan* createBaseTablePlan(const Relation& relation);
     Plan* createPlan(Plan* left, Plan* right);
+    // DPccp helpers, see Moerkotte and Neumann: Analysis of Two Existing and One New Dynamic Programming Algorithm
+    void emitCsg(uint64_t s1, const QueryGraph& q);
+    void enumerateCsgRec(uint64_t s1, uint64_t excluded, const QueryGraph& q);
+    void enumerateCmpRec(uint64_t s1, uint64_t s2, uint64_t excluded, const QueryGraph& q);
+    void emitCsgCmp(uint64_t s1, uint64_t s2, const QueryGraph& q);
+    // If set, DPccp collects the csg-cmp pairs by size of the result instead of costing them right away
+    std::vector<ClassPairs>* collectedPairs = nullptr;
+    // Replace the plan of entry if the new join is cheaper
+    void updatePlan(Plan* entry, Plan* leftPlan, Plan* rightPlan, double card, const CostModelReturnVal& val);
+    // Joins of the current level for batched costing
+    std::vector<JoinCandidate> candidates;
 
     public:
     Model* model = nullptr;
@@ -499,8 +600,18 @@ class PlanGenerator {
     void seedBaseTables(const QueryGraph& q);
     // Run DPSize
     Plan* runDPSize(const QueryGraph& q);
+    // Run DPccp, only connected subgraphs and their connected complements are enumerated
+    Plan* runDPccp(const QueryGraph& q);
+    // Run DPSize/DPccp and cost all joins of a level (by number of relations) together
+    template<void (* BatchCostFn)(std::vector<JoinCandidate>&, Model&)>
+    Plan* runDPSizeBatched(const QueryGraph& q);
+    template<void (* BatchCostFn)(std::vector<JoinCandidate>&, Model&)>
+    Plan* runDPccpBatched(const QueryGraph& q);
     // Create new join tree if better. Returns, newly allocated plans (not updated plans)
     Plan* createJoinTree(uint64_t leftClass, Plan* leftPlan, uint64_t rightClass, Plan* rightPlan, const QueryGraph& q);
+    // Same as createJoinTree for all pairs of a level, newly allocated classes are appended to newClasses
+    template<void (* BatchCostFn)(std::vector<JoinCandidate>&, Model&)>
+    void createJoinTrees(const ClassPairs& pairs, const QueryGraph& q, std::vector<uint64_t>& newClasses);
 };
 //---------------------------------------------------------------------------
 #pragma clang diagnostic push
@@ -569,6 +680,72 @@ Plan* PlanGenerator<CostFn>::runDPSize(const QueryGraph& q) {
 }
 //---------------------------------------------------------------------------
 template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+Plan* PlanGenerator<CostFn>::runDPccp(const QueryGraph& q) {
+    assert(model);
+    seedBaseTables(q);
+    for (uint64_t i = q.relations.size(); i-- > 0;) {
+        uint64_t v = 1ull << i;
+        emitCsg(v, q);
+        enumerateCsgRec(v, fullBitset(i + 1), q);
+    }
+    uint64_t allRelationsBitset = fullBitset(q.relations.size());
+    assert(plans.find(allRelationsBitset) != plans.end());
+    return plans[allRelationsBitset];
+}
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+void PlanGenerator<CostFn>::emitCsg(uint64_t s1, const QueryGraph& q) {
+    // exclude all relations with a smaller index than the smallest one of s1
+    uint64_t excluded = s1 | fullBitset(std::countr_zero(s1) + 1);
+    uint64_t neighborhood = q.getNeighborhood(s1) & ~excluded;
+    for (int64_t v = 63 - std::countl_zero(neighborhood); v >= 0; --v) {
+        uint64_t s2 = 1ull << v;
+        if (!(neighborhood & s2)) continue;
+        emitCsgCmp(s1, s2, q);
+        enumerateCmpRec(s1, s2, excluded | (neighborhood & fullBitset(v + 1)), q);
+    }
+}
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+void PlanGenerator<CostFn>::enumerateCsgRec(uint64_t s1, uint64_t excluded, const QueryGraph& q) {
+    uint64_t neighborhood = q.getNeighborhood(s1) & ~excluded;
+    // iterate all non-empty subsets of the neighborhood
+    for (uint64_t s = neighborhood & -neighborhood; s; s = (s - neighborhood) & neighborhood) {
+        emitCsg(s1 | s, q);
+    }
+    for (uint64_t s = neighborhood & -neighborhood; s; s = (s - neighborhood) & neighborhood) {
+        enumerateCsgRec(s1 | s, excluded | neighborhood, q);
+    }
+}
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+void PlanGenerator<CostFn>::enumerateCmpRec(uint64_t s1, uint64_t s2, uint64_t excluded, const QueryGraph& q) {
+    uint64_t neighborhood = q.getNeighborhood(s2) & ~excluded;
+    for (uint64_t s = neighborhood & -neighborhood; s; s = (s - neighborhood) & neighborhood) {
+        emitCsgCmp(s1, s2 | s, q);
+    }
+    for (uint64_t s = neighborhood & -neighborhood; s; s = (s - neighborhood) & neighborhood) {
+        enumerateCmpRec(s1, s2 | s, excluded | neighborhood, q);
+    }
+}
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+void PlanGenerator<CostFn>::emitCsgCmp(uint64_t s1, uint64_t s2, const QueryGraph& q) {
+    // each pair is emitted once, but the build and probe side are not interchangeable
+    if (collectedPairs) {
+        auto& pairs = (*collectedPairs)[std::popcount(s1 | s2)];
+        pairs.emplace_back(s1, s2);
+        pairs.emplace_back(s2, s1);
+        return;
+    }
+    Plan* plan1 = plans[s1];
+    Plan* plan2 = plans[s2];
+    assert(plan1 && plan2);
+    createJoinTree(s1, plan1, s2, plan2, q);
+    createJoinTree(s2, plan2, s1, plan1, q);
+}
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
 Plan* PlanGenerator<CostFn>::createJoinTree(
     uint64_t leftClass, Plan* leftPlan,
     uint64_t rightClass, Plan* rightPlan,
@@ -591,16 +768,102 @@ Plan* PlanGenerator<CostFn>::createJoinTree(
     double card = q.cardinalities.find(newClass)->second;
     // auto modelReturnVal = cost_cout(leftPlan, rightPlan, card, *model);
     CostModelReturnVal modelReturnVal = CostFn(leftPlan, rightPlan, card, *model);
-    if (modelReturnVal.cost < entry->cost) {
+    updatePlan(entry, leftPlan, rightPlan, card, modelReturnVal);
+
+    return allocated ? entry : nullptr;
+}
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+void PlanGenerator<CostFn>::updatePlan(
+    Plan* entry, Plan* leftPlan, Plan* rightPlan, double card, const CostModelReturnVal& val) {
+    if (val.cost < entry->cost) {
         entry->left = leftPlan;
         entry->right = rightPlan;
-        entry->cost = modelReturnVal.cost;
+        entry->cost = val.cost;
         entry->cardinality = card;
-        entry->openPipelineFeatures = modelReturnVal.openPipelineFeatures;
-        entry->matCost = modelReturnVal.matCost;
+        entry->openPipelineFeatures = val.openPipelineFeatures;
+        entry->matCost = val.matCost;
     }
-
-    return allocated ? entry : nullptr;
+}
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+template<void (* BatchCostFn)(std::vector<JoinCandidate>&, Model&)>
+void PlanGenerator<CostFn>::createJoinTrees(
+    const ClassPairs& pairs, const QueryGraph& q, std::vector<uint64_t>& newClasses) {
+    // Entries are created in enumeration order, so the same joins are costed as with createJoinTree
+    candidates.clear();
+    for (const auto& [leftClass, rightClass]: pairs) {
+        uint64_t newClass = leftClass | rightClass;
+        Plan* leftPlan = plans[leftClass];
+        Plan* rightPlan = plans[rightClass];
+        assert(leftPlan && rightPlan);
+        if (plans.find(newClass) == plans.end()) {
+            if (!q.isConnected(leftClass, rightClass)) {
+                continue;
+            }
+            plans[newClass] = createPlan(leftPlan, rightPlan);
+            newClasses.push_back(newClass);
+        }
+        candidates.push_back(JoinCandidate{leftPlan, rightPlan, newClass, q.cardinalities.find(newClass)->second, {}});
+    }
+    if (candidates.empty()) {
+        return;
+    }
+    BatchCostFn(candidates, *model);
+    for (const auto& c: candidates) {
+        updatePlan(plans[c.newClass], c.leftPlan, c.rightPlan, c.card, c.result);
+    }
+}
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+template<void (* BatchCostFn)(std::vector<JoinCandidate>&, Model&)>
+Plan* PlanGenerator<CostFn>::runDPSizeBatched(const QueryGraph& q) {
+    assert(model);
+    seedBaseTables(q);
+    std::vector<std::vector<uint64_t> > sizes;
+    sizes.resize(q.relations.size() + 1);
+    for (const auto& r: q.relations) {
+        sizes[1].push_back(1ull << r.id);
+    }
+    ClassPairs pairs;
+    for (uint64_t size = 2; size <= q.relations.size(); ++size) {
+        pairs.clear();
+        for (uint64_t leftSize = 1; leftSize < size; ++leftSize) {
+            for (uint64_t leftClass: sizes[leftSize]) {
+                for (uint64_t rightClass: sizes[size - leftSize]) {
+                    if (leftClass & rightClass) continue;
+                    pairs.emplace_back(leftClass, rightClass);
+                }
+            }
+        }
+        createJoinTrees<BatchCostFn>(pairs, q, sizes[size]);
+    }
+    uint64_t allRelationsBitset = fullBitset(q.relations.size());
+    assert(plans.find(allRelationsBitset) != plans.end());
+    return plans[allRelationsBitset];
+}
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+template<void (* BatchCostFn)(std::vector<JoinCandidate>&, Model&)>
+Plan* PlanGenerator<CostFn>::runDPccpBatched(const QueryGraph& q) {
+    assert(model);
+    seedBaseTables(q);
+    // Enumerate all csg-cmp pairs first, then cost them by level as their sub plans are complete
+    std::vector<ClassPairs> pairsBySize(q.relations.size() + 1);
+    collectedPairs = &pairsBySize;
+    for (uint64_t i = q.relations.size(); i-- > 0;) {
+        uint64_t v = 1ull << i;
+        emitCsg(v, q);
+        enumerateCsgRec(v, fullBitset(i + 1), q);
+    }
+    collectedPairs = nullptr;
+    std::vector<uint64_t> newClasses;
+    for (uint64_t size = 2; size <= q.relations.size(); ++size) {
+        createJoinTrees<BatchCostFn>(pairsBySize[size], q, newClasses);
+    }
+    uint64_t allRelationsBitset = fullBitset(q.relations.size());
+    assert(plans.find(allRelationsBitset) != plans.end());
+    return plans[allRelationsBitset];
 }
 //---------------------------------------------------------------------------
 std::string printPlan(const Plan* plan, const QueryGraph& q) {
@@ -611,9 +874,12 @@ std::string printPlan(const Plan* plan, const QueryGraph& q) {
     return "(" + printPlan(plan->left, q) + "⋈" + printPlan(plan->right, q) + ")";
 }
 //---------------------------------------------------------------------------
-template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&)>
+enum class Enumeration { DPSize, DPccp, DPSizeBatched, DPccpBatched };
+//---------------------------------------------------------------------------
+template<CostModelReturnVal (* CostFn)(Plan*, Plan*, double, Model&),
+    void (* BatchCostFn)(std::vector<JoinCandidate>&, Model&)>
 void runModel(const fs::path& outPath, Model model, std::vector<QueryGraph> qs,
-              const std::vector<std::string>& names, std::ofstream& tbl) {
+              const std::vector<std::string>& names, std::ofstream& tbl, Enumeration enumeration) {
     std::ofstream planFile(outPath);
     auto begin = std::chrono::high_resolution_clock::now();
     for (uint64_t i = 0; i < qs.size(); ++i) {
@@ -622,7 +888,13 @@ void runModel(const fs::path& outPath, Model model, std::vector<QueryGraph> qs,
         q.prepareLookup();
         PlanGenerator<CostFn> pg;
         pg.model = &model;
-        Plan* best = pg.runDPSize(q);
+        Plan* best = nullptr;
+        switch (enumeration) {
+            case Enumeration::DPSize: best = pg.runDPSize(q); break;
+            case Enumeration::DPccp: best = pg.runDPccp(q); break;
+            case Enumeration::DPSizeBatched: best = pg.template runDPSizeBatched<BatchCostFn>(q); break;
+            case Enumeration::DPccpBatched: best = pg.template runDPccpBatched<BatchCostFn>(q); break;
+        }
         auto currentEnd = std::chrono::high_resolution_clock::now();
         std::chrono::duration<double, std::milli> duration = currentEnd - currentBegin;
         // std::cout << names[i] << " cost: " << best->cost << ", time: " << duration.count() << "ms ";
@@ -698,9 +970,41 @@ void benchmarkModelLatencyScaling(const Model& model) {
     outFile.close();
 }
 //---------------------------------------------------------------------------
-int main() {
+void checkBatchPrediction(const Model& model) {
+    // predictBatchCompiled has to match predictManyCompiled on a batch that is split into several chunks
+    constexpr uint64_t nThreads = 4;
+    uint64_t n = nThreads * Model::minRowsPerThread + 17;
+    std::mt19937 gen(42);
+    Model many = model;
+    Model batch = model;
+    many.resize(n);
+    batch.resize(n);
+    for (uint64_t i = 0; i < n; ++i) {
+        Features features = sampleRandomFeatures(gen);
+        many.registerFeatures(features);
+        batch.registerFeatures(features);
+    }
+    many.predictManyCompiled();
+    batch.predictBatchCompiled(nThreads);
+    for (uint64_t i = 0; i < n; ++i) {
+        if (std::abs(many.out[i] - batch.out[i]) > 1e-9 * std::abs(many.out[i])) {
+            std::cerr << "predictBatchCompiled differs from predictManyCompiled in row " << i << ": "
+                      << batch.out[i] << " != " << many.out[i] << std::endl;
+            std::exit(1);
+        }
+    }
+}
+//---------------------------------------------------------------------------
+int main(int argc, char** argv) {
+    if (argc > 1 && std::string_view(argv[1]) == "--model-hash") {
+        // Checked against model.txt and lleaves.o by dp/feature_layout.py
+        std::cout << feature_layout::modelFileHash << "\n" << feature_layout::modelObjectHash << std::endl;
+        return 0;
+    }
+    std::cout << "feature layout of model " << feature_layout::modelHash << std::endl;
     Model model;
     model.resize(1);
+    checkBatchPrediction(model);
 
     benchmarkModelLatencyScaling<&Model::predictManyCompiled>(model);
 
@@ -713,12 +1017,26 @@ int main() {
 
     std::ofstream optTbl("./figure_output/tbl_join_order_speed.tex");
     optTbl << std::fixed;
-    optTbl << "\\begin{tabular}{r|r r r}\n" <<
-            "Model & Opt. Time & Model Calls & Time/Call\\\\\n\\hline\n" <<
-            "$\\text{C}_{\\text{out}}$ & ";
-    runModel<cost_cout>(fs::path("./dp/cout_plans.txt"), model, qs, names, optTbl);
-    optTbl << "T3 & ";
-    runModel<cost_model>(fs::path("./dp/model_plans.txt"), model, qs, names, optTbl);
+    optTbl << "\\begin{tabular}{r r|r r r}\n" <<
+            "Model & Enumeration & Opt. Time & Model Calls & Time/Call\\\\\n\\hline\n" <<
+            "$\\text{C}_{\\text{out}}$ & DPsize & ";
+    runModel<cost_cout, cost_cout_batch>(
+        fs::path("./dp/cout_plans.txt"), model, qs, names, optTbl, Enumeration::DPSize);
+    optTbl << "$\\text{C}_{\\text{out}}$ & DPccp & ";
+    runModel<cost_cout, cost_cout_batch>(
+        fs::path("./dp/cout_plans_dpccp.txt"), model, qs, names, optTbl, Enumeration::DPccp);
+    optTbl << "T3 & DPsize & ";
+    runModel<cost_model, cost_model_batch>(
+        fs::path("./dp/model_plans.txt"), model, qs, names, optTbl, Enumeration::DPSize);
+    optTbl << "T3 & DPccp & ";
+    runModel<cost_model, cost_model_batch>(
+        fs::path("./dp/model_plans_dpccp.txt"), model, qs, names, optTbl, Enumeration::DPccp);
+    optTbl << "T3 & DPsize (batched) & ";
+    runModel<cost_model, cost_model_batch>(
+        fs::path("./dp/model_plans_batched.txt"), model, qs, names, optTbl, Enumeration::DPSizeBatched);
+    optTbl << "T3 & DPccp (batched) & ";
+    runModel<cost_model, cost_model_batch>(
+        fs::path("./dp/model_plans_dpccp_batched.txt"), model, qs, names, optTbl, Enumeration::DPccpBatched);
     optTbl << "\\end{tabular}\n";
 }
 //---------------------------------------------------------------------------
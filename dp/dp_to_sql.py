@@ -1,26 +1,56 @@
 import codecs
 from pathlib import Path
 import re
-from typing import Optional
+from typing import Iterator, Optional
+
+JOB_QUERY_DIR = "queries/job"
+PLAN_TOKEN_PATTERN = re.compile(r"\(|\)|⋈|[^()⋈]+")
+SELECT_PATTERN = re.compile(r"SELECT\s+(.*?)\s+FROM\s+", re.DOTALL | re.IGNORECASE)
+FROM_PATTERN = re.compile(r"FROM\s+(.*?)\s+WHERE", re.DOTALL | re.IGNORECASE)
+RELATIONS_PATTERN = re.compile(r"(\w+)\s+AS\s+(\w+)", re.IGNORECASE)
+WHERE_PATTERN = re.compile(r"WHERE\s+(.*)", re.DOTALL | re.IGNORECASE)
+CONDITIONS_PATTERN = re.compile(r"( AND | and )?\s*([\w\.]+.*?)(?=( AND | and |$))", re.IGNORECASE)
+FUNCTION_PATTERN = re.compile(r"\([^)]*\)")
+NUMBER_SUFFIX_PATTERN = re.compile(r"\d+$")
+
+
+def get_job_query_files() -> dict[str, Path]:
+    """
+    job query files by the name of their plans in the plan files, sorted by name
+    """
+    queries = list(Path(JOB_QUERY_DIR).glob("*.sql"))
+    query_dict = {q.name[:-4] + ".txt": q for q in queries}
+    return {n: query_dict[n] for n in sorted(query_dict)}
 
 
-def read_plans(plan_file: Path) -> dict[Path, str]:
-    queries = list(Path("queries/job").glob("*.sql"))
-    query_dict = {q.name[:-4] + ".txt": q for q in queries}
-    plan_dict = {}
-    res = {}
-    with open(plan_file, "r") as plans:
+def index_plans(plan_file: Path) -> dict[str, int]:
+    """
+    byte offset of each plan in the plan file by query name, so plans can be streamed in any order
+    """
+    result = {}
+    with open(plan_file, "rb") as plans:
         while True:
             query_name = plans.readline()
-            plan = plans.readline()
             if not query_name:
                 break
-            plan_dict[query_name[:-1]] = plan[:-1]
-    for n in sorted(query_dict):
-        q = query_dict[n]
-        p = plan_dict[n]
-        res[q] = p
-    return res
+            result[query_name[:-1].decode()] = plans.tell()
+            plans.readline()
+    return result
+
+
+def iterate_plans(plan_file: Path) -> Iterator[tuple[Path, str]]:
+    """
+    plans of all job queries ordered by query name, only one plan string is kept in memory at a time
+    """
+    offsets = index_plans(plan_file)
+    with open(plan_file, "rb") as plans:
+        for n, q in get_job_query_files().items():
+            plans.seek(offsets[n])
+            yield q, plans.readline().decode().rstrip("\n")
+
+
+def read_plans(plan_file: Path) -> dict[Path, str]:
+    return dict(iterate_plans(plan_file))
 
 
 class Plan:
@@ -46,26 +76,36 @@ class Plan:
         return not self.is_leaf() and self.left.is_leaf() and self.right.is_leaf()
 
 
-def find_matching_parenthesis(string):
-    count = 0
-    for i in range(0, len(string)):
-        if string[i] == "(":
-            count += 1
-        elif string[i] == ")":
-            count -= 1
-        if count == 0:
-            return i
-
-
 def parse_plan(plan_str) -> Plan:
-    if plan_str.startswith("("):
-        end_w1 = find_matching_parenthesis(plan_str)
-        w1 = plan_str[1:end_w1]
-        assert plan_str[end_w1 : end_w1 + 3] == ")⋈("
-        w2 = plan_str[end_w1 + 3 : -1]
-        return Plan("", parse_plan(w1), parse_plan(w2))
-    else:
-        return Plan(plan_str)
+    """
+    parses "(left)⋈(right)" or a relation name with a single pass over the tokens
+    """
+    # one frame per open parenthesis with its relation name and its sub plans
+    frames: list[tuple[list[str], list[Plan]]] = []
+    result = None
+    for token in PLAN_TOKEN_PATTERN.findall(f"({plan_str})"):
+        if token == "(":
+            frames.append(([], []))
+        elif token == ")":
+            name, children = frames.pop()
+            if name:
+                assert len(children) == 0
+                plan = Plan(name[0])
+            else:
+                assert len(children) == 2
+                plan = Plan("", *children)
+            if frames:
+                frames[-1][1].append(plan)
+            else:
+                assert result is None
+                result = plan
+        elif token == "⋈":
+            assert len(frames[-1][1]) == 1 and not frames[-1][0]
+        else:
+            assert not frames[-1][0] and not frames[-1][1]
+            frames[-1][0].append(token)
+    assert result is not None and not frames
+    return result
 
 
 class Relation:
@@ -77,8 +117,7 @@ class Relation:
         return f"Relation(name={self.name}, alias={self.alias})"
 
     def get_numbered_name(self) -> str:
-        pattern = r"\d+$"
-        match = re.search(pattern, self.alias)
+        match = NUMBER_SUFFIX_PATTERN.search(self.alias)
         if match:
             if match.group(0) != "1":
                 return f"{self.name}_{match.group(0)}"
@@ -122,29 +161,23 @@ class SQLQuery:
         self.extract_conditions_and_joins()
 
     def extract_select_clause(self):
-        select_pattern = re.compile(r"SELECT\s+(.*?)\s+FROM\s+", re.DOTALL | re.IGNORECASE)
-        select_match = select_pattern.search(self.query)
+        select_match = SELECT_PATTERN.search(self.query)
         if select_match:
             self.select_clause = select_match.group(1).strip()
 
     def extract_relations(self):
-        from_pattern = re.compile(r"FROM\s+(.*?)\s+WHERE", re.DOTALL | re.IGNORECASE)
-        from_match = from_pattern.search(self.query)
+        from_match = FROM_PATTERN.search(self.query)
         if from_match:
             from_clause = from_match.group(1).strip()
-            relations_pattern = re.compile(r"(\w+)\s+AS\s+(\w+)", re.IGNORECASE)
-            relations_matches = relations_pattern.findall(from_clause)
+            relations_matches = RELATIONS_PATTERN.findall(from_clause)
             self.relations = {alias: Relation(name, alias) for name, alias in relations_matches}
         self.relations_name_dict = {r.get_numbered_name(): r for r in self.relations.values()}
 
     def extract_conditions_and_joins(self):
-        where_pattern = re.compile(r"WHERE\s+(.*)", re.DOTALL | re.IGNORECASE)
-        where_match = where_pattern.search(self.query)
+        where_match = WHERE_PATTERN.search(self.query)
         if where_match:
             where_clause = where_match.group(1).strip()
-            conditions_pattern = re.compile(r"( AND | and )?\s*([\w\.]+.*?)(?=( AND | and |$))", re.IGNORECASE)
-            # conditions_pattern = re.compile(r"\bAND\s*([\w\.]+.*?)(?=(AND|$))', re.IGNORECASE)
-            conditions_matches = conditions_pattern.findall(where_clause)
+            conditions_matches = CONDITIONS_PATTERN.findall(where_clause)
             conditions_to_skip = []
             for i, (_, condition_str, _) in enumerate(conditions_matches):
                 if i in conditions_to_skip:
@@ -176,7 +209,7 @@ class SQLQuery:
         attributes = []
         for attr in self.select_clause.split(","):
             # Removing parentheses and functions
-            matches = re.findall(r"\([^)]*\)", attr)
+            matches = FUNCTION_PATTERN.findall(attr)
             if len(matches) > 0:
                 assert len(matches) == 1
                 attr = matches[0][1:-1]
@@ -207,6 +240,18 @@ def read_file(p: Path) -> str:
     return file_content
 
 
+_sql_queries: dict[Path, SQLQuery] = {}
+
+
+def get_sql_query(q_file: Path) -> SQLQuery:
+    """
+    parsed query of a query file, each file is only parsed once
+    """
+    if q_file not in _sql_queries:
+        _sql_queries[q_file] = SQLQuery(read_file(q_file))
+    return _sql_queries[q_file]
+
+
 def get_identity_function_prefix():
     return codecs.encode("hzoen", "rot_13")
 
@@ -382,9 +427,8 @@ def plan_to_sql(
 
 
 def gen_query(q_file, p_text) -> str:
-    q_text = read_file(q_file)
     plan = parse_plan(p_text[1:-1])
-    q = SQLQuery(q_text)
+    q = get_sql_query(q_file)
     used_relations = [q.relations_name_dict[n] for n in plan.get_relation_names()]
     relation_lookup = {n: q.relations_name_dict[n] for n in plan.get_relation_names()}
     ghost_relations = [r for r in q.relations.values() if r not in used_relations]
@@ -413,37 +457,20 @@ def gen_query(q_file, p_text) -> str:
     return " ".join(plan.get_final_query(q).splitlines())
 
 
-def store_strings_to_file(strings: list[str], file: Path):
-    with open(file, "w") as out:
-        out.write("\n".join(strings))
-
-
 def convert_all_dp_results_to_sql():
-    cout_plans = read_plans(Path("dp/cout_plans.txt"))
-    model_plans = read_plans(Path("dp/model_plans.txt"))
-    cout_sql = []
-    model_sql = []
-    query_names = []
-
-    # q = Path("queries/job/7a.sql")
-    # p_cout = cout_plans[q]
-    # p_model = cout_plans[q]
-    # model_q = gen_query(q, p_model)
-    # print(model_q)
-    # model_c = gen_query(q, p_cout)
-    # print(model_c)
-
-    for (q, p_cout), (q2, p_model) in zip(cout_plans.items(), model_plans.items()):
-        assert q == q2
-        cout_query = gen_query(q, p_cout)
-        model_query = gen_query(q, p_model)
-        cout_sql.append(cout_query)
-        model_sql.append(model_query)
-        query_names.append(q.name)
-        # print(q)
-    store_strings_to_file(cout_sql, Path("dp/cout_plans.sql"))
-    store_strings_to_file(model_sql, Path("dp/model_plans.sql"))
-    store_strings_to_file(query_names, Path("dp/query_names.txt"))
+    """
+    the queries are written as soon as they are generated, one line per query
+    """
+    with open("dp/cout_plans.sql", "w") as cout_sql, open("dp/model_plans.sql", "w") as model_sql, open(
+        "dp/query_names.txt", "w"
+    ) as query_names:
+        plans = zip(iterate_plans(Path("dp/cout_plans.txt")), iterate_plans(Path("dp/model_plans.txt")))
+        for i, ((q, p_cout), (q2, p_model)) in enumerate(plans):
+            assert q == q2
+            separator = "\n" if i > 0 else ""
+            cout_sql.write(separator + gen_query(q, p_cout))
+            model_sql.write(separator + gen_query(q, p_model))
+            query_names.write(separator + q.name)
 
 
 def main():
@@ -0,0 +1,84 @@
+import hashlib
+import subprocess
+from pathlib import Path
+
+from lleaves import lleaves
+
+from src.features import FeatureMapper
+from src.model import PerTupleTreeModel
+
+FEATURE_LAYOUT_PATH = "dp/feature_layout.hpp"
+MODEL_FILE_PATH = "model.txt"
+MODEL_OBJECT_PATH = "lleaves.o"
+DP_BINARY_PATH = "dp/bin/dp_experiment"
+
+
+def hash_file(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def get_feature_layout_header(model_hash: str, model_file_hash: str, model_object_hash: str) -> str:
+    """
+    C++ header with the index of each feature in the feature vector, the number of features, the model hash and the
+    hashes of the model file and of the compiled model that are linked into the binary
+    """
+    offsets = "\n".join(f"constexpr uint64_t {name} = {i};" for i, name in enumerate(FeatureMapper.get_names()))
+    return f"""// Generated by dp/feature_layout.py from FeatureMapper, do not edit
+#ifndef T3_FEATURE_LAYOUT_HPP
+#define T3_FEATURE_LAYOUT_HPP
+
+#include <cstdint>
+
+namespace feature_layout {{
+constexpr uint64_t nFeatures = {FeatureMapper.n_features};
+constexpr const char* modelHash = "{model_hash}";
+constexpr const char* modelFileHash = "{model_file_hash}";
+constexpr const char* modelObjectHash = "{model_object_hash}";
+
+{offsets}
+}} // namespace feature_layout
+
+#endif // T3_FEATURE_LAYOUT_HPP
+"""
+
+
+def write_feature_layout_header(
+    model: PerTupleTreeModel,
+    path: Path = Path(FEATURE_LAYOUT_PATH),
+    model_file: Path = Path(MODEL_FILE_PATH),
+    model_object: Path = Path(MODEL_OBJECT_PATH),
+):
+    """
+    model_file and model_object have to be written (and compiled) before
+    """
+    with open(path, "w") as f:
+        f.write(get_feature_layout_header(model.get_hash(), hash_file(model_file), hash_file(model_object)))
+
+
+def check_feature_layout(llvm_tree: lleaves.Model):
+    """
+    the compiled tree and the current feature mapper have to agree, otherwise the C++ inference silently reads the
+    wrong features
+    """
+    assert (
+        llvm_tree.num_feature() == FeatureMapper.n_features
+    ), f"the compiled tree uses {llvm_tree.num_feature()} features, the feature mapper {FeatureMapper.n_features}"
+
+
+def check_dp_binary(
+    binary: Path = Path(DP_BINARY_PATH),
+    model_file: Path = Path(MODEL_FILE_PATH),
+    model_object: Path = Path(MODEL_OBJECT_PATH),
+):
+    """
+    the binary has to be built from the current model file and compiled model, a stale header or binary (e.g. after a
+    failed build) would evaluate another model
+    """
+    output = subprocess.run([str(binary), "--model-hash"], capture_output=True, text=True, check=True).stdout.split()
+    expected = [hash_file(model_file), hash_file(model_object)]
+    if output != expected:
+        raise RuntimeError(
+            f"{binary} was built for model file and object {output}, but {model_file} and {model_object} have "
+            f"{expected}, rebuild it with dp/compile.sh"
+        )
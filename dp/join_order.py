@@ -0,0 +1,444 @@
+import re
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from src.features import FeatureMapper, QualifiedFeature, Feature
+from src.model import PerTupleTreeModel
+from src.operator_stages import OperatorStage
+from src.operators import OperatorType
+from src.train import optimize_all
+from src.util import get_lines
+
+DUMP_PATH = "dp/data"
+# estimated size of a hash table entry, as in dp/DP.cpp
+HASH_TABLE_TUPLE_SIZE = 16
+# upper bound for the number of candidate pairs checked at once by DPsize
+MAX_PAIR_CHUNK = 1 << 20
+
+
+def get_feature_index(operator_type: OperatorType, stage: OperatorStage, feature: Feature) -> int:
+    return FeatureMapper._index_lookup[QualifiedFeature(operator_type, stage, feature)]
+
+
+SCAN_CONST = get_feature_index(OperatorType.TableScan, OperatorStage.Scan, Feature.const)
+SCAN_IN_CARD = get_feature_index(OperatorType.TableScan, OperatorStage.Scan, Feature.in_card)
+SCAN_OUT_PERCENTAGE = get_feature_index(OperatorType.TableScan, OperatorStage.Scan, Feature.out_percentage)
+SCAN_COMPARE_PERCENTAGE = get_feature_index(OperatorType.TableScan, OperatorStage.Scan, Feature.compare_percentage)
+SCAN_EMPTY_OUTPUT = get_feature_index(OperatorType.TableScan, OperatorStage.Scan, Feature.empty_output)
+BUILD_CONST = get_feature_index(OperatorType.HashJoin, OperatorStage.Build, Feature.const)
+BUILD_OUT_CARD = get_feature_index(OperatorType.HashJoin, OperatorStage.Build, Feature.out_card)
+BUILD_OUT_SIZE = get_feature_index(OperatorType.HashJoin, OperatorStage.Build, Feature.out_size)
+BUILD_IN_PERCENTAGE = get_feature_index(OperatorType.HashJoin, OperatorStage.Build, Feature.in_percentage)
+PROBE_CONST = get_feature_index(OperatorType.HashJoin, OperatorStage.Probe, Feature.const)
+PROBE_IN_CARD = get_feature_index(OperatorType.HashJoin, OperatorStage.Probe, Feature.in_card)
+PROBE_RIGHT_PERCENTAGE = get_feature_index(OperatorType.HashJoin, OperatorStage.Probe, Feature.right_percentage)
+PROBE_OUT_PERCENTAGE = get_feature_index(OperatorType.HashJoin, OperatorStage.Probe, Feature.out_percentage)
+
+
+@dataclass
+class Relation:
+    name: str
+    id: int
+    table_size: float
+    cardinality: float  # the number of tuples actually selected from the table
+
+
+@dataclass
+class QueryGraph:
+    relations: list[Relation]
+    joins: list[tuple[int, int, float]]  # bitsets of the left and right relations and the selectivity
+    cardinalities: dict[int, float]  # by bitset of relations
+
+    def get_neighbors(self) -> list[int]:
+        """
+        bitset of the relations joined with each relation
+        """
+        result = [0] * len(self.relations)
+        for left, right, _ in self.joins:
+            for r in iterate_bits(left):
+                result[r] |= right
+            for r in iterate_bits(right):
+                result[r] |= left
+        return result
+
+    def get_neighborhood(self, relations: int, neighbors: list[int]) -> int:
+        result = 0
+        for r in iterate_bits(relations):
+            result |= neighbors[r]
+        return result & ~relations
+
+
+def iterate_bits(bitset: int):
+    while bitset:
+        lowest = bitset & -bitset
+        yield lowest.bit_length() - 1
+        bitset ^= lowest
+
+
+def iterate_subsets(bitset: int):
+    """
+    all non-empty subsets of bitset
+    """
+    subset = bitset & -bitset
+    while subset:
+        yield subset
+        subset = (subset - bitset) & bitset
+
+
+def parse_leading_int(value: str) -> int:
+    """
+    like std::from_chars for integers, only the leading digits are parsed
+    """
+    match = re.match(r"\d+", value)
+    return int(match.group(0)) if match else 0
+
+
+def parse_dump(file: Path) -> QueryGraph:
+    """
+    Same as parseDump in dp/DP.cpp, only the query graph following the first join block is read
+    """
+    relations = []
+    named_joins = []
+    cardinalities = {}
+    read = False
+    seen_join = False
+    for line in get_lines(file):
+        elements = line.rstrip("\n").split(" ")
+        if elements[0] == "input":
+            if seen_join:
+                read = True
+            if read:
+                relations.append(
+                    Relation(elements[4], parse_leading_int(elements[1]), float(elements[3]), float(elements[2]))
+                )
+        elif elements[0] == "join":
+            seen_join = True
+            if read:
+                named_joins.append((elements[1][6:-1], elements[2][7:-1], float(elements[3][4:])))
+        elif elements[0] == "o":
+            if read:
+                cardinalities[parse_leading_int(elements[1])] = float(parse_leading_int(elements[2]))
+    relation_lookup = {r.name: 1 << r.id for r in relations}
+    joins = []
+    for left, right, selectivity in named_joins:
+        assert left in relation_lookup and right in relation_lookup, f"unknown relation in {file}"
+        joins.append((relation_lookup[left], relation_lookup[right], selectivity))
+    return QueryGraph(relations, joins, cardinalities)
+
+
+def get_dumps(path: Path = Path(DUMP_PATH)) -> dict[str, QueryGraph]:
+    return {file.name: parse_dump(file) for file in sorted(path.iterdir()) if file.is_file()}
+
+
+class DPTable:
+    """
+    Best plan of each connected set of relations, stored column-wise with plans referencing their inputs by index.
+    openPipelineFeatures of dp/DP.cpp are the features of the pipeline that is not finished yet (the probe side).
+    """
+
+    def __init__(self, q: QueryGraph, feature_mapper: FeatureMapper):
+        n = len(q.relations)
+        neighbors = q.get_neighbors()
+        self.classes: list[int] = [1 << r.id for r in q.relations]
+        self.neighborhoods: list[int] = [q.get_neighborhood(c, neighbors) for c in self.classes]
+        self.left = np.full(n, -1, dtype=int)
+        self.right = np.full(n, -1, dtype=int)
+        self.relation = np.array([r.id for r in q.relations], dtype=int)
+        self.cardinality = np.array([r.cardinality for r in q.relations], dtype=float)
+        self.cost = np.zeros(n, dtype=float)
+        self.mat_cost = np.zeros(n, dtype=float)
+        self.open_pipeline_features = np.zeros((n, feature_mapper.n_features), dtype=float)
+        for i, r in enumerate(q.relations):
+            features = self.open_pipeline_features[i]
+            features[SCAN_CONST] = 1
+            features[SCAN_IN_CARD] = r.table_size
+            features[SCAN_OUT_PERCENTAGE] = r.cardinality / r.table_size
+            # always set, so we have a plausible filter
+            features[SCAN_COMPARE_PERCENTAGE] = 1
+            features[SCAN_EMPTY_OUTPUT] = r.cardinality == 0
+        self.lookup: dict[int, int] = {c: i for i, c in enumerate(self.classes)}
+        self.by_size: dict[int, list[int]] = {1: list(range(n))}
+
+    def add_plans(
+        self,
+        classes: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        cardinality: np.ndarray,
+        cost: np.ndarray,
+        mat_cost: np.ndarray,
+        open_pipeline_features: np.ndarray,
+    ):
+        start = len(self.classes)
+        self.classes += [int(c) for c in classes]
+        self.neighborhoods += [
+            (self.neighborhoods[l] | self.neighborhoods[r]) & ~c
+            for c, l, r in zip(self.classes[start:], left.tolist(), right.tolist())
+        ]
+        self.left = np.concatenate([self.left, left])
+        self.right = np.concatenate([self.right, right])
+        self.relation = np.concatenate([self.relation, np.full(len(classes), -1, dtype=int)])
+        self.cardinality = np.concatenate([self.cardinality, cardinality])
+        self.cost = np.concatenate([self.cost, cost])
+        self.mat_cost = np.concatenate([self.mat_cost, mat_cost])
+        self.open_pipeline_features = np.vstack([self.open_pipeline_features, open_pipeline_features])
+        for i, c in enumerate(self.classes[start:], start=start):
+            self.lookup[c] = i
+            self.by_size.setdefault(c.bit_count(), []).append(i)
+
+    def print_plan(self, plan: int, q: QueryGraph) -> str:
+        if self.left[plan] < 0:
+            return f"({q.relations[self.relation[plan]].name})"
+        return f"({self.print_plan(self.left[plan], q)}⋈{self.print_plan(self.right[plan], q)})"
+
+
+@dataclass
+class CostResult:
+    cost: np.ndarray
+    mat_cost: np.ndarray  # cost of all pipelines except the open one
+    open_pipeline_features: np.ndarray
+
+
+class CostModel(ABC):
+    def __init__(self):
+        self.calls_to_predict: int = 0
+        self.costed_joins: int = 0
+
+    @abstractmethod
+    def cost(self, table: DPTable, left: np.ndarray, right: np.ndarray, cardinality: np.ndarray) -> CostResult:
+        """
+        costs of joining the plans with index left (build side) and right (probe side)
+        """
+        pass
+
+
+class CoutCostModel(CostModel):
+    def cost(self, table: DPTable, left: np.ndarray, right: np.ndarray, cardinality: np.ndarray) -> CostResult:
+        self.costed_joins += len(left)
+        cost = cardinality + table.cost[left] + table.cost[right]
+        return CostResult(cost, np.zeros(len(left)), np.zeros((len(left), table.open_pipeline_features.shape[1])))
+
+
+class T3CostModel(CostModel):
+    """
+    The left plan ends in a hash table build, the right plan probes it and stays open.
+    All joins of a DP level are estimated with a single predict call.
+    """
+
+    def __init__(self, model: PerTupleTreeModel):
+        super().__init__()
+        self.model: PerTupleTreeModel = model
+
+    def cost(self, table: DPTable, left: np.ndarray, right: np.ndarray, cardinality: np.ndarray) -> CostResult:
+        self.costed_joins += len(left)
+        left_cardinality = table.cardinality[left]
+        right_cardinality = table.cardinality[right]
+
+        build = table.open_pipeline_features[left]
+        assert np.all(build[:, BUILD_CONST] == 0)
+        build[:, BUILD_CONST] += 1
+        build[:, BUILD_OUT_CARD] += left_cardinality
+        build[:, BUILD_OUT_SIZE] += HASH_TABLE_TUPLE_SIZE
+        probe = table.open_pipeline_features[right]
+        probe[:, PROBE_CONST] += 1
+        probe[:, PROBE_IN_CARD] += left_cardinality
+        with np.errstate(divide="ignore", invalid="ignore"):
+            build[:, BUILD_IN_PERCENTAGE] += left_cardinality / build[:, SCAN_IN_CARD]
+            probe[:, PROBE_RIGHT_PERCENTAGE] += right_cardinality / probe[:, SCAN_IN_CARD]
+            probe[:, PROBE_OUT_PERCENTAGE] += cardinality / probe[:, SCAN_IN_CARD]
+
+        x = np.vstack([build, probe])
+        pred = self.model.predict(x, x[:, SCAN_IN_CARD].copy())
+        self.calls_to_predict += 1
+        build_cost, probe_cost = pred[: len(left)], pred[len(left) :]
+        mat_cost = table.mat_cost[left] + table.mat_cost[right] + build_cost
+        return CostResult(mat_cost + probe_cost, mat_cost, probe)
+
+
+def get_dpsize_pairs(table: DPTable, size: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    all pairs of connected, disjoint plans with size relations in total, both join directions are included
+    """
+    classes = np.array(table.classes, dtype=np.uint64)
+    neighborhoods = np.array(table.neighborhoods, dtype=np.uint64)
+    lefts, rights = [], []
+    for left_size in range(1, size):
+        left_plans = np.array(table.by_size.get(left_size, []), dtype=int)
+        right_plans = np.array(table.by_size.get(size - left_size, []), dtype=int)
+        if len(left_plans) == 0 or len(right_plans) == 0:
+            continue
+        chunk = max(1, MAX_PAIR_CHUNK // len(right_plans))
+        for start in range(0, len(left_plans), chunk):
+            current_left = left_plans[start : start + chunk]
+            left_classes = classes[current_left][:, None]
+            right_classes = classes[right_plans][None, :]
+            disjoint = (left_classes & right_classes) == 0
+            connected = (neighborhoods[current_left][:, None] & right_classes) != 0
+            i, j = np.nonzero(disjoint & connected)
+            lefts.append(current_left[i])
+            rights.append(right_plans[j])
+    if len(lefts) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(lefts), np.concatenate(rights)
+
+
+def enumerate_csg_cmp_pairs(q: QueryGraph) -> list[tuple[int, int]]:
+    """
+    DPccp enumeration (Moerkotte and Neumann): each pair of a connected subgraph and a connected complement
+    that are joined by an edge is emitted exactly once, in one of both join directions
+    """
+    n = len(q.relations)
+    neighbors = q.get_neighbors()
+    result = []
+
+    def get_neighborhood(relations: int, excluded: int) -> int:
+        return q.get_neighborhood(relations, neighbors) & ~excluded
+
+    def enumerate_cmp_rec(s1: int, s2: int, excluded: int):
+        neighborhood = get_neighborhood(s2, excluded)
+        for subset in iterate_subsets(neighborhood):
+            result.append((s1, s2 | subset))
+        for subset in iterate_subsets(neighborhood):
+            enumerate_cmp_rec(s1, s2 | subset, excluded | neighborhood)
+
+    def emit_csg(s1: int):
+        lowest = s1 & -s1
+        excluded = s1 | (lowest | (lowest - 1))
+        neighborhood = get_neighborhood(s1, excluded)
+        for v in sorted(iterate_bits(neighborhood), reverse=True):
+            s2 = 1 << v
+            result.append((s1, s2))
+            enumerate_cmp_rec(s1, s2, excluded | (neighborhood & ((s2 << 1) - 1)))
+
+    def enumerate_csg_rec(s1: int, excluded: int):
+        neighborhood = get_neighborhood(s1, excluded)
+        for subset in iterate_subsets(neighborhood):
+            emit_csg(s1 | subset)
+        for subset in iterate_subsets(neighborhood):
+            enumerate_csg_rec(s1 | subset, excluded | neighborhood)
+
+    for i in reversed(range(n)):
+        v = 1 << i
+        emit_csg(v)
+        enumerate_csg_rec(v, (v << 1) - 1)
+    return result
+
+
+def get_dpccp_pair_function(q: QueryGraph) -> Callable[[DPTable, int], tuple[np.ndarray, np.ndarray]]:
+    """
+    the csg-cmp pairs are enumerated once and grouped by size, both join directions are costed
+    """
+    by_size: dict[int, list[tuple[int, int]]] = {}
+    for s1, s2 in enumerate_csg_cmp_pairs(q):
+        by_size.setdefault((s1 | s2).bit_count(), []).append((s1, s2))
+
+    def get_pairs(table: DPTable, size: int) -> tuple[np.ndarray, np.ndarray]:
+        pairs = by_size.get(size, [])
+        first = np.array([table.lookup[s1] for s1, _ in pairs], dtype=int)
+        second = np.array([table.lookup[s2] for _, s2 in pairs], dtype=int)
+        return np.concatenate([first, second]), np.concatenate([second, first])
+
+    return get_pairs
+
+
+def run_dp(
+    q: QueryGraph,
+    cost_model: CostModel,
+    algorithm: str = "dpsize",
+    feature_mapper: Optional[FeatureMapper] = None,
+) -> tuple[DPTable, int]:
+    """
+    Optimize the join order level by level (by number of relations), all joins of a level are costed at once.
+    Returns the DP table and the index of the best plan for all relations.
+    """
+    table = DPTable(q, feature_mapper if feature_mapper is not None else FeatureMapper())
+    if algorithm == "dpsize":
+        get_pairs = get_dpsize_pairs
+    elif algorithm == "dpccp":
+        get_pairs = get_dpccp_pair_function(q)
+    else:
+        assert False, f"unknown join enumeration algorithm {algorithm}"
+    for size in range(2, len(q.relations) + 1):
+        left, right = get_pairs(table, size)
+        if len(left) == 0:
+            continue
+        classes = np.array([table.classes[l] | table.classes[r] for l, r in zip(left.tolist(), right.tolist())])
+        missing = [c for c in set(classes.tolist()) if c not in q.cardinalities]
+        assert len(missing) == 0, f"no cardinalities for {missing}"
+        cardinality = np.array([q.cardinalities[c] for c in classes.tolist()], dtype=float)
+        result = cost_model.cost(table, left, right, cardinality)
+        # the cheapest plan per class, ties go to the first enumerated join
+        order = np.lexsort((result.cost, classes))
+        _, first = np.unique(classes[order], return_index=True)
+        best = order[first]
+        table.add_plans(
+            classes[best],
+            left[best],
+            right[best],
+            cardinality[best],
+            result.cost[best],
+            result.mat_cost[best],
+            result.open_pipeline_features[best],
+        )
+    all_relations = (1 << len(q.relations)) - 1
+    assert all_relations in table.lookup, "the query graph is not connected"
+    return table, table.lookup[all_relations]
+
+
+@dataclass
+class OptimizationResult:
+    plans: dict[str, str]  # by dump file name
+    duration: float  # in seconds
+    costed_joins: int
+    calls_to_predict: int
+
+
+def optimize_join_orders(
+    qs: dict[str, QueryGraph], cost_model: CostModel, algorithm: str = "dpsize"
+) -> OptimizationResult:
+    feature_mapper = FeatureMapper()
+    plans = {}
+    begin = time.time()
+    for name, q in qs.items():
+        table, best = run_dp(q, cost_model, algorithm, feature_mapper)
+        plans[name] = table.print_plan(best, q)
+    return OptimizationResult(plans, time.time() - begin, cost_model.costed_joins, cost_model.calls_to_predict)
+
+
+def write_plans(plans: dict[str, str], file: Path):
+    """
+    same format as the plan files of dp/DP.cpp, so dp_to_sql can convert them
+    """
+    with open(file, "w") as f:
+        for name, plan in plans.items():
+            f.write(f"{name}\n{plan}\n")
+
+
+def run_join_order_optimization(model: PerTupleTreeModel, algorithm: str = "dpsize", dump_path: Path = Path(DUMP_PATH)):
+    """
+    Python replacement for the C++ join order experiment, writes dp/cout_plans.txt and dp/model_plans.txt
+    """
+    qs = get_dumps(dump_path)
+    for name, cost_model, file in (
+        ("C_out", CoutCostModel(), Path("dp/cout_plans.txt")),
+        ("T3", T3CostModel(model), Path("dp/model_plans.txt")),
+    ):
+        result = optimize_join_orders(qs, cost_model, algorithm)
+        write_plans(result.plans, file)
+        print(
+            f"{name} ({algorithm}): {result.duration * 1000:.1f}ms, {result.costed_joins} costed joins, "
+            f"{result.calls_to_predict} calls to predict"
+        )
+
+
+def main():
+    run_join_order_optimization(optimize_all(False))
+
+
+if __name__ == "__main__":
+    main()
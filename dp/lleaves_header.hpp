@@ -3,7 +3,7 @@
 
 extern "C"
 {
-void forest_root(double* data, double* result, int start_idx, int n_preds);
+void forest_root(double* data, double* result, int start_idx, int end_idx);
 }
 
 #endif // C_BENCH_LLVM_H
@@ -1,17 +1,28 @@
 import argparse
+import inspect
 import os
+import shlex
 import subprocess
 import tarfile
 from pathlib import Path
+from typing import Callable, Optional
 
-import lz4.frame
-import requests
 from lleaves import lleaves
 
 from dp.BenchmarkDPResult import benchmark_dp_queries
 from dp.dp_to_sql import convert_all_dp_results_to_sql
+from dp.feature_layout import check_dp_binary, check_feature_layout, write_feature_layout_header
 from src.benchmark_runner import benchmark
-from src.benchmark_setup import download_csvs, create_tpc_data, download_t3_file, load_csvs_to_db
+from src.benchmark_setup import (
+    download_csvs,
+    create_tpc_data,
+    download_t3_file,
+    extract_lz4,
+    extract_lz4_tar,
+    load_csvs_to_db,
+)
+from src.data_collection import DataCollector
+from src.database_manager import DatabaseManager
 from src.evaluation import QueryEstimationCache
 from src.figures.acc_comparison import comparison_plot
 from src.figures.acc_comparison_zero_shot import comparison_zero_shot_plot
@@ -21,36 +32,37 @@ from src.figures.clean_benchmarks import clean_benchmark_figure
 from src.figures.error_by_query_type import get_error_by_query_hist
 from src.figures.error_histogram import get_error_histogram
 from src.figures.est_card_acc import eval_card_est
-from src.figures.infra import get_figure_path, set_figure_path, set_figure_format, set_use_latex
+from src.figures.infra import get_figure_format, get_figure_path, set_figure_path, set_figure_format, set_use_latex
 from src.figures.latency_accuracy import latency_acc_figure
 from src.figures.latency_scaling import latency_scaling_figure
 from src.figures.per_database_acc import create_per_db_figure
 from src.figures.per_tuple import per_tuple_prediction_figure
 from src.figures.query_runtimes import get_benchmark_variance
-from src.server import start_webserver_new, kill_webserver_new
+from src.measurement import MeasurementSettings, get_isolated_cpus
+from src.model import Model
+from src.server import DB_PATH, WebServer, WebServerPool, get_local_webservers, remove_db_copies
+from src.stages import STAGE_STATE_PATH, Stage, StageRunner
 from src.train import optimize_all
-from src.util import rm_rec
+from src.util import fifo_cache, rm_rec
 
 
 def download_bench_data():
     if not Path("data").exists():
         download_t3_file("benchdata.tar.lz4")
-        data_path = "downloaded_data/benchdata.tar"
-        with open("downloaded_data/benchdata.tar.lz4", "rb") as data:
-            decompressed_data = lz4.frame.decompress(data.read())
-        with open(data_path, "wb") as tar:
-            tar.write(decompressed_data)
-        with tarfile.open(data_path, "r") as tar:
-            tar.extractall("./")
+        extract_lz4_tar(Path("downloaded_data/benchdata.tar.lz4"), Path("./"))
 
 
-def reproduce_bench_data():
-    print("Starting db server")
-    start_webserver_new()
-    print("Benchmarking (This may take a while)")
-    benchmark()
-    print("Shutting down webserver")
-    kill_webserver_new()
+def reproduce_bench_data(n_servers: int = 1, isolate: bool = False, port_args: Optional[list[str]] = None):
+    settings = MeasurementSettings()
+    server_cpus = None
+    if isolate:
+        client_cpus, server_cpus = get_isolated_cpus()
+        settings = MeasurementSettings(client_cpus, n_warmup_runs=1, n_reruns=2)
+    print(f"Starting {n_servers} db server(s)")
+    with WebServerPool(get_local_webservers(n_servers, server_cpus, port_args)) as servers:
+        print("Benchmarking (This may take a while)")
+        benchmark(webservers=servers, settings=settings)
+        print("Shutting down webserver")
 
 
 def download_join_order_data():
@@ -60,6 +72,8 @@ def download_join_order_data():
 
 
 def create_db_files():
+    # copies of the old database file for further servers must not be used anymore
+    remove_db_copies()
     download_csvs()
     create_tpc_data()
     load_csvs_to_db()
@@ -68,10 +82,7 @@ def create_db_files():
 def extract_webserver():
     if not Path("webserver").exists():
         download_t3_file("webserver.lz4")
-        with open("downloaded_data/webserver.lz4", "rb") as server:
-            decompressed_data = lz4.frame.decompress(server.read())
-        with open("webserver", "wb") as server:
-            server.write(decompressed_data)
+        extract_lz4(Path("downloaded_data/webserver.lz4"), Path("webserver"))
         subprocess.run(["chmod", "+x", "webserver"], cwd=os.getcwd())
 
 
@@ -84,6 +95,8 @@ def run_join_order_experiment(model, benchmark_results: bool):
     llvm_tree = lleaves.Model(model_file="model.txt")
     Path("./lleaves.o").unlink(missing_ok=True)
     llvm_tree.compile(cache="./lleaves.o")
+    check_feature_layout(llvm_tree)
+    write_feature_layout_header(model)
 
     print("Unpacking required data")
     cardinality_oracle_path = Path("dp/")
@@ -95,6 +108,7 @@ def run_join_order_experiment(model, benchmark_results: bool):
 
     print("Compiling C++ benchmark")
     subprocess.run(["bash", "dp/compile.sh"], cwd=os.getcwd(), stdout=subprocess.PIPE)
+    check_dp_binary()
 
     print("Running C++ benchmark")
     subprocess.run(["dp/bin/dp_experiment"], cwd=os.getcwd())
@@ -104,10 +118,9 @@ def run_join_order_experiment(model, benchmark_results: bool):
         convert_all_dp_results_to_sql()
 
         print("Starting db server")
-        start_webserver_new()
-        print("Benchmarking generated SQL queries")
-        benchmark_dp_queries()
-        kill_webserver_new()
+        with WebServer():
+            print("Benchmarking generated SQL queries")
+            benchmark_dp_queries()
 
 
 def reset():
@@ -117,15 +130,196 @@ def reset():
         Path("./benchmark_setup/db/"),
         Path("./dp/bin/"),
         Path("./dp/cout_plans.txt"),
+        Path("./dp/cout_plans_dpccp.txt"),
         Path("./dp/cout_plans.sql"),
         Path("./dp/model_plans.txt"),
+        Path("./dp/model_plans_dpccp.txt"),
+        Path("./dp/model_plans_batched.txt"),
+        Path("./dp/model_plans_dpccp_batched.txt"),
         Path("./dp/model_plans.sql"),
         Path("./dp/query_names.txt"),
+        Path("./dp/feature_layout.hpp"),
         Path("./webserver"),
         Path("./lleaves.o"),
         Path("./model.txt"),
+        Path(STAGE_STATE_PATH),
     ]:
         rm_rec(path)
+    remove_db_copies()
+
+
+@fifo_cache
+def get_model(predicted_cardinalities: bool) -> Model:
+    print(f"Training model for {'predicted' if predicted_cardinalities else 'exact'} cardinalities")
+    return optimize_all(predicted_cardinalities)
+
+
+@fifo_cache
+def get_estimation_cache(model_predicted_cardinalities: bool, predicted_cardinalities: bool) -> QueryEstimationCache:
+    return QueryEstimationCache(get_model(model_predicted_cardinalities), predicted_cardinalities)
+
+
+def get_figure_file(name: str) -> Path:
+    return get_figure_path() / f"{name}.{get_figure_format()}"
+
+
+def get_stages(
+    run_bench: bool,
+    run_cpp: bool,
+    benchmark_job: bool,
+    n_servers: int = 1,
+    isolate: bool = False,
+    port_args: Optional[list[str]] = None,
+) -> list[Stage]:
+    """
+    Models are only trained (and evaluated) when a stage that needs them is stale.
+    Stages that use the models depend on the benchmark data and on all source files except the figures.
+    """
+    sources = [f for f in sorted(Path("src").rglob("*.py")) if Path("src/figures") not in f.parents]
+
+    def get_model_inputs() -> list[Path]:
+        # the databases (and their schema cache) can only be loaded once the benchmark data exists
+        bench_data = [Path(f"data/{db.get_path()}") for db in DatabaseManager.get_all_databases()]
+        return bench_data + [Path("data/schema_cache")] + sources
+
+    stages = []
+    if run_bench or benchmark_job:
+        stages += [
+            Stage(
+                "db_files",
+                "Setup database",
+                create_db_files,
+                [Path("src/benchmark_setup.py"), Path("benchmark_setup/scripts")],
+                [Path("benchmark_setup/csvs"), Path("benchmark_setup/db")],
+            ),
+            Stage("webserver", "Extract webserver", extract_webserver, [], [Path("webserver")]),
+        ]
+    if run_bench:
+        stages.append(
+            Stage(
+                "bench_data",
+                "Reproducing benchmark data",
+                lambda: reproduce_bench_data(n_servers, isolate, port_args),
+                [
+                    Path("benchmark_setup/queries"),
+                    Path("webserver"),
+                    Path("src/benchmark.py"),
+                    Path("src/benchmark_runner.py"),
+                ],
+                [Path("data")],
+                ["db_files", "webserver"],
+                {"reproduced": True},
+                # the database is only fingerprinted, the copies of further servers (all_<i>.db) are no inputs
+                [Path(DB_PATH)],
+            )
+        )
+    else:
+        stages.append(
+            Stage(
+                "bench_data",
+                "Downloading benchmark data",
+                download_bench_data,
+                [],
+                [Path("data")],
+                [],
+                {"reproduced": False},
+            )
+        )
+
+    def figure_stage(
+        description: str,
+        figure: Callable,
+        outputs: list[str],
+        *estimation_caches: tuple[bool, bool],
+        as_list: bool = False,
+    ):
+        def run():
+            caches = [get_estimation_cache(*c) for c in estimation_caches]
+            figure(*([caches] if as_list else caches))
+
+        return Stage(
+            figure.__name__,
+            description,
+            run,
+            lambda: get_model_inputs() + [Path(inspect.getsourcefile(figure)), Path("src/figures/infra.py")],
+            [get_figure_path() / o if "." in o else get_figure_file(o) for o in outputs],
+            ["bench_data"],
+            {"estimation_caches": estimation_caches, "format": get_figure_format()},
+        )
+
+    exact_exact, exact_pred, pred_pred = (False, False), (False, True), (True, True)
+    stages += [
+        figure_stage("Creating latency accuracy overview", latency_acc_figure, ["latency_acc"], pred_pred),
+        figure_stage("Creating query runtime figure", get_benchmark_variance, ["query_runtime_distribution"]),
+        figure_stage("Creating accuracy table", write_accuracy_table, ["tbl_tpcds_acc.tex"], exact_exact),
+        figure_stage("Creating accuracy histogram", get_error_histogram, ["test_accuracy_histogram"], exact_exact),
+        figure_stage("Creating per query accuracy figure", get_error_by_query_hist, ["error_by_category"], exact_exact),
+        figure_stage(
+            "Creating per database instance accuracy figure (requires re-training)",
+            create_per_db_figure,
+            ["per_database_acc"],
+        ),
+        figure_stage(
+            "Creating cardinality comparison figure",
+            eval_card_est,
+            ["card_est_acc"],
+            exact_exact,
+            exact_pred,
+            pred_pred,
+            as_list=True,
+        ),
+        figure_stage("Creating accuracy comparison figure", comparison_plot, ["acc_comparison"], pred_pred),
+        figure_stage(
+            "Creating accuracy comparison to zero shot figure (requires re-training)",
+            comparison_zero_shot_plot,
+            ["acc_comparison_zero_shot"],
+        ),
+        figure_stage(
+            "Creating ablation study figure (requires re-training)", per_tuple_prediction_figure, ["ablation_study"]
+        ),
+        figure_stage(
+            "Creating clean benchmark figure (requires re-training)", clean_benchmark_figure, ["benchmark_sizes"]
+        ),
+        figure_stage(
+            "Creating cardinality degradation figure (might take a while)", make_card_degen_figure, ["card_degradation"]
+        ),
+    ]
+    if run_cpp:
+        join_order_outputs = [
+            Path("dp/cout_plans.txt"),
+            Path("dp/model_plans.txt"),
+            Path("dp/latencyScaling.json"),
+            get_figure_path() / "tbl_join_order_speed.tex",
+        ]
+        if benchmark_job:
+            join_order_outputs += [Path("dp/cout_plans.sql"), Path("dp/model_plans.sql")]
+        stages += [
+            Stage(
+                "join_order",
+                "Running join order microbenchmark",
+                lambda: run_join_order_experiment(get_model(False), benchmark_job),
+                lambda: get_model_inputs()
+                + [Path("dp/DP.cpp"), Path("dp/compile.sh"), Path("dp/dp_to_sql.py"), Path("dp/BenchmarkDPResult.py")],
+                join_order_outputs,
+                ["bench_data"],
+                {"benchmark_job": benchmark_job},
+            ),
+            Stage(
+                "latency_scaling",
+                "Creating latency scaling figure",
+                latency_scaling_figure,
+                [
+                    Path("dp/latencyScalingCompiled.json"),
+                    Path("dp/latencyScalingInterpretedST.json"),
+                    Path("dp/latencyScalingInterpretedMT.json"),
+                    Path("src/figures/latency_scaling.py"),
+                ],
+                [get_figure_file("latency_scaling")],
+                ["join_order"],
+                {"format": get_figure_format()},
+            ),
+        ]
+    return stages
 
 
 def main():
@@ -149,6 +343,37 @@ def main():
         action="store_true",
         help="Reset local data. (This might be helpful when switching between dockerized and regular execution)",
     )
+    parser.add_argument(
+        "--servers",
+        "-s",
+        type=int,
+        default=1,
+        help="Number of local db servers to reproduce the benchmarks with, each pinned to its own cpus",
+    )
+    parser.add_argument(
+        "--port-args",
+        type=shlex.split,
+        default=None,
+        help='Arguments that make the webserver listen on port {port}, e.g. "--port {port}" (required for --servers > 1)',
+    )
+    parser.add_argument(
+        "--isolate",
+        "-i",
+        action="store_true",
+        help="Pin the benchmark client and the db servers to separate cpus, warm up and repeat noisy runs",
+    )
+    parser.add_argument(
+        "--revalidate",
+        "-v",
+        action="store_true",
+        help="Check the integrity of all benchmark results in parallel, invalid results are benchmarked again with -b",
+    )
+    parser.add_argument(
+        "--force",
+        "-f",
+        action="store_true",
+        help="Re-run all stages, even if their inputs did not change",
+    )
 
     args = parser.parse_args()
 
@@ -160,61 +385,18 @@ def main():
     if do_reset:
         reset()
 
-    if run_bench or benchmark_job:
-        print("Setup database")
-        create_db_files()
-        extract_webserver()
-    if run_bench:
-        print("Reproducing benchmark data")
-        reproduce_bench_data()
-    else:
-        print("Downloading benchmark data")
-        download_bench_data()
-
-    print("Training models for exact and predicted cardinalities")
-    exact_model = optimize_all(False)
-    pred_model = optimize_all(True)
-    print("Evaluating models")
-    exact_exact_eval = QueryEstimationCache(exact_model, False)
-    exact_pred_eval = QueryEstimationCache(exact_model, True)
-    pred_pred_eval = QueryEstimationCache(pred_model, True)
-
     set_figure_path("./figure_output")
     set_figure_format("pdf")
     set_use_latex(False)
     Path(get_figure_path()).mkdir(parents=True, exist_ok=True)
     print(f"Storing figures in {get_figure_path().absolute()}")
 
-    print("Creating latency accuracy overview")
-    latency_acc_figure(pred_pred_eval)
-    print("Creating query runtime figure")
-    get_benchmark_variance()
-    print("Creating accuracy table")
-    write_accuracy_table(exact_exact_eval)
-    print("Creating accuracy histogram")
-    get_error_histogram(exact_exact_eval)
-    print("Creating per query accuracy figure")
-    get_error_by_query_hist(exact_exact_eval)
-    print("Creating per database instance accuracy figure (requires re-training)")
-    create_per_db_figure()
-    print("Creating cardinality comparison figure")
-    eval_card_est([exact_exact_eval, exact_pred_eval, pred_pred_eval])
-    print("Creating accuracy comparison figure")
-    comparison_plot(pred_pred_eval)
-    print("Creating accuracy comparison to zero shot figure (requires re-training)")
-    comparison_zero_shot_plot()
-    print("Creating ablation study figure (requires re-training)")
-    per_tuple_prediction_figure()
-    print("Creating clean benchmark figure (requires re-training)")
-    clean_benchmark_figure()
-    print("Creating cardinality degradation figure (might take a while)")
-    make_card_degen_figure()
-
-    if run_cpp:
-        print("Running join order microbenchmark")
-        run_join_order_experiment(exact_model, benchmark_job)
-        print("Creating latency scaling figure")
-        latency_scaling_figure()
+    runner = StageRunner()
+    if args.revalidate:
+        print("Revalidating benchmark results")
+        if DataCollector.revalidate_benchmarks(DatabaseManager.get_all_databases()) > 0:
+            runner.invalidate("bench_data")
+    runner.run(get_stages(run_bench, run_cpp, benchmark_job, args.servers, args.isolate, args.port_args), args.force)
 
 
 if __name__ == "__main__":
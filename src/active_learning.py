@@ -0,0 +1,122 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from src.benchmark import Benchmarker, QueryRuntimeExceededException
+from src.data_collection import DataCollector
+from src.database import Database
+from src.database_manager import DatabaseManager
+from src.model import PerTupleTreeEnsemble
+from src.optimizer import optimize_per_tuple_tree_ensemble
+from src.query_generation.corpus import (
+    CategoryCorpus,
+    QueryCorpus,
+    UNCERTAINTY_SELECTION,
+    sample_database_corpus,
+)
+from src.query_plan import QueryPlan
+
+# number of analyzed candidates per query that is benchmarked
+CANDIDATES_PER_QUERY = 4
+
+
+@dataclass
+class Candidate:
+    name: str
+    query: str
+    plan: QueryPlan
+
+
+def analyze_candidates(benchmarker: Benchmarker, db: Database, queries: dict[str, str]) -> list[Candidate]:
+    """
+    A single planVerboseAnalyze run per candidate, candidates that fail or run into the time limit are dropped
+    """
+    result = []
+    for name, query in queries.items():
+        try:
+            analyzed_query = benchmarker.analyze_query(db, query)
+        except QueryRuntimeExceededException:
+            print("t", end="", flush=True)
+            continue
+        except AssertionError:
+            print("x", end="", flush=True)
+            continue
+        plan = QueryPlan(analyzed_query["plan"], db, False)
+        plan.build_pipelines(analyzed_query["plan"]["analyzePlanPipelines"])
+        result.append(Candidate(name, query, plan))
+    return result
+
+
+def select_informative_queries(
+    ensemble: PerTupleTreeEnsemble, candidates: list[Candidate], n_queries: int, n_spare_queries: int
+) -> CategoryCorpus:
+    """
+    the candidates the models disagree on the most are benchmarked, the next ones are kept as spare queries
+    """
+    if len(candidates) == 0:
+        return CategoryCorpus({}, [])
+    uncertainty = ensemble.get_uncertainty([c.plan for c in candidates])
+    ranked = [candidates[i] for i in np.argsort(-uncertainty, kind="stable")]
+    selected = sorted(ranked[:n_queries], key=lambda c: c.name)
+    spare = ranked[n_queries : n_queries + n_spare_queries]
+    return CategoryCorpus({c.name: c.query for c in selected}, [c.query for c in spare])
+
+
+def select_database_corpus(
+    benchmarker: Benchmarker,
+    ensemble: PerTupleTreeEnsemble,
+    db_name: str,
+    n_queries: int,
+    n_spare_queries: int,
+    seed: int,
+    max_estimated_work: Optional[float],
+    candidates_per_query: int = CANDIDATES_PER_QUERY,
+) -> QueryCorpus:
+    db = DatabaseManager.get_database(db_name)
+    candidate_corpus = sample_database_corpus(db_name, n_queries * candidates_per_query, 0, seed, max_estimated_work)
+    categories = {}
+    for category, corpus in candidate_corpus.categories.items():
+        print(f" {category.name}", end="", flush=True)
+        candidates = analyze_candidates(benchmarker, db, corpus.queries)
+        categories[category] = select_informative_queries(ensemble, candidates, n_queries, n_spare_queries)
+    print()
+    corpus = QueryCorpus(
+        db_name, seed, n_queries, n_spare_queries, max_estimated_work, categories, UNCERTAINTY_SELECTION
+    )
+    corpus.write()
+    return corpus
+
+
+def select_query_corpus(
+    benchmarker: Benchmarker,
+    dbs: list[Database],
+    n_queries: int,
+    n_spare_queries: int = 10,
+    seed: int = 0,
+    max_estimated_work: Optional[float] = None,
+    ensemble: Optional[PerTupleTreeEnsemble] = None,
+) -> dict[str, QueryCorpus]:
+    """
+    Active learning: analyze more candidates than needed and only benchmark the ones with the most uncertain estimates.
+    The ensemble is trained on the existing benchmarks of the train databases unless given.
+    Existing corpora with the same configuration are reused.
+    """
+    result = {}
+    for db in dbs:
+        db_name = db.get_search_path()
+        corpus = QueryCorpus.read(db_name)
+        if corpus is not None and corpus.matches(
+            seed, n_queries, n_spare_queries, max_estimated_work, UNCERTAINTY_SELECTION
+        ):
+            result[db_name] = corpus
+            continue
+        if ensemble is None:
+            print("training model ensemble")
+            benchmarks = DataCollector.collect_benchmarks(DatabaseManager.get_train_databases(), False)
+            ensemble = optimize_per_tuple_tree_ensemble(benchmarks)
+        print(f"selecting queries for {db_name}", end="")
+        result[db_name] = select_database_corpus(
+            benchmarker, ensemble, db_name, n_queries, n_spare_queries, seed, max_estimated_work
+        )
+    return result
@@ -3,24 +3,26 @@ import re
 import subprocess
 from pathlib import Path
 from time import sleep
-from typing import Callable
+from typing import Callable, Optional
 
 import shlex
 import requests
 
 from src.data_collection import DataCollector
 from src.database import Database
+from src.measurement import (
+    MeasurementSettings,
+    get_governors,
+    get_interference,
+    get_suspicious_reasons,
+    get_system_state,
+)
+from src.metadata_index import MetadataIndex
 from src.optimizer import BenchmarkedQuery, QueryCategory
-from src.query_generation.aggregations import sample_group_by_query
-from src.query_generation.join_agg import generate_join_agg_query, generate_join_simple_agg_query
-from src.query_generation.join_graph import generate_join_query
-from src.query_generation.selections import SelectionFactory, sample_complex_selection_query
-from src.query_generation.window_function import WindowFunctionFactory
+from src.query_generation.corpus import QueryCorpus, SpareQueriesExhaustedException
 from src.query_plan import QueryPlan
-from src.server import start_webserver_new
-
-SERVER_PATH = "./webserver"
-DB_PATH = "benchmark_setup/db/all.db"
+from src.results_log import ResultsManifest
+from src.server import WebServer
 
 
 def read_file(file: Path) -> str:
@@ -49,9 +51,15 @@ class AnalyzePlanNotPlausibleException(Exception):
 class Benchmarker:
     plan_verbose_analyze: str
 
-    def __init__(self, server: str):
+    def __init__(
+        self, server: str, webserver: Optional[WebServer] = None, settings: MeasurementSettings = MeasurementSettings()
+    ):
+        self.server = server
+        self.settings = settings
         self.plan_verbose_analyze = f"{server}/planVerboseAnalyze"
         self.benchmark_url = f"{server}/benchmark"
+        # restarted if it crashes, servers that are not managed by this process are not restarted
+        self.webserver = webserver
 
     def _benchmark(self, db: Database, query: str) -> str:
         query_text = f"set search_path = {db.get_search_path()}, public;\n\n{query}"
@@ -93,14 +101,37 @@ class Benchmarker:
         result["query_text"] = q
         return result
 
+    def run_measured_query(self, db: Database, q: str) -> dict:
+        """
+        run_query with the system state before and after the run and the reasons why the run might be noisy,
+        suspicious runs are repeated up to n_reruns times
+        """
+        cpus = self.webserver.cpus if self.webserver is not None else None
+        # without the server's pid, its own cpu time cannot be told apart from other processes
+        pid = self.webserver.pid if self.webserver is not None else None
+        for i in range(self.settings.n_reruns + 1):
+            before = get_system_state(cpus, pid)
+            result = self.run_query(db, q)
+            after = get_system_state(cpus, pid)
+            result["system"] = {
+                "before": before,
+                "after": after,
+                "interference": get_interference(before, after),
+                "reruns": i,
+            }
+            result["suspicious"] = get_suspicious_reasons(before, after, self.settings)
+            if len(result["suspicious"]) == 0:
+                break
+        return result
+
+    def get_environment(self) -> dict:
+        if self.webserver is not None:
+            return {**self.webserver.get_environment(), "governors": get_governors(self.webserver.cpus)}
+        return {"address": self.server, "governors": get_governors()}
+
     def n_raw_runs(self, db: Database, q: str, n: int) -> list[float]:
         return [self.run_query(db, q)["executionTime"] for _ in range(n)]
 
-    @staticmethod
-    def store(outfile: Path, result: dict):
-        with open(outfile, "w") as outfile:
-            json.dump(result, outfile)
-
     @staticmethod
     def get_fixed_queries(db: Database) -> dict[str, Callable[[], str]]:
         if db.fixedQueryPath is not None:
@@ -113,43 +144,6 @@ class Benchmarker:
         else:
             return {}
 
-    @staticmethod
-    def get_category_dict(db: Database) -> dict[QueryCategory, Callable[[], str]]:
-        selection_factory = SelectionFactory(db.schema)
-        window_factory = WindowFunctionFactory(db.schema)
-        return {
-            QueryCategory.select: lambda: selection_factory.sample_selection_query(),
-            QueryCategory.join: lambda: generate_join_query(db.schema, False, False),
-            QueryCategory.select_join: lambda: generate_join_query(db.schema, True, False),
-            QueryCategory.pseudo_aggregate: lambda: sample_group_by_query(db.schema, False, pseudo_group_by=True),
-            QueryCategory.aggregate: lambda: sample_group_by_query(db.schema, False),
-            QueryCategory.select_aggregate: lambda: sample_group_by_query(db.schema, True),
-            QueryCategory.join_agg: lambda: generate_join_agg_query(db.schema, False, False),
-            QueryCategory.select_join_agg: lambda: generate_join_agg_query(db.schema, True, False),
-            QueryCategory.join_simple_agg: lambda: generate_join_simple_agg_query(db.schema, False, False),
-            QueryCategory.select_join_simple_agg: lambda: generate_join_simple_agg_query(db.schema, True, False),
-            QueryCategory.complex_select: lambda: sample_complex_selection_query(db.schema),
-            QueryCategory.complex_select_agg: lambda: sample_group_by_query(
-                db.schema, select_input=True, pseudo_group_by=True, complex_select=True
-            ),
-            QueryCategory.complex_select_join: lambda: generate_join_query(db.schema, True, True),
-            QueryCategory.complex_select_join_agg: lambda: generate_join_agg_query(db.schema, True, True),
-            QueryCategory.complex_select_join_simple_agg: lambda: generate_join_simple_agg_query(db.schema, True, True),
-            QueryCategory.window: lambda: window_factory.get_query()
-        }
-
-    @staticmethod
-    def get_queries(db: Database, n_queries: int) -> dict[QueryCategory, dict[str, Callable[[], str]]]:
-        result = {}
-        category_dict = Benchmarker.get_category_dict(db)
-        for category, generator in category_dict.items():
-            current_result = {}
-            for i in range(1, n_queries + 1):
-                name = f"{category.name}_{i:03d}"
-                current_result[name] = generator
-            result[category] = current_result
-        return result
-
     @staticmethod
     def mock_benchmarked_query(
         plan_json: dict,
@@ -210,8 +204,10 @@ class Benchmarker:
         while True:
             try:
                 query = q()
+                for _ in range(self.settings.n_warmup_runs):
+                    self.run_query(db, query)
                 analyzed_query = self.analyze_query(db, query)
-                benchmarks = [self.run_query(db, query) for _ in range(n)]
+                benchmarks = [self.run_measured_query(db, query) for _ in range(n)]
                 benchmark_times = [float(b["executionTime"]) for b in benchmarks]
                 analyzed_query = self.retry_analyze(
                     analyzed_query,
@@ -224,6 +220,9 @@ class Benchmarker:
                     ignore_error=True,
                 )
                 return analyzed_query, benchmarks
+            except SpareQueriesExhaustedException:
+                # retrying cannot succeed without a query to run
+                raise
             except QueryRuntimeExceededException:
                 print("t", end="")
             except AnalyzePlanNotPlausibleException:
@@ -231,45 +230,50 @@ class Benchmarker:
                 err_counter += 1
             except Exception:
                 print(f"Failed Query:\n {query}")
-                sleep(2)
-                start_webserver_new()
+                if self.webserver is not None:
+                    self.webserver.ensure_running()
+                else:
+                    sleep(2)
 
-    def get_all_queries(self, db: Database, n_queries: int) -> dict[QueryCategory, dict[str, [Callable[[], str]]]]:
+    def get_all_queries(self, db: Database, corpus: QueryCorpus) -> dict[QueryCategory, dict[str, [Callable[[], str]]]]:
         all_queries: dict[QueryCategory, dict[str, Callable[[], str]]] = {
             QueryCategory.fixed: self.get_fixed_queries(db),
         }
-        all_queries.update(self.get_queries(db, n_queries))
+        # spare queries that were stored under the name of the query they replaced must not be used again
+        index = MetadataIndex(db)
+        index.update()
+        all_queries.update(corpus.get_queries(index.get_query_texts()))
         return all_queries
 
     def run_database(
         self,
         db: Database,
         n_runs: int,
-        n_queries: int,
+        corpus: QueryCorpus,
         verbose: bool = False,
     ):
-        # Flexible callable to get queries, so random sampling can be repeated
-        all_queries = self.get_all_queries(db, n_queries)
+        # Callables to get queries, so queries that cannot be benchmarked can be replaced by spare queries
+        all_queries = self.get_all_queries(db, corpus)
+        manifest = ResultsManifest(db, writable=True)
         for query_category, bench in all_queries.items():
             bench_name = query_category.name
             if verbose:
                 print(f" {bench_name}", end="")
-            out_path = Path(f"data/{db.get_path()}/{bench_name}")
-            out_path.mkdir(parents=True, exist_ok=True)
             for query_name, get_query in bench.items():
                 filename = f"{db.get_search_path()}_q{query_name}.json"
-                outfile = out_path / filename
-                if outfile.exists():
-                    bench_query = DataCollector.read_analyzed_plan(outfile, db, False)
-                    # here we can toggle re-running queries that do not fit the integrity requirements
-                    if True or DataCollector.check_analyze_plan_duration_integrity(bench_query, False):
-                        print("°", end="", flush=True)
-                        continue
+                # results that failed the last revalidation (main.py --revalidate) are benchmarked again
+                if manifest.is_completed(bench_name, filename) and manifest.is_valid(bench_name, filename) is not False:
+                    print("°", end="", flush=True)
+                    continue
 
-                plan, benchmarks = self.get_n_runs(db, n_runs, get_query, query_name, query_category)
+                try:
+                    plan, benchmarks = self.get_n_runs(db, n_runs, get_query, query_name, query_category)
+                except SpareQueriesExhaustedException as e:
+                    print(f"\nskipping {db.get_search_path()} {bench_name} {query_name}: {e.message}")
+                    continue
 
-                result = {"plan": plan, "benchmarks": benchmarks}
-                self.store(outfile, result)
+                result = {"plan": plan, "benchmarks": benchmarks, "environment": self.get_environment()}
+                manifest.log.append(bench_name, filename, result)
                 if verbose:
                     print(".", end="", flush=True)
             if verbose:
@@ -1,5 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Queue
+from typing import Optional
+
+from src.active_learning import select_query_corpus
 from src.benchmark import Benchmarker
+from src.database import Database
 from src.database_manager import DatabaseManager
+from src.measurement import MeasurementSettings, pin_client
+from src.query_generation.corpus import generate_query_corpus
+from src.query_generation.prefilter import read_max_estimated_work
+from src.server import SERVER_ADDRESS, WebServer
 
 
 def update_schema(server: str):
@@ -13,13 +23,60 @@ def update_schema(server: str):
         db.query_missing_column_samples(server)
 
 
-def benchmark(address: str = "http://127.0.0.1:8000"):
+def run_databases(benchmarkers: list[Benchmarker], dbs: list[Database], n_iterations: int, corpora: dict):
+    """
+    each benchmarker (server) takes the next database that is not benchmarked yet, so the databases are sharded
+    across the servers
+    """
+    remaining = Queue()
+    for i, db in enumerate(dbs):
+        remaining.put((i, db))
+
+    def run(benchmarker: Benchmarker):
+        while True:
+            try:
+                i, db = remaining.get_nowait()
+            except Empty:
+                return
+            print(f"running benchmarks for {db.schema.name} ({i + 1}/{len(dbs)}) on {benchmarker.server}")
+            benchmarker.run_database(db, n_iterations, corpora[db.get_search_path()], verbose=len(benchmarkers) == 1)
+
+    with ThreadPoolExecutor(max_workers=len(benchmarkers)) as executor:
+        for _ in executor.map(run, benchmarkers):
+            pass
+
+
+def benchmark(
+    address: str = SERVER_ADDRESS,
+    seed: int = 0,
+    active_learning: bool = False,
+    webservers: Optional[list[WebServer]] = None,
+    settings: MeasurementSettings = MeasurementSettings(),
+):
+    """
+    With active_learning, only the candidate queries with the most uncertain estimates of the current model are run.
+    With webservers, the databases are benchmarked on all servers in parallel (address is ignored) and crashed servers
+    are restarted.
+    """
     n_iterations = 10
     n_random_queries = 40
+    pin_client(settings)
+    if webservers is not None:
+        benchmarkers = [Benchmarker(w.address, w, settings) for w in webservers]
+    else:
+        benchmarkers = [Benchmarker(address, settings=settings)]
     print("updating schema")
-    update_schema(address)
+    update_schema(benchmarkers[0].server)
+    print("done")
+    print("generating queries")
+    # calibrated with python -m src.query_generation.prefilter, no limit without a calibration
+    max_estimated_work = read_max_estimated_work()
+    dbs = DatabaseManager.get_all_databases()
+    if active_learning:
+        corpora = select_query_corpus(
+            benchmarkers[0], dbs, n_random_queries, seed=seed, max_estimated_work=max_estimated_work
+        )
+    else:
+        corpora = generate_query_corpus(dbs, n_random_queries, seed=seed, max_estimated_work=max_estimated_work)
     print("done")
-    benchmarker = Benchmarker(address)
-    for i, db in enumerate(DatabaseManager.get_all_databases()):
-        print(f"running benchmarks for {db.schema.name} ({i + 1}/{len(DatabaseManager.get_all_databases())})")
-        benchmarker.run_database(db, n_iterations, n_random_queries, verbose=True)
+    run_databases(benchmarkers, dbs, n_iterations, corpora)
@@ -1,82 +1,267 @@
+import hashlib
+import json
+import math
 import os
+import shutil
 import subprocess
+import tarfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 
 import duckdb
 import lz4.frame
 import requests
 
+T3_FILE_URL = "https://f003.backblazeb2.com/file/tuple-time-tree"
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+
+def get_expected_sha1(response: requests.Response) -> Optional[str]:
+    """
+    sha1 of the whole file as reported by the server, None if the server does not know it
+    """
+    checksum = response.headers.get("X-Bz-Content-Sha1")
+    if checksum is None or checksum == "none":
+        return None
+    return checksum.removeprefix("unverified:")
+
 
 def download_t3_file(filename: str):
+    """
+    Downloads to a .part file first, an interrupted download is resumed with a range request.
+    The file is only moved to its final path once its checksum matches.
+    """
     Path("downloaded_data").mkdir(parents=True, exist_ok=True)
-    if not Path(f"downloaded_data/{filename}").exists():
-        with requests.get(f"https://f003.backblazeb2.com/file/tuple-time-tree/{filename}", stream=True) as response:
+    path = Path(f"downloaded_data/{filename}")
+    if path.exists():
+        return
+    part_path = Path(f"downloaded_data/{filename}.part")
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+    with requests.get(f"{T3_FILE_URL}/{filename}", headers=headers, stream=True) as response:
+        if response.status_code == 416:
+            # the partial file is already complete (or broken), the checksum below decides
+            expected = get_expected_sha1(requests.head(f"{T3_FILE_URL}/{filename}", allow_redirects=True))
+        else:
             response.raise_for_status()  # Raise an error for bad responses
-            with open(f"downloaded_data/{filename}", "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
+            expected = get_expected_sha1(response)
+            if response.status_code != 206:
+                offset = 0
+        sha1 = hashlib.sha1()
+        with open(part_path, "r+b" if offset > 0 else "wb") as f:
+            # the checksum covers the already downloaded part as well
+            while offset > 0 and (chunk := f.read(min(DOWNLOAD_CHUNK_SIZE, offset - f.tell()))):
+                sha1.update(chunk)
+            f.seek(offset)
+            f.truncate()
+            if response.status_code != 416:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                     if chunk:
                         f.write(chunk)
+                        sha1.update(chunk)
+    if expected is not None and sha1.hexdigest() != expected:
+        part_path.unlink()
+        raise RuntimeError(f"checksum mismatch for {filename}: expected {expected}, got {sha1.hexdigest()}")
+    part_path.rename(path)
 
 
-def gen_tpcds(sf: int, path: Path):
-    Path("tpcds_db.db").unlink(missing_ok=True)
-    con = duckdb.connect("tpcds_db.db")
-    con.execute("INSTALL tpcds;")
-    con.execute("LOAD tpcds;")
-    con.execute(f"CALL dsdgen(sf = {sf});")
-    tpcds_tables = [
-        "call_center",
-        "catalog_page",
-        "catalog_sales",
-        "catalog_returns",
-        "customer",
-        "customer_address",
-        "customer_demographics",
-        "date_dim",
-        "household_demographics",
-        "income_band",
-        "inventory",
-        "item",
-        "promotion",
-        "reason",
-        "ship_mode",
-        "store",
-        "store_sales",
-        "store_returns",
-        "time_dim",
-        "warehouse",
-        "web_page",
-        "web_sales",
-        "web_returns",
-        "web_site",
-    ]
-    dir = path / f"tpcds/sf{sf}"
-    dir.mkdir(exist_ok=True, parents=True)
-    for table in tpcds_tables:
-        con.execute(f"COPY {table} TO '{dir}/{table}.dat' ( DELIMITER '|', HEADER FALSE);")
-
-
-def gen_tpch(sf: int, path: Path):
-    Path("tpch_db.db").unlink(missing_ok=True)
-    con = duckdb.connect("tpch_db.db")
-    con.execute("INSTALL tpch;")
-    con.execute("LOAD tpch;")
-    con.execute(f"CALL dbgen(sf = {sf});")
-    tpch_tables = [
-        "part",
-        "region",
-        "nation",
-        "supplier",
-        "partsupp",
-        "customer",
-        "orders",
-        "lineitem",
+def extract_lz4_tar(archive: Path, destination: Path):
+    """
+    decompresses and extracts in a single pass, without reading the archive into memory or writing the tar file
+    """
+    with lz4.frame.open(archive, "rb") as data, tarfile.open(fileobj=data, mode="r|") as tar:
+        tar.extractall(destination)
+
+
+def extract_lz4(archive: Path, destination: Path):
+    """
+    decompresses chunk by chunk, the destination only exists once it is complete
+    """
+    tmp_path = destination.with_name(f"{destination.name}.part")
+    with lz4.frame.open(archive, "rb") as data, open(tmp_path, "wb") as out:
+        shutil.copyfileobj(data, out, DOWNLOAD_CHUNK_SIZE)
+    tmp_path.rename(destination)
+
+
+TPC_SCALE_FACTORS = [1, 10, 100]
+# rough memory needed to generate one scale factor, the duckdb memory limit of a job is set accordingly
+TPC_GB_PER_SF = 1.0
+# dbgen generates tpch in chunks (children/step) of at most this many scale factors, that are generated in parallel
+TPCH_SF_PER_CHUNK = 5
+TPCH_TABLES = [
+    "part",
+    "region",
+    "nation",
+    "supplier",
+    "partsupp",
+    "customer",
+    "orders",
+    "lineitem",
+]
+TPCDS_TABLES = [
+    "call_center",
+    "catalog_page",
+    "catalog_sales",
+    "catalog_returns",
+    "customer",
+    "customer_address",
+    "customer_demographics",
+    "date_dim",
+    "household_demographics",
+    "income_band",
+    "inventory",
+    "item",
+    "promotion",
+    "reason",
+    "ship_mode",
+    "store",
+    "store_sales",
+    "store_returns",
+    "time_dim",
+    "warehouse",
+    "web_page",
+    "web_sales",
+    "web_returns",
+    "web_site",
+]
+
+
+@dataclass
+class TpcGenerationJob:
+    """
+    One chunk (step out of children) of a tpch or tpcds scale factor, only the given tables are exported
+    """
+
+    benchmark: str
+    sf: int
+    tables: list[str]
+    children: int = 1
+    step: int = 0
+
+    def get_dir(self, path: Path) -> Path:
+        return path / f"{self.benchmark}/sf{self.sf}"
+
+    def get_memory_gb(self) -> float:
+        return max(1.0, self.sf / self.children * TPC_GB_PER_SF)
+
+    def get_output_path(self, path: Path, table: str) -> Path:
+        """
+        chunks are exported to separate files and concatenated afterwards
+        """
+        output_path = get_tpc_table_path(self.get_dir(path), self.benchmark, table)
+        if self.children == 1:
+            return output_path
+        return output_path.with_name(f"{output_path.name}.{self.step}")
+
+    def run(self, path: Path, memory_gb: float, threads: int) -> dict[str, int]:
+        """
+        generates the chunk into its own database file and exports all tables concurrently, returns the row counts
+        """
+        dir = self.get_dir(path)
+        dir.mkdir(exist_ok=True, parents=True)
+        db_path = dir / f"{self.benchmark}_{self.step}.db"
+        db_path.unlink(missing_ok=True)
+        con = duckdb.connect(str(db_path))
+        con.execute(f"SET memory_limit = '{memory_gb:.1f}GB';")
+        con.execute(f"SET threads = {threads};")
+        if self.benchmark == "tpch":
+            con.execute("INSTALL tpch;")
+            con.execute("LOAD tpch;")
+            con.execute(f"CALL dbgen(sf = {self.sf}, children = {self.children}, step = {self.step});")
+        else:
+            assert self.children == 1, "dsdgen can not generate chunks"
+            con.execute("INSTALL tpcds;")
+            con.execute("LOAD tpcds;")
+            con.execute(f"CALL dsdgen(sf = {self.sf});")
+
+        def export(table: str) -> int:
+            cursor = con.cursor()
+            cursor.execute(f"COPY {table} TO '{self.get_output_path(path, table)}' (DELIMITER '|', HEADER FALSE);")
+            return cursor.execute(f"SELECT count(*) FROM {table};").fetchone()[0]
+
+        with ThreadPoolExecutor(max_workers=len(self.tables)) as executor:
+            row_counts = dict(zip(self.tables, executor.map(export, self.tables)))
+        con.close()
+        db_path.unlink()
+        return row_counts
+
+
+def get_default_memory_budget_gb() -> float:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1 << 30) * 0.75
+
+
+def get_tpc_table_path(dir: Path, benchmark: str, table: str) -> Path:
+    return dir / f"{table}.{'tbl' if benchmark == 'tpch' else 'dat'}"
+
+
+def get_row_counts_path(dir: Path) -> Path:
+    return dir / "row_counts.json"
+
+
+def count_rows(file: Path) -> int:
+    rows = 0
+    with open(file, "rb") as f:
+        while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+            rows += chunk.count(b"\n")
+    return rows
+
+
+def get_missing_tables(dir: Path, benchmark: str, tables: list[str]) -> list[str]:
+    """
+    tables without an output file with the row count recorded when it was exported
+    """
+    if not get_row_counts_path(dir).exists():
+        return tables
+    with open(get_row_counts_path(dir), "r") as f:
+        row_counts = json.load(f)
+    return [
+        t
+        for t in tables
+        if t not in row_counts
+        or not get_tpc_table_path(dir, benchmark, t).exists()
+        or count_rows(get_tpc_table_path(dir, benchmark, t)) != row_counts[t]
     ]
 
-    dir = path / f"tpch/sf{sf}"
-    dir.mkdir(exist_ok=True, parents=True)
-    for table in tpch_tables:
-        con.execute(f"COPY {table} TO '{dir}/{table}.tbl' (DELIMITER '|', HEADER FALSE);")
+
+def get_tpc_generation_jobs(path: Path, scale_factors: list[int]) -> list[list[TpcGenerationJob]]:
+    """
+    jobs per benchmark and scale factor, already exported tables are skipped
+    """
+    result = []
+    for sf in scale_factors:
+        for benchmark, tables in (("tpch", TPCH_TABLES), ("tpcds", TPCDS_TABLES)):
+            missing = get_missing_tables(path / f"{benchmark}/sf{sf}", benchmark, tables)
+            if len(missing) == 0:
+                print(f"{benchmark} sf{sf} already exists")
+                continue
+            children = math.ceil(sf / TPCH_SF_PER_CHUNK) if benchmark == "tpch" else 1
+            result.append([TpcGenerationJob(benchmark, sf, missing, children, step) for step in range(children)])
+    return result
+
+
+def finish_tpc_generation(path: Path, jobs: list[TpcGenerationJob], row_counts: list[dict[str, int]]):
+    """
+    concatenates the chunks of each table and records the row counts of the exported tables
+    """
+    first = jobs[0]
+    dir = first.get_dir(path)
+    totals = {t: sum(r[t] for r in row_counts) for t in first.tables}
+    if first.children > 1:
+        for t in first.tables:
+            with open(get_tpc_table_path(dir, first.benchmark, t), "wb") as out:
+                for job in jobs:
+                    with open(job.get_output_path(path, t), "rb") as chunk:
+                        shutil.copyfileobj(chunk, out, DOWNLOAD_CHUNK_SIZE)
+                    job.get_output_path(path, t).unlink()
+    recorded = {}
+    if get_row_counts_path(dir).exists():
+        with open(get_row_counts_path(dir), "r") as f:
+            recorded = json.load(f)
+    recorded.update(totals)
+    with open(get_row_counts_path(dir), "w") as f:
+        json.dump(recorded, f, indent=2)
 
 
 def download_csvs():
@@ -91,22 +276,57 @@ def download_csvs():
     )
 
 
-def create_tpc_data():
-    for sf in [1, 10, 100]:
-        print(f"Generating TPC-H sf{sf} dataset ({sf} GB)")
-        gen_tpch(sf, Path("benchmark_setup/csvs"))
-        print(f"Generating TPC-DS sf{sf} dataset ({sf} GB)")
-        gen_tpcds(sf, Path("benchmark_setup/csvs"))
+def run_tpc_generation_jobs(path: Path, jobs: list[TpcGenerationJob], memory_budget_gb: float) -> list[dict[str, int]]:
+    """
+    Runs the jobs in separate processes (dbgen and dsdgen are not thread safe) as long as they fit into the memory
+    budget, the largest jobs first. A job larger than the budget runs alone. Returns the row counts of each job.
+    """
+    pending = sorted(range(len(jobs)), key=lambda i: -jobs[i].get_memory_gb())
+    running = {}
+    result = [{} for _ in jobs]
+    used_gb = 0.0
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        while pending or running:
+            for i in list(pending):
+                memory_gb = min(jobs[i].get_memory_gb(), memory_budget_gb)
+                if used_gb + memory_gb > memory_budget_gb:
+                    continue
+                # cores are shared in proportion to the memory of the running jobs
+                threads = max(1, round(os.cpu_count() * memory_gb / memory_budget_gb))
+                running[executor.submit(jobs[i].run, path, memory_gb, threads)] = (i, memory_gb)
+                pending.remove(i)
+                used_gb += memory_gb
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, memory_gb = running.pop(future)
+                used_gb -= memory_gb
+                result[i] = future.result()
+    return result
+
+
+def create_tpc_data(scale_factors: Optional[list[int]] = None, memory_budget_gb: Optional[float] = None):
+    """
+    Generates all tpch and tpcds scale factors concurrently as long as they fit into the memory budget.
+    Tables whose output already exists with the recorded row count are not exported again.
+    """
+    path = Path("benchmark_setup/csvs")
+    if memory_budget_gb is None:
+        memory_budget_gb = get_default_memory_budget_gb()
+    job_groups = get_tpc_generation_jobs(path, scale_factors if scale_factors is not None else TPC_SCALE_FACTORS)
+    for group in job_groups:
+        print(f"Generating {group[0].benchmark} sf{group[0].sf} dataset ({group[0].sf} GB) in {len(group)} chunks")
+    row_counts = run_tpc_generation_jobs(path, [job for group in job_groups for job in group], memory_budget_gb)
+    offset = 0
+    for group in job_groups:
+        finish_tpc_generation(path, group, row_counts[offset : offset + len(group)])
+        offset += len(group)
 
 
 def extract_sql():
     out_path = "benchmark_setup/sql"
     if not Path(out_path).exists():
         download_t3_file("sql.lz4")
-        with open("downloaded_data/sql.lz4", "rb") as server:
-            decompressed_data = lz4.frame.decompress(server.read())
-        with open(out_path, "wb") as server:
-            server.write(decompressed_data)
+        extract_lz4(Path("downloaded_data/sql.lz4"), Path(out_path))
         subprocess.run(["chmod", "+x", out_path], cwd=os.getcwd())
 
 
@@ -1,14 +1,28 @@
 import json
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Optional
 
 import numpy as np
 
 from src.database import Database
-from src.metrics import q_error
+from src.database_manager import DatabaseManager
+from src.integrity import (
+    ACCEPTABLE_ABSOLUTE_ERROR,
+    ACCEPTABLE_ANALYZE_PLAN_DURATION_Q_ERROR,
+    ACCEPTABLE_FRACTION_OF_OUTLIERS,
+    ACCEPTABLE_Q_ERROR,
+    MINIMAL_NUMBER_OF_NON_OUTLIERS,
+    MINIMAL_RUNS,
+    IntegrityVerdict,
+    get_verdicts,
+)
+from src.metadata_index import get_metadata_indexes, group_metadata
+from src.metrics import q_error, q_errors, abs_errors
 from src.optimizer import BenchmarkedQuery, QueryCategory
 from src.query_plan import QueryPlan
+from src.results_log import ResultsManifest, iterate_results
 from src.util import fifo_cache
 
 
@@ -24,34 +38,29 @@ def arg_median(a):
 
 class DataCollector:
     @staticmethod
-    def read_runtime(file: Path) -> float:
-        with open(file, "r") as benchmark_json:
-            benchmark_json = json.load(benchmark_json)
-        runtimes = [b["executionTime"] for b in benchmark_json["benchmarks"]]
-        return np.median(runtimes)
-
-    @staticmethod
-    def read_query(file: Path) -> str:
-        with open(file, "r") as benchmark_json:
-            benchmark_json = json.load(benchmark_json)
-        query = benchmark_json["plan"]["query_text"]
-        return query
+    def get_type(file: Path) -> QueryCategory:
+        return DataCollector.get_category(str(file.parent.name))
 
     @staticmethod
-    def get_type(file: Path) -> QueryCategory:
-        name = str(file.parent.name)
+    def get_category(name: str) -> QueryCategory:
         return next(x for x in QueryCategory if x.name == name)
 
     @staticmethod
-    def read_analyzed_plan(file: Path, db: Database, predicted_cardinalities: bool) -> BenchmarkedQuery:
-        with open(file, "r") as benchmark_json:
-            benchmark_json = json.load(benchmark_json)
+    def get_analyzed_plan(
+        benchmark_json: dict, name: str, category: str, db: Database, predicted_cardinalities: bool
+    ) -> BenchmarkedQuery:
         plan = QueryPlan(benchmark_json["plan"]["plan"], db, predicted_cardinalities)
         plan.build_pipelines(benchmark_json["plan"]["plan"]["analyzePlanPipelines"])
         runtimes = [b["executionTime"] for b in benchmark_json["benchmarks"]]
         # runtimes.sort()
         query_text = benchmark_json["plan"]["query_text"]
-        return BenchmarkedQuery(plan, runtimes, file.name, query_text, DataCollector.get_type(file))
+        return BenchmarkedQuery(plan, runtimes, name, query_text, DataCollector.get_category(category))
+
+    @staticmethod
+    def read_analyzed_plan(file: Path, db: Database, predicted_cardinalities: bool) -> BenchmarkedQuery:
+        with open(file, "r") as benchmark_json:
+            benchmark_json = json.load(benchmark_json)
+        return DataCollector.get_analyzed_plan(benchmark_json, file.name, file.parent.name, db, predicted_cardinalities)
 
     @staticmethod
     def group_by_multiple_runs(benchmarks: list[BenchmarkedQuery]) -> dict[str, list[BenchmarkedQuery]]:
@@ -82,10 +91,8 @@ class DataCollector:
     @fifo_cache
     def collect_db_benchmark_runs(db: Database, predicted_cardinalities) -> list[BenchmarkedQuery]:
         result = []
-        files = [f for f in Path(f"data/{db.get_path()}").rglob("*.json")]
-        files.sort()
-        for file in files:
-            result.append(DataCollector.read_analyzed_plan(file, db, predicted_cardinalities))
+        for category, name, benchmark_json in iterate_results(db):
+            result.append(DataCollector.get_analyzed_plan(benchmark_json, name, category, db, predicted_cardinalities))
         return result
 
     @staticmethod
@@ -94,10 +101,19 @@ class DataCollector:
         predicted_cardinalities: bool,
         query_category: list[QueryCategory] = [],
         exclude_query_category: list[QueryCategory] = [],
+        clean_only: bool = False,
     ) -> list[BenchmarkedQuery]:
+        """
+        with clean_only, queries that fail the integrity checks are left out
+        """
         benchmarks = []
+        verdicts = DataCollector.get_integrity_verdicts(dbs) if clean_only else {}
         for db in dbs:
-            benchmarks += DataCollector.collect_db_benchmark_runs(db, predicted_cardinalities)
+            db_benchmarks = DataCollector.collect_db_benchmark_runs(db, predicted_cardinalities)
+            if clean_only:
+                db_verdicts = verdicts[db.get_search_path()]
+                db_benchmarks = [b for b in db_benchmarks if db_verdicts[(b.query_category.name, b.name)].is_valid()]
+            benchmarks += db_benchmarks
         if len(query_category) != 0:
             benchmarks = [b for b in benchmarks if b.query_category in query_category]
         if len(exclude_query_category) != 0:
@@ -109,11 +125,11 @@ class DataCollector:
         result = True
 
         # bound in seconds, errors below are ignored, errors above are checked with q-error
-        acceptable_absolute_error = 0.002
-        acceptable_q_error = 1.10
-        acceptable_fraction_of_outliers = 1 / 3
-        minimal_number_of_non_outliers = 2
-        minimal_runs = 3
+        acceptable_absolute_error = ACCEPTABLE_ABSOLUTE_ERROR
+        acceptable_q_error = ACCEPTABLE_Q_ERROR
+        acceptable_fraction_of_outliers = ACCEPTABLE_FRACTION_OF_OUTLIERS
+        minimal_number_of_non_outliers = MINIMAL_NUMBER_OF_NON_OUTLIERS
+        minimal_runs = MINIMAL_RUNS
 
         n_runs = len(benchmark.total_runtimes)
         if n_runs < minimal_runs:
@@ -123,8 +139,8 @@ class DataCollector:
         times = np.array(benchmark.total_runtimes)
         i_med = arg_median(times)
         med: float = times[i_med]
-        q_errors = np.array([q_error(med, x) for x in times])
-        q_errors_to_high_mask = q_errors > acceptable_q_error
+        run_q_errors = q_errors(med, times)
+        q_errors_to_high_mask = run_q_errors > acceptable_q_error
         absolute_errors = np.abs(times - med)
         absolute_errors_low_mask = absolute_errors < acceptable_absolute_error
         outlier_mask = q_errors_to_high_mask & (~absolute_errors_low_mask)
@@ -137,7 +153,7 @@ class DataCollector:
             print(
                 f"insuffiecient number of non-outliers "
                 f"({n_non_outliers}/{current_minimal_number_of_non_outliers}) in query {benchmark.name}\n"
-                f" q_errors: {sorted(q_errors)}\n"
+                f" q_errors: {sorted(run_q_errors)}\n"
                 f" absolute errors: {sorted(absolute_errors)}\n"
                 f" runtimes: {sorted(times)}\n"
                 f" text:\n{benchmark.query_text}"
@@ -149,7 +165,7 @@ class DataCollector:
     def check_analyze_plan_duration_integrity(benchmark: BenchmarkedQuery, verbose: bool = True) -> bool:
         result = True
         med = benchmark.get_total_runtime()
-        acceptable_analyze_plan_duration_q_error = 1.2
+        acceptable_analyze_plan_duration_q_error = ACCEPTABLE_ANALYZE_PLAN_DURATION_Q_ERROR
         if q_error(med, benchmark.get_analyze_plan_runtime()) > acceptable_analyze_plan_duration_q_error:
             if verbose:
                 print(
@@ -176,16 +192,57 @@ class DataCollector:
         - there is a sufficient number of non-outliers
         - the number of outliers is bounded
         - analyze_plan pipeline execution duration is not too far off
+        The checks use the cached verdicts, DataCollector.check_single_integrity prints the details of one query.
         """
         result = True
+        for db_name, verdicts in DataCollector.get_integrity_verdicts(dbs).items():
+            n_runtimes = sum(not v.runtimes for v in verdicts.values())
+            n_durations = sum(not v.analyze_plan_duration for v in verdicts.values())
+            if n_runtimes > 0 or n_durations > 0:
+                print(
+                    f"{db_name}: {n_runtimes}/{len(verdicts)} queries with too many outliers, "
+                    f"{n_durations}/{len(verdicts)} queries with an implausible analyze plan duration"
+                )
+                result = False
+        return result
 
-        benchmarks = DataCollector.collect_benchmarks(dbs)
-        for benchmark in benchmarks:
-            current = DataCollector.check_single_integrity(benchmark)
-            result = result and current
-
+    @staticmethod
+    def get_integrity_verdicts(
+        dbs: list[Database], recheck: bool = False, n_workers: Optional[int] = None
+    ) -> dict[str, dict[tuple[str, str], IntegrityVerdict]]:
+        """
+        verdicts by database and by (category, name) of each query. Results without cached verdict (all with recheck)
+        are checked per database in parallel and their verdicts are cached in the results manifest
+        """
+        result = {}
+        missing = []
+        for db in dbs:
+            manifest = ResultsManifest(db)
+            verdicts = {k: manifest.get_verdict(*k) for k in manifest.get_keys()}
+            if recheck or any(v is None for v in verdicts.values()):
+                missing.append(db.get_search_path())
+            else:
+                result[db.get_search_path()] = verdicts
+        if len(missing) > 0:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                args = [(db_name, recheck) for db_name in missing]
+                for db_name, verdicts in executor.map(_check_database_integrity_worker, args):
+                    result[db_name] = verdicts
         return result
 
+    @staticmethod
+    def revalidate_benchmarks(dbs: list[Database], n_workers: Optional[int] = None) -> int:
+        """
+        checks the results of all databases again, queries with invalid results are benchmarked again on resume.
+        Returns the number of invalid results
+        """
+        n_invalid = 0
+        for db_name, verdicts in DataCollector.get_integrity_verdicts(dbs, True, n_workers).items():
+            n_db_invalid = sum(not v.is_valid() for v in verdicts.values())
+            print(f"{db_name}: {n_db_invalid}/{len(verdicts)} results failed the integrity check")
+            n_invalid += n_db_invalid
+        return n_invalid
+
     @staticmethod
     def get_benchmark_q_errors(dbs: list[Database]) -> np.ndarray:
         """
@@ -193,17 +250,13 @@ class DataCollector:
         """
         result = []
         abs_result = []
-        benchmarks = DataCollector.collect_benchmarks(dbs)
+        benchmarks = DataCollector.collect_benchmarks(dbs, False)
         for benchmark in benchmarks:
             times = np.array(benchmark.total_runtimes)
             i_med = arg_median(times)
             med: float = times[i_med]
-            q_errors = np.array([q_error(med, x) for x in times])
-            q_errors.sort()
-            result.append(q_errors)
-            abs_errors = np.array([abs(med - x) for x in times])
-            abs_errors.sort()
-            abs_result.append(abs_errors)
+            result.append(np.sort(q_errors(med, times)))
+            abs_result.append(np.sort(abs_errors(med, times)))
         result = np.array(result)
         abs_result = np.array(abs_result)
 
@@ -241,63 +294,67 @@ class DataCollector:
                 f" {n_over_10_ms / len(runtimes) * 100:.2f}% are over 10 ms"
             )
 
-        per_type_runtimes = {}
-        per_db_runtimes = {}
-        all_runtimes = []
-        for db in dbs:
-            subdirs = [d for d in Path(f"data/{db.get_path()}").iterdir() if d.is_dir()]
-            for dir in subdirs:
-                print(dir)
-                files = [f for f in dir.rglob("*.json")]
-                files.sort()
-                runtimes = [DataCollector.read_runtime(f) for f in files]
-                if len(runtimes) > 0:
-                    if dir.name not in per_type_runtimes:
-                        per_type_runtimes[dir.name] = []
-                    per_type_runtimes[dir.name] += runtimes
-                    if db.schema.name not in per_db_runtimes:
-                        per_db_runtimes[db.schema.name] = []
-                    per_db_runtimes[db.schema.name] += runtimes
-                    all_runtimes += runtimes
-                    print_runtimes_stats(runtimes)
-                else:
-                    print(" empty")
+        metadata = [m for index in get_metadata_indexes(dbs) for m in index.get_metadata()]
+        for db_name, db_metadata in group_metadata(metadata, lambda m: m.db).items():
+            for category, category_metadata in group_metadata(db_metadata, lambda m: m.category).items():
+                print(f"data/{db_name}/{category}")
+                print_runtimes_stats([m.median_runtime for m in category_metadata])
+        if len(metadata) == 0:
+            print(" empty")
+            return
 
         print()
         print("Per Query Type")
-        for q_type, runtimes in per_type_runtimes.items():
-            print(f"{q_type} ({len(runtimes)})")
-            print_runtimes_stats(runtimes)
+        for q_type, q_type_metadata in group_metadata(metadata, lambda m: m.category).items():
+            print(f"{q_type} ({len(q_type_metadata)})")
+            print_runtimes_stats([m.median_runtime for m in q_type_metadata])
 
         print()
         print("Per Database")
-        for db in sorted(per_db_runtimes):
-            runtimes = per_db_runtimes[db]
-            print(f"{db} ({len(runtimes)})")
-            print_runtimes_stats(runtimes)
+        per_db_metadata = group_metadata(metadata, lambda m: m.db)
+        for db in sorted(per_db_metadata):
+            print(f"{db} ({len(per_db_metadata[db])})")
+            print_runtimes_stats([m.median_runtime for m in per_db_metadata[db]])
+
+        print()
+        print("Per Runtime")
+        by_runtime = sorted(metadata, key=lambda m: m.median_runtime)
+        for bucket, bucket_metadata in group_metadata(by_runtime, lambda m: m.get_runtime_bucket()).items():
+            print(f"{bucket} ({len(bucket_metadata)})")
+            print_runtimes_stats([m.median_runtime for m in bucket_metadata])
 
         print()
         print("All:")
-        print_runtimes_stats(all_runtimes)
+        print_runtimes_stats([m.median_runtime for m in metadata])
 
     @staticmethod
     def save_queries(dbs: list[Database], file: Path, filter: Optional[str] = None):
         per_db_queries = {}
-        for db in dbs:
-            subdirs = [d for d in Path(f"data/{db.get_path()}").iterdir() if d.is_dir()]
-            for dir in subdirs:
-                if filter is not None and dir.name != filter:
-                    continue
-                print(dir)
-                files = [f for f in dir.rglob("*.json")]
-                files.sort()
-                queries = [DataCollector.read_query(f) for f in files]
-                if len(queries) > 0:
-                    if db.schema.name not in per_db_queries:
-                        per_db_queries[db.schema.name] = []
-                    per_db_queries[db.schema.name] += queries
-                else:
-                    print(" empty")
+        for index in get_metadata_indexes(dbs):
+            metadata = [m for m in index.get_metadata() if filter is None or m.category == filter]
+            for category, category_metadata in group_metadata(metadata, lambda m: m.category).items():
+                print(f"data/{index.db.get_path()}/{category}")
+                if index.db.schema.name not in per_db_queries:
+                    per_db_queries[index.db.schema.name] = []
+                per_db_queries[index.db.schema.name] += [index.get_query(m.query_hash) for m in category_metadata]
         print(per_db_queries)
         with open(file, "w") as fd:
             json.dump(per_db_queries, fd)
+
+
+def _check_database_integrity_worker(args: tuple[str, bool]) -> tuple[str, dict[tuple[str, str], IntegrityVerdict]]:
+    db_name, recheck = args
+    db = DatabaseManager.get_database(db_name)
+    manifest = ResultsManifest(db)
+    keys = manifest.get_keys()
+    missing = keys if recheck else [k for k in keys if manifest.get_verdict(*k) is None]
+    runtimes = []
+    analyze_plan_runtimes = []
+    for category, name, benchmark_json in manifest.iterate(missing):
+        bench_query = DataCollector.get_analyzed_plan(benchmark_json, name, category, db, False)
+        runtimes.append(bench_query.total_runtimes)
+        analyze_plan_runtimes.append(bench_query.get_analyze_plan_runtime())
+    for key, verdict in zip(missing, get_verdicts(runtimes, analyze_plan_runtimes)):
+        manifest.set_verdict(*key, verdict)
+    manifest.write()
+    return db_name, {k: manifest.get_verdict(*k) for k in keys}
@@ -1,13 +1,15 @@
+import hashlib
+import json
 from dataclasses import dataclass
-from typing import Optional
-
-import numpy as np
-from tabulate import tabulate
+from pathlib import Path
 
 from src.data_collection import DataCollector
 from src.database_manager import DatabaseManager
+from src.features import FeatureMapper
 from src.model import Model
-from src.optimizer import BenchmarkedQuery, QueryCategory
+from src.optimizer import BenchmarkedQuery
+
+ESTIMATION_CACHE_PATH = "data/estimation_cache"
 
 
 @dataclass
@@ -18,73 +20,56 @@ class EstimatedQuery:
 
 
 class QueryEstimationCache:
+    """
+    Estimates of a model for all benchmarked queries.
+    The pipeline estimates are persisted per model and feature mapping, so only queries that are new or whose plan
+    changed (e.g. because they were benchmarked again) since the last run are estimated.
+    """
+
     def __init__(self, model: Model, predicted_cardinalities):
         print("evaluating model on all queries... ", end="")
         benchmarks = DataCollector.collect_benchmarks(DatabaseManager.get_all_databases(), predicted_cardinalities)
+        cache_file = self.get_cache_file(model, predicted_cardinalities)
+        pipeline_estimates = self.read_pipeline_estimates(cache_file)
+        hashes = {b.name: self.get_benchmark_hash(b) for b in benchmarks}
+        missing = [b for b in benchmarks if pipeline_estimates.get(b.name, (None,))[0] != hashes[b.name]]
+        if len(missing) > 0:
+            for b, estimate in zip(missing, model.estimate_many_pipeline_runtimes(missing)):
+                pipeline_estimates[b.name] = (hashes[b.name], estimate)
+            self.write_pipeline_estimates(cache_file, pipeline_estimates)
         self.queries: dict[str, EstimatedQuery] = {}
         for b in benchmarks:
-            estimate = model.estimate_runtime(b)
-            pipeline_estimate = model.estimate_pipeline_runtime(b)
-            self.queries[b.name] = EstimatedQuery(b, estimate, pipeline_estimate)
-        print("done")
-
-
-def stringify(v) -> str:
-    if isinstance(v, float):
-        if v < 10:
-            return f"{v:.3f}"
-        elif 10 <= v < 100:
-            return f"{v:.2f}"
-        elif 100 <= v < 1000:
-            return f"{v:.1f}"
-        else:
-            return f"{v:.0f}"
-    else:
-        return f"{v}"
+            pipeline_estimate = pipeline_estimates[b.name][1]
+            self.queries[b.name] = EstimatedQuery(b, sum(pipeline_estimate), pipeline_estimate)
+        print(f"done ({len(missing)} new)")
 
+    @staticmethod
+    def get_benchmark_hash(benchmark: BenchmarkedQuery) -> str:
+        """
+        identifies the plan the estimates are based on, a query that is benchmarked again gets a new plan
+        """
+        plan = benchmark.query_plan
+        content = json.dumps([benchmark.query_text, plan.json_plan, plan.ius], sort_keys=True)
+        return hashlib.md5(content.encode("utf-8")).hexdigest()
 
-def statistics_with_error_function(
-    errors: list[tuple[float, BenchmarkedQuery, float]],
-    dataset: str,
-    error_name: str,
-    verbose: bool,
-) -> dict:
-    if len(errors) == 0:
-        return {}
-    errors.sort(key=lambda x: x[0])
-    report = {
-        f"{dataset} dataset, metric": error_name,
-        "Avg": np.average([e[0] for e in errors]),
-        "p10": np.quantile([e[0] for e in errors], 0.1),
-        "p50": np.median([e[0] for e in errors]),
-        "p90": np.quantile([e[0] for e in errors], 0.90),
-        "p95": np.quantile([e[0] for e in errors], 0.95),
-        "Max": errors[-1][0],
-    }
-    if verbose:
-        headers = list(report.keys())
-        table = [[stringify(report[c]) for c in headers]]
-        print(tabulate(table, headers, tablefmt="github"))
-        print(
-            f"max_name: {errors[-1][1].name}, "
-            f"max_true: {errors[-1][1].get_total_runtime()}, "
-            f"max_estimated: {errors[-1][2]}"
-        )
-    return report
+    @staticmethod
+    def get_cache_file(model: Model, predicted_cardinalities: bool) -> Path:
+        cardinalities = "predicted" if predicted_cardinalities else "exact"
+        features = hashlib.md5("\n".join(FeatureMapper.get_names()).encode("utf-8")).hexdigest()
+        return Path(f"{ESTIMATION_CACHE_PATH}/{model.get_hash()}_{features}_{cardinalities}.json")
 
+    @staticmethod
+    def read_pipeline_estimates(file: Path) -> dict[str, tuple[str, list[float]]]:
+        """
+        benchmark hash and pipeline estimates by query name
+        """
+        if not file.exists():
+            return {}
+        with open(file, "r") as f:
+            return {name: tuple(v) for name, v in json.load(f).items()}
 
-def get_errors(
-    queries: list[BenchmarkedQuery],
-    results: list[float],
-    function: callable,
-    query_category: Optional[QueryCategory],
-    excluded_query_category: Optional[QueryCategory],
-) -> list[tuple[float, BenchmarkedQuery, float]]:
-    assert query_category is None or excluded_query_category is None
-    errors = []
-    for bench, result in zip(queries, results):
-        if (query_category is None or bench.query_category == query_category) and (
-            excluded_query_category is None or bench.query_category != excluded_query_category
-        ):
-            errors.append((function(bench.get_total_runtime(), result), bench, result))
-    return errors
+    @staticmethod
+    def write_pipeline_estimates(file: Path, pipeline_estimates: dict[str, tuple[str, list[float]]]):
+        file.parent.mkdir(parents=True, exist_ok=True)
+        with open(file, "w") as f:
+            json.dump(pipeline_estimates, f)
@@ -0,0 +1,183 @@
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from tabulate import tabulate
+
+from src.data_collection import DataCollector
+from src.database_manager import DatabaseManager
+from src.evaluation import QueryEstimationCache
+from src.features import FeatureMapper, QualifiedFeature
+from src.metrics import q_errors
+from src.model import PerTupleTreeModel
+from src.operator_stages import OperatorStage
+from src.operators import OperatorType
+from src.optimizer import BenchmarkedQuery, optimize_per_tuple_tree_model
+
+CONTRIBUTIONS_PATH = "data/feature_contributions"
+
+
+def get_operator_groups() -> tuple[list[tuple[OperatorType, OperatorStage]], np.ndarray]:
+    """
+    all (operator type, stage) pairs with features and the group index of each feature
+    """
+    features = QualifiedFeature.enumerate_features()
+    groups = list(dict.fromkeys((f.operator_type, f.operator_stage) for f in features))
+    group_index = {g: i for i, g in enumerate(groups)}
+    return groups, np.array([group_index[f.operator_type, f.operator_stage] for f in features], dtype=int)
+
+
+@dataclass
+class FeatureContributions:
+    """
+    Columnar per-feature contributions to the estimates of all non-empty pipelines of a query corpus.
+    Contributions are in log space, so they add up per pipeline and across features of the same operator.
+    """
+
+    query_names: np.ndarray  # one entry per pipeline
+    pipelines: np.ndarray  # index of the pipeline within its query
+    scan_sizes: np.ndarray
+    estimated: np.ndarray  # estimated pipeline runtimes in seconds
+    real: np.ndarray  # benchmarked pipeline runtimes in seconds
+    contributions: np.ndarray  # pipelines x features
+    bias: np.ndarray
+
+    @staticmethod
+    def get_path(model: PerTupleTreeModel, name: str) -> Path:
+        return Path(f"{CONTRIBUTIONS_PATH}/{model.get_hash()}_{name}.npz")
+
+    def write(self, path: Path, queries_hash: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            query_names=self.query_names,
+            pipelines=self.pipelines,
+            scan_sizes=self.scan_sizes,
+            estimated=self.estimated,
+            real=self.real,
+            contributions=self.contributions,
+            bias=self.bias,
+            feature_names=np.array(FeatureMapper.get_names()),
+            queries_hash=np.array(queries_hash),
+        )
+
+    @staticmethod
+    def read(path: Path, queries_hash: str) -> Optional["FeatureContributions"]:
+        """
+        None if there is no cached result for the features and queries (see get_queries_hash)
+        """
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            if list(data["feature_names"]) != FeatureMapper.get_names():
+                print(f"{path} was computed with different features")
+                return None
+            if "queries_hash" not in data or str(data["queries_hash"]) != queries_hash:
+                print(f"{path} was computed for different queries")
+                return None
+            return FeatureContributions(
+                data["query_names"],
+                data["pipelines"],
+                data["scan_sizes"],
+                data["estimated"],
+                data["real"],
+                data["contributions"],
+                data["bias"],
+            )
+
+    def get_q_errors(self) -> np.ndarray:
+        return q_errors(self.real, self.estimated)
+
+    def aggregate_by_operator(self) -> tuple[list[tuple[OperatorType, OperatorStage]], np.ndarray]:
+        """
+        contributions summed per (operator type, stage), with one row per pipeline and one column per group
+        """
+        groups, feature_groups = get_operator_groups()
+        membership = np.zeros((len(feature_groups), len(groups)), dtype=self.contributions.dtype)
+        membership[np.arange(len(feature_groups)), feature_groups] = 1
+        return groups, self.contributions @ membership
+
+    def print_report(self, n_pipelines: int = 10, n_groups: int = 3):
+        """
+        average absolute contribution per operator and the operators that dominate the worst estimated pipelines
+        """
+        groups, grouped = self.aggregate_by_operator()
+        group_names = [f"{t.name}_{s.name}" for t, s in groups]
+        average = np.average(np.abs(grouped), axis=0)
+        used = np.count_nonzero(grouped, axis=0)
+        order = np.argsort(-average)
+        table = [[group_names[i], average[i], used[i]] for i in order if used[i] > 0]
+        print(tabulate(table, ["Operator", "Avg |log contribution|", "Pipelines"], tablefmt="github"))
+
+        errors = self.get_q_errors()
+        print(f"\nworst {n_pipelines} pipelines:")
+        for i in np.argsort(-errors, kind="stable")[:n_pipelines]:
+            top = np.argsort(-np.abs(grouped[i]))[:n_groups]
+            explanation = ", ".join(f"{group_names[g]} x{np.exp(grouped[i, g]):.3g}" for g in top)
+            print(
+                f" {self.query_names[i]} Pipeline{self.pipelines[i]}: estimated {self.estimated[i]:.4f}s, "
+                f"real {self.real[i]:.4f}s (q-error {errors[i]:.2f}): {explanation}"
+            )
+
+
+def compute_feature_contributions(model: PerTupleTreeModel, queries: list[BenchmarkedQuery]) -> FeatureContributions:
+    """
+    contributions of all pipelines of all queries with a single predict call
+    """
+    feature_mapper = model.get_feature_mapper()
+    feature_matrices = [q.get_feature_matrix(feature_mapper) for q in queries]
+    x = np.vstack(feature_matrices)
+    scan_sizes = np.concatenate([feature_mapper.get_pipeline_scan_sizes(q.query_plan) for q in queries]).astype(float)
+    query_names = np.array([q.name for q, m in zip(queries, feature_matrices) for _ in range(len(m))])
+    pipelines = np.concatenate([np.arange(len(m)) for m in feature_matrices])
+    real = np.concatenate([q.get_pipeline_runtimes() for q in queries])
+    # empty pipelines are always estimated with 0 seconds, there is nothing to explain
+    mask = np.any(x != 0, axis=1)
+    x = x[mask]
+    contributions = model.predict_contributions(x).astype(np.float32)
+    return FeatureContributions(
+        query_names[mask],
+        pipelines[mask],
+        scan_sizes[mask],
+        model.predict(x, scan_sizes[mask].copy()),
+        real[mask],
+        contributions[:, :-1],
+        contributions[:, -1],
+    )
+
+
+def get_queries_hash(queries: list[BenchmarkedQuery]) -> str:
+    """
+    changes if a query is added, removed, renamed or benchmarked again
+    """
+    content = "\n".join(f"{q.name}:{QueryEstimationCache.get_benchmark_hash(q)}" for q in queries)
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+def get_feature_contributions(
+    model: PerTupleTreeModel, queries: list[BenchmarkedQuery], name: str
+) -> FeatureContributions:
+    """
+    contributions are cached per model and query set (name), a cached result is only used for the same queries
+    """
+    path = FeatureContributions.get_path(model, name)
+    queries_hash = get_queries_hash(queries)
+    result = FeatureContributions.read(path, queries_hash)
+    if result is None:
+        result = compute_feature_contributions(model, queries)
+        result.write(path, queries_hash)
+    return result
+
+
+def main():
+    model = optimize_per_tuple_tree_model(
+        DataCollector.collect_benchmarks(DatabaseManager.get_train_databases(), False)
+    )
+    test_queries = DataCollector.collect_benchmarks(DatabaseManager.get_test_databases(), False)
+    get_feature_contributions(model, test_queries, "test").print_report()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 import json
-from typing import Optional
+from typing import Callable, Optional
 
 import numpy as np
 
 from src.operator_stages import OperatorStage, ExecutionPhase
-from src.operators import OperatorType
+from src.operators import Operator, OperatorType
 from src.query_plan import QueryPlan
 from src.util import AutoNumber
 
@@ -227,7 +227,8 @@ class FeatureMapper:
     def get_empty_feature_vector(self) -> np.ndarray:
         return np.zeros(self.n_features, dtype=float)
 
-    def get_estimation_vector(self, phase: ExecutionPhase) -> np.ndarray:
+    @staticmethod
+    def get_feature_values(phase: ExecutionPhase) -> dict[Feature, float]:
         output_cardinality = phase.get_output_cardinality()
         input_cardinality = phase.get_input_cardinality()
         right_input_cardinality = phase.get_right_input_cardinality()
@@ -275,7 +276,30 @@ class FeatureMapper:
             Feature.empty_output: 1 if output_cardinality == 0 else 0,
         }
         assert len(Feature) == len(features) + len(Feature.get_global_features())
+        return features
 
+    @staticmethod
+    def get_feature_exponents(
+        phase: ExecutionPhase, input_exponent: int, output_exponent: int, right_exponent: int, scan_exponent: int
+    ) -> dict[Feature, int]:
+        """
+        If the input, output and right input cardinality of the operator and the scan cardinality of the pipeline are
+        multiplied by factor**exponent, each feature value is multiplied by factor**k, with k as returned here
+        (features that are not listed do not depend on cardinalities)
+        """
+        if phase.operator.type == OperatorType.HashJoin and phase.stage == OperatorStage.Build:
+            output_exponent = input_exponent
+        return {
+            Feature.in_card: input_exponent,
+            Feature.out_card: output_exponent,
+            Feature.right_card: right_exponent,
+            Feature.in_percentage: input_exponent - scan_exponent,
+            Feature.out_percentage: output_exponent - scan_exponent,
+            Feature.right_percentage: right_exponent - scan_exponent,
+        }
+
+    def get_estimation_vector(self, phase: ExecutionPhase) -> np.ndarray:
+        features = self.get_feature_values(phase)
         result = self.get_empty_feature_vector()
         assert (
             len(self.get_features(phase.operator.type, phase.stage)) > 0
@@ -310,6 +334,33 @@ class FeatureMapper:
             result.append(pipeline_vector)
         return np.vstack(result)
 
+    def get_pipeline_scaling_matrices(
+        self, query_plan: QueryPlan, get_exponents: Callable[[Operator], tuple[int, int, int]]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Split the pipeline estimation matrix by how the features change if cardinalities are scaled by a factor.
+        get_exponents returns for an operator the exponents of its input, output and right input cardinality,
+        i.e. each of them is multiplied by factor**exponent.
+        Returns matrices m with sum(m[k + 1] * factor**k for k in (-1, 0, 1)) being the scaled pipeline estimation
+        matrix and the exponent of the scan size of each pipeline.
+        """
+        matrices = np.zeros((3, len(query_plan.pipelines), self.n_features), dtype=float)
+        scan_exponents = np.zeros(len(query_plan.pipelines), dtype=int)
+        for i, pipeline in enumerate(query_plan.pipelines):
+            if len(pipeline.operators) == 0:
+                continue
+            input_exponent, output_exponent, _ = get_exponents(pipeline.operators[0].operator)
+            scan_exponents[i] = output_exponent if pipeline.scans_output_cardinality() else input_exponent
+            for phase in pipeline.operators:
+                features = self.get_feature_values(phase)
+                exponents = self.get_feature_exponents(phase, *get_exponents(phase.operator), scan_exponents[i])
+                for f in self.get_features(phase.operator.type, phase.stage):
+                    k = exponents.get(f.feature, 0)
+                    assert -1 <= k <= 1, f"unexpected exponent {k} for {f.get_name()}"
+                    value = features[f.feature]
+                    matrices[k + 1, i, self._index_lookup[f]] += np.nan if value is None else value
+        return matrices, scan_exponents
+
     def get_pipeline_estimation_matrices(self, query_plan: QueryPlan) -> list[np.ndarray]:
         """
         get a feature vector for each operator in each pipeline
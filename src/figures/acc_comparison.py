@@ -6,7 +6,7 @@ from src.database_manager import DatabaseManager
 from src.evaluation import QueryEstimationCache
 from src.figures.acc_comparison_zero_shot import get_zero_shot_pred_numbers
 from src.figures.infra import get_figure_path, setup_matplotlib_latex_font, get_hex_colors, get_figure_format
-from src.metrics import q_error
+from src.metrics import q_errors, error_statistics
 from src.train import optimize_all
 
 
@@ -39,8 +39,7 @@ def get_test_numbers(estimation_cache: QueryEstimationCache):
     benchmarks = DataCollector.collect_benchmarks(DatabaseManager.get_databases(["tpcdsSf100"]), True)
     runtimes = [b.get_total_runtime() for b in benchmarks]
     estimates = [estimation_cache.queries[q.name].estimated_time for q in benchmarks]
-    q_errors = [q_error(e, r) for e, r in zip(estimates, runtimes)]
-    return {"Avg": np.average(q_errors), "p50": np.quantile(q_errors, 0.5), "p90": np.quantile(q_errors, 0.9)}
+    return error_statistics(q_errors(runtimes, estimates))
 
 
 def comparison_plot(estimation_cache: QueryEstimationCache):
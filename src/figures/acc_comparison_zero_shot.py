@@ -4,7 +4,7 @@ from matplotlib import pyplot as plt
 from src.data_collection import DataCollector
 from src.database_manager import DatabaseManager
 from src.figures.infra import get_figure_path, setup_matplotlib_latex_font, get_hex_colors, get_figure_format
-from src.metrics import q_error
+from src.metrics import q_errors, error_statistics
 from src.optimizer import optimize_per_tuple_tree_model, QueryCategory
 
 
@@ -31,8 +31,7 @@ def get_test_numbers(predicted_cardinalities: bool):
     benchmarks = DataCollector.collect_benchmarks([job_db], predicted_cardinalities, query_category=[QueryCategory.fixed])
     runtimes = [b.get_total_runtime() for b in benchmarks]
     estimates = [model.estimate_runtime(q) for q in benchmarks]
-    q_errors = [q_error(e, r) for e, r in zip(estimates, runtimes)]
-    return {"Avg": np.average(q_errors), "p50": np.quantile(q_errors, 0.5), "p90": np.quantile(q_errors, 0.9)}
+    return error_statistics(q_errors(runtimes, estimates))
 
 
 def comparison_zero_shot_plot():
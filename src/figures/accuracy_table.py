@@ -1,9 +1,11 @@
+from tabulate import tabulate
+
 from src.train import optimize_all
 from src.data_collection import DataCollector
 from src.database_manager import DatabaseManager
-from src.evaluation import QueryEstimationCache, statistics_with_error_function, get_errors
+from src.evaluation import QueryEstimationCache
 from src.figures.infra import write_latex_file, set_figure_path
-from src.metrics import q_error
+from src.metrics import q_errors, error_statistics, statistics_table
 from src.optimizer import QueryCategory
 
 
@@ -60,9 +62,10 @@ def write_accuracy_table(estimation_cache: QueryEstimationCache):
     ]
     report = {}
     for n, queries in data:
+        runtimes = [q.get_total_runtime() for q in queries]
         estimates = [estimation_cache.queries[q.name].estimated_time for q in queries]
-        q_errors = get_errors(queries, estimates, q_error, None, None)
-        report[n] = statistics_with_error_function(q_errors, n, "Q-Error", False)
+        report[n] = error_statistics(q_errors(runtimes, estimates))
+    print(tabulate(statistics_table(report, "Queries"), headers="firstrow", floatfmt=".2f"))
 
     write_latex_file(
         latex_accuracy_table(report),
@@ -13,8 +13,9 @@ from src.figures.infra import (
     get_figure_path,
     get_figure_format,
 )
-from src.metrics import q_error
-from src.operators import OperatorType
+from src.metrics import q_errors, error_statistics
+from src.model import PerTupleTreeModel
+from src.operators import Operator, OperatorType
 from src.optimizer import optimize_per_tuple_tree_model, BenchmarkedQuery, QueryCategory
 
 ZERO_SHOT_CARD_DEGRADATION = {
@@ -510,6 +511,52 @@ def get_card_error_tree(original_query: BenchmarkedQuery, expected_q_error: floa
     return query
 
 
+def get_card_error_exponents(op: Operator) -> tuple[int, int, int]:
+    """
+    exponents of the input, output and right input cardinality of an operator as scaled by get_card_error_tree
+    """
+    input_exponent = 0 if op.type == OperatorType.TableScan else 1
+    output_exponent = 0 if op.type == OperatorType.GroupBy or op.output_cardinality == 1 else 1
+    return input_exponent, output_exponent, 1
+
+
+def estimate_card_errors(
+    model: PerTupleTreeModel, queries: list[BenchmarkedQuery], factors: np.ndarray, batch_size: int = 32
+) -> np.ndarray:
+    """
+    Same as estimating each query after get_card_error_tree for each factor, but the queries are featurized only once.
+    Returns the estimates with one row per factor and one column per query.
+    """
+    feature_mapper = model.get_feature_mapper()
+    matrices = []
+    scan_sizes = []
+    scan_exponents = []
+    labels = []
+    for i, q in enumerate(queries):
+        current_matrices, current_scan_exponents = feature_mapper.get_pipeline_scaling_matrices(
+            q.query_plan, get_card_error_exponents
+        )
+        matrices.append(current_matrices)
+        scan_sizes.append(feature_mapper.get_pipeline_scan_sizes(q.query_plan))
+        scan_exponents.append(current_scan_exponents)
+        labels += [i] * len(current_scan_exponents)
+    matrices = np.concatenate(matrices, axis=1)
+    scan_sizes = np.concatenate(scan_sizes).astype(float)
+    scan_exponents = np.concatenate(scan_exponents)
+    labels = np.array(labels)
+
+    # like get_card_error_tree, each query is randomly over- or underestimated
+    query_factors = factors[:, None] ** np.random.choice([-1, 1], size=(len(factors), len(queries)))
+    result = []
+    for start in range(0, len(factors), batch_size):
+        pipeline_factors = query_factors[start : start + batch_size, labels][:, :, None]
+        x = matrices[0] / pipeline_factors + matrices[1] + matrices[2] * pipeline_factors
+        current_scan_sizes = scan_sizes * pipeline_factors[:, :, 0] ** scan_exponents
+        pred = model.predict(x.reshape(-1, x.shape[2]), current_scan_sizes.reshape(-1)).reshape(len(x), -1)
+        result += [np.bincount(labels, weights=p, minlength=len(queries)) for p in pred]
+    return np.vstack(result)
+
+
 def compute_card_degen():
     train, test = split_databases("job")
     test_benchmarks = DataCollector.collect_benchmarks(test, False, query_category=[QueryCategory.fixed])
@@ -519,10 +566,6 @@ def compute_card_degen():
     )
     model = optimize_per_tuple_tree_model(train_lim_benchmarks)
 
-    p50s = []
-    p90s = []
-    avgs = []
-
     errs = np.hstack(
         [
             np.arange(1.0, 10, 0.1),
@@ -532,21 +575,13 @@ def compute_card_degen():
         ]
     )
     print("Computing accuracy with degenerated cardinalities...")
-    for q_err in errs:
-        err_queries = []
-        for q in test_benchmarks:
-            err_queries.append(get_card_error_tree(q, q_err))
-
-        runtimes = [b.get_total_runtime() for b in err_queries]
-        estimates = [model.estimate_runtime(b) for b in err_queries]
-        q_errors = [q_error(e, r) for e, r in zip(estimates, runtimes)]
-        p50s.append(np.quantile(q_errors, 0.5))
-        p90s.append(np.quantile(q_errors, 0.9))
-        avgs.append(np.average(q_errors))
+    runtimes = np.array([b.get_total_runtime() for b in test_benchmarks])
+    estimates = estimate_card_errors(model, test_benchmarks, errs)
 
     stats = {}
-    for err, p50, p90, avg in zip(errs, p50s, p90s, avgs):
-        stats[float(err)] = (float(p50), float(p90), float(avg))
+    for err, current_estimates in zip(errs, estimates):
+        statistics = error_statistics(q_errors(runtimes, current_estimates))
+        stats[float(err)] = (statistics["p50"], statistics["p90"], statistics["Avg"])
     return stats
 
 
@@ -4,14 +4,13 @@ from matplotlib import pyplot as plt
 from src.data_collection import DataCollector
 from src.database_manager import DatabaseManager
 from src.figures.infra import get_figure_path, setup_matplotlib_latex_font, get_hex_colors, get_figure_format
-from src.metrics import q_error
+from src.metrics import q_errors, error_statistics
 from src.optimizer import optimize_per_tuple_tree_model, BenchmarkedQuery, QueryCategory
 
 
 def get_test_numbers(model, benchmarks, runtimes):
     estimates = [model.estimate_runtime(b) for b in benchmarks]
-    q_errors = [q_error(e, r) for e, r in zip(estimates, runtimes)]
-    return {"Avg": np.average(q_errors), "p50": np.quantile(q_errors, 0.5), "p90": np.quantile(q_errors, 0.9)}
+    return error_statistics(q_errors(runtimes, estimates))
 
 
 def trim_benchmark_runs(benchmarks: list[BenchmarkedQuery], n: int) -> list[BenchmarkedQuery]:
@@ -99,7 +98,17 @@ def get_accumulated_benchmark_time():
     print(f"Total benchmark time: {sum(b.total_runtimes[0] for b in benchmarks)}")
 
 
+def print_clean_benchmark_counts():
+    """
+    clean and all training queries per database, from the cached verdicts (only new results are checked)
+    """
+    for db_name, verdicts in DataCollector.get_integrity_verdicts(DatabaseManager.get_train_databases()).items():
+        n_clean = sum(v.is_valid() for v in verdicts.values())
+        print(f"{db_name}: {n_clean}/{len(verdicts)} clean queries")
+
+
 def clean_benchmark_figure():
+    print_clean_benchmark_counts()
     results = benchmark_size_reports()
     eval_benchmarks(results)
 
@@ -2,12 +2,12 @@ from tabulate import tabulate
 
 from src.data_collection import DataCollector
 from src.database_manager import DatabaseManager
-from src.evaluation import QueryEstimationCache, get_errors, statistics_with_error_function
+from src.evaluation import QueryEstimationCache
 from src.figures.acc_comparison import get_stage_pred_numbers, get_auto_wlm_pred_numbers
 from src.figures.acc_comparison_zero_shot import get_zero_shot_exact_numbers, get_zero_shot_pred_numbers
 from src.figures.accuracy_table import latex_accuracy_table
 from src.figures.cardinality_degradation import split_databases
-from src.metrics import q_error
+from src.metrics import q_errors, error_statistics
 from src.optimizer import optimize_per_tuple_tree_model, QueryCategory
 from src.train import optimize_all
 
@@ -61,9 +61,9 @@ def detailed_accuracy_table():
 
     report = {}
     for n, queries, estimation_cache in data:
+        runtimes = [q.get_total_runtime() for q in queries]
         estimates = [estimation_cache.queries[q.name].estimated_time for q in queries]
-        q_errors = get_errors(queries, estimates, q_error, None, None)
-        report[n] = statistics_with_error_function(q_errors, n, "Q-Error", False)
+        report[n] = error_statistics(q_errors(runtimes, estimates))
 
     report.update(
         {
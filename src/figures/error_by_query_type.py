@@ -5,7 +5,7 @@ from src.data_collection import DataCollector
 from src.database_manager import DatabaseManager
 from src.evaluation import QueryEstimationCache
 from src.figures.infra import setup_matplotlib_latex_font, get_figure_path, get_figure_format
-from src.metrics import q_error
+from src.metrics import q_errors, grouped_error_statistics
 from src.optimizer import QueryCategory
 from src.train import optimize_all
 
@@ -16,24 +16,21 @@ def get_error_by_query_hist(estimation_cache: QueryEstimationCache):
     dbs = DatabaseManager.get_test_databases()
     benchmarks = DataCollector.collect_benchmarks(dbs, False)
 
-    categories = {c: [] for c in QueryCategory}
-    for b in benchmarks:
-        if b.query_category not in categories:
-            categories[b.query_category] = []
-        categories[b.query_category].append(b)
+    runtimes = [b.get_total_runtime() for b in benchmarks]
+    estimates = [estimation_cache.queries[b.name].estimated_time for b in benchmarks]
+    statistics = grouped_error_statistics(q_errors(runtimes, estimates), [b.query_category.name for b in benchmarks])
 
     names = []
     p50s = []
     p90s = []
     avgs = []
-    for category, benchmarks in categories.items():
+    for category in QueryCategory:
+        if category.name not in statistics:
+            continue
         names.append(category.get_name())
-        runtimes = [b.get_total_runtime() for b in benchmarks]
-        estimates = [estimation_cache.queries[q.name].estimated_time for q in benchmarks]
-        q_errors = [q_error(e, r) for e, r in zip(estimates, runtimes)]
-        p50s.append(np.quantile(q_errors, 0.5))
-        p90s.append(np.quantile(q_errors, 0.9))
-        avgs.append(np.average(q_errors))
+        p50s.append(statistics[category.name]["p50"])
+        p90s.append(statistics[category.name]["p90"])
+        avgs.append(statistics[category.name]["Avg"])
 
     plt.figure(figsize=(6, 2.5))
 
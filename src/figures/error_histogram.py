@@ -5,7 +5,7 @@ from src.data_collection import DataCollector
 from src.database_manager import DatabaseManager
 from src.evaluation import QueryEstimationCache
 from src.figures.infra import setup_matplotlib_latex_font, get_figure_path, get_figure_format
-from src.metrics import q_error
+from src.metrics import q_errors
 from src.train import optimize_all
 
 
@@ -17,8 +17,7 @@ def get_error_histogram(estimation_cache: QueryEstimationCache):
     runtimes = [b.get_total_runtime() for b in benchmarks]
 
     estimates = [estimation_cache.queries[q.name].estimated_time for q in benchmarks]
-    q_errors = [q_error(e, r) for e, r in zip(estimates, runtimes)]
-    data = np.array(q_errors)
+    data = q_errors(runtimes, estimates)
     data1 = data[data < 20]
     data2 = data[data >= 20]
 
@@ -5,7 +5,7 @@ from src.data_collection import DataCollector
 from src.database_manager import DatabaseManager
 from src.evaluation import QueryEstimationCache
 from src.figures.infra import setup_matplotlib_latex_font, get_figure_path, get_hex_colors, get_figure_format
-from src.metrics import q_error
+from src.metrics import q_errors, error_statistics
 from src.model import Model
 from src.optimizer import optimize_per_tuple_tree_model
 from src.train import optimize_all
@@ -40,11 +40,10 @@ def eval_card_est(estimation_caches: list[QueryEstimationCache]):
     for estimation_cache in estimation_caches:
         runtimes = [b.get_total_runtime() for b in benchmarks]
         estimates = [estimation_cache.queries[b.name].estimated_time for b in benchmarks]
-        q_errors = [q_error(e, r) for e, r in zip(estimates, runtimes)]
-
-        p50s.append(np.quantile(q_errors, 0.5))
-        p90s.append(np.quantile(q_errors, 0.9))
-        avgs.append(np.average(q_errors))
+        statistics = error_statistics(q_errors(runtimes, estimates))
+        p50s.append(statistics["p50"])
+        p90s.append(statistics["p90"])
+        avgs.append(statistics["Avg"])
 
     fig, axs = plt.subplots(1, 3, figsize=(6, 2.5))
     x = np.arange(len(names))
@@ -5,7 +5,7 @@ from src.data_collection import DataCollector
 from src.database import Database
 from src.database_manager import DatabaseManager
 from src.figures.infra import get_figure_path, setup_matplotlib_latex_font, get_figure_format
-from src.metrics import q_error
+from src.metrics import q_errors, error_statistics
 from src.model import Model
 from src.optimizer import optimize_per_tuple_tree_model
 
@@ -46,11 +46,10 @@ def eval_dbs(dbs: list[tuple[Model, list[Database], str]]):
         benchmarks = DataCollector.collect_benchmarks(db, False)
         runtimes = [b.get_total_runtime() for b in benchmarks]
         estimates = [model.estimate_runtime(b) for b in benchmarks]
-        q_errors = [q_error(e, r) for e, r in zip(estimates, runtimes)]
-
-        p50s.append(np.quantile(q_errors, 0.5))
-        p90s.append(np.quantile(q_errors, 0.9))
-        avgs.append(np.average(q_errors))
+        statistics = error_statistics(q_errors(runtimes, estimates))
+        p50s.append(statistics["p50"])
+        p90s.append(statistics["p90"])
+        avgs.append(statistics["Avg"])
 
     plt.figure(figsize=(6, 2.5))
 
@@ -4,7 +4,7 @@ from matplotlib import pyplot as plt
 from src.data_collection import DataCollector
 from src.database_manager import DatabaseManager
 from src.figures.infra import get_figure_path, setup_matplotlib_latex_font, get_hex_colors, get_figure_format
-from src.metrics import q_error
+from src.metrics import q_errors, error_statistics
 from src.optimizer import (
     optimize_per_tuple_tree_model,
     optimize_flat_tree_model,
@@ -13,8 +13,7 @@ from src.optimizer import (
 
 def get_test_numbers(model, benchmarks, runtimes):
     estimates = [model.estimate_runtime(b) for b in benchmarks]
-    q_errors = [q_error(e, r) for e, r in zip(estimates, runtimes)]
-    return {"Avg": np.average(q_errors), "p50": np.quantile(q_errors, 0.5), "p90": np.quantile(q_errors, 0.9)}
+    return error_statistics(q_errors(runtimes, estimates))
 
 
 def benchmark_size_reports() -> list[tuple[str, dict]]:
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.metrics import q_errors
+
+# runs that deviate from the median by less than this (in seconds) are no outliers, above it the q-error is checked
+ACCEPTABLE_ABSOLUTE_ERROR = 0.002
+ACCEPTABLE_Q_ERROR = 1.10
+ACCEPTABLE_FRACTION_OF_OUTLIERS = 1 / 3
+MINIMAL_NUMBER_OF_NON_OUTLIERS = 2
+MINIMAL_RUNS = 3
+ACCEPTABLE_ANALYZE_PLAN_DURATION_Q_ERROR = 1.2
+
+
+@dataclass
+class IntegrityVerdict:
+    """
+    result of the integrity checks of one benchmarked query
+    """
+
+    runtimes: bool  # enough runs and a bounded number of outliers
+    analyze_plan_duration: bool  # the analyze plan duration matches the benchmarked runtime
+
+    def is_valid(self) -> bool:
+        return self.runtimes and self.analyze_plan_duration
+
+
+def get_median_runs(times: np.ndarray) -> np.ndarray:
+    """
+    median run of each row, the lower one of the two middle runs for an even number of runs (like arg_median)
+    """
+    k = (times.shape[1] - 1) // 2
+    return np.partition(times, k, axis=1)[:, k]
+
+
+def check_runtimes(runtimes: list[list[float]]) -> np.ndarray:
+    """
+    vectorized DataCollector.check_runtimes_integrity, queries with the same number of runs are checked together
+    """
+    result = np.zeros(len(runtimes), dtype=bool)
+    by_n_runs: dict[int, list[int]] = {}
+    for i, times in enumerate(runtimes):
+        by_n_runs.setdefault(len(times), []).append(i)
+    for n_runs, indices in by_n_runs.items():
+        if n_runs < MINIMAL_RUNS:
+            continue
+        times = np.array([runtimes[i] for i in indices], dtype=float)
+        med = get_median_runs(times)[:, None]
+        outlier_mask = (q_errors(med, times) > ACCEPTABLE_Q_ERROR) & (np.abs(times - med) >= ACCEPTABLE_ABSOLUTE_ERROR)
+        n_non_outliers = n_runs - np.sum(outlier_mask, axis=1)
+        minimal_non_outliers = max(MINIMAL_NUMBER_OF_NON_OUTLIERS, int((1 - ACCEPTABLE_FRACTION_OF_OUTLIERS) * n_runs))
+        result[indices] = n_non_outliers >= minimal_non_outliers
+    return result
+
+
+def check_analyze_plan_durations(runtimes: list[list[float]], analyze_plan_runtimes: list[float]) -> np.ndarray:
+    """
+    vectorized DataCollector.check_analyze_plan_duration_integrity
+    """
+    if len(runtimes) == 0:
+        return np.zeros(0, dtype=bool)
+    medians = np.array([np.median(times) for times in runtimes])
+    return q_errors(medians, analyze_plan_runtimes) <= ACCEPTABLE_ANALYZE_PLAN_DURATION_Q_ERROR
+
+
+def get_verdicts(runtimes: list[list[float]], analyze_plan_runtimes: list[float]) -> list[IntegrityVerdict]:
+    runtimes_ok = check_runtimes(runtimes)
+    durations_ok = check_analyze_plan_durations(runtimes, analyze_plan_runtimes)
+    return [IntegrityVerdict(bool(r), bool(d)) for r, d in zip(runtimes_ok, durations_ok)]
@@ -0,0 +1,131 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+CPU_SYSFS_PATH = "/sys/devices/system/cpu"
+PROC_STAT_PATH = "/proc/stat"
+
+
+@dataclass
+class MeasurementSettings:
+    """
+    Noise controls of the benchmark runs. By default, runs are only tagged, not repeated.
+    """
+
+    client_cpus: Optional[list[int]] = None  # the benchmark client is pinned to these cpus
+    n_warmup_runs: int = 0  # discarded runs before the measured runs of each query
+    n_reruns: int = 0  # a suspicious run is repeated up to this many times
+    max_interference: float = 0.1  # share of the server cpus' time used by other processes during a run
+    max_frequency_change: float = 0.1  # relative change of the average frequency during a run
+
+
+def read_sysfs(path: Path) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def get_cpus(cpus: Optional[list[int]]) -> list[int]:
+    return sorted(cpus if cpus is not None else os.sched_getaffinity(0))
+
+
+def get_governors(cpus: Optional[list[int]] = None) -> list[str]:
+    """
+    scaling governors of the cpus (all if None), they do not change during a benchmark, so they are only recorded
+    with the environment
+    """
+    governors = {read_sysfs(Path(f"{CPU_SYSFS_PATH}/cpu{c}/cpufreq/scaling_governor")) for c in get_cpus(cpus)}
+    return sorted(g for g in governors if g is not None)
+
+
+def get_cpu_times(cpus: list[int]) -> tuple[int, int]:
+    """
+    busy and total clock ticks of the cpus since boot
+    """
+    busy = 0
+    total = 0
+    names = {f"cpu{c}" for c in cpus}
+    with open(PROC_STAT_PATH, "r") as f:
+        for line in f:
+            fields = line.split()
+            if fields[0] in names:
+                # user nice system idle iowait irq softirq steal, guest times are included in user and nice
+                times = [int(x) for x in fields[1:9]]
+                busy += sum(times) - times[3] - times[4]
+                total += sum(times)
+    return busy, total
+
+
+def get_process_cpu_time(pid: int) -> Optional[int]:
+    """
+    user and system clock ticks of the process and its threads, None if it does not exist anymore
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            # the command name in parentheses may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return int(fields[11]) + int(fields[12])
+
+
+def get_system_state(cpus: Optional[list[int]] = None, pid: Optional[int] = None) -> dict:
+    """
+    average frequency (MHz) and clock ticks of the cpus (all if None), and the cpu time of the server process if its
+    pid is known, missing values are None
+    """
+    cpus = get_cpus(cpus)
+    frequencies = [read_sysfs(Path(f"{CPU_SYSFS_PATH}/cpu{c}/cpufreq/scaling_cur_freq")) for c in cpus]
+    frequencies = [int(f) / 1000 for f in frequencies if f is not None]
+    busy, total = get_cpu_times(cpus)
+    return {
+        "frequency": sum(frequencies) / len(frequencies) if len(frequencies) > 0 else None,
+        "busy_ticks": busy,
+        "total_ticks": total,
+        "server_ticks": get_process_cpu_time(pid) if pid is not None else None,
+    }
+
+
+def get_interference(before: dict, after: dict) -> Optional[float]:
+    """
+    share of the time of the server cpus that other processes used between the two states, None if the server's cpu
+    time is unknown or the run was shorter than a clock tick
+    """
+    if before["server_ticks"] is None or after["server_ticks"] is None:
+        return None
+    total = after["total_ticks"] - before["total_ticks"]
+    if total <= 0:
+        return None
+    other = (after["busy_ticks"] - before["busy_ticks"]) - (after["server_ticks"] - before["server_ticks"])
+    return max(0.0, other / total)
+
+
+def get_suspicious_reasons(before: dict, after: dict, settings: MeasurementSettings) -> list[str]:
+    """
+    transient reasons why a run between the two system states might be noisy, empty if there are none
+    """
+    result = []
+    interference = get_interference(before, after)
+    if interference is not None and interference > settings.max_interference:
+        result.append("interference")
+    if before["frequency"] is not None and after["frequency"] is not None:
+        if abs(after["frequency"] - before["frequency"]) > settings.max_frequency_change * before["frequency"]:
+            result.append("frequency")
+    return result
+
+
+def pin_client(settings: MeasurementSettings):
+    if settings.client_cpus is not None:
+        os.sched_setaffinity(0, settings.client_cpus)
+
+
+def get_isolated_cpus() -> tuple[list[int], list[int]]:
+    """
+    the last available cpu is reserved for the benchmark client, the others for the servers
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    assert len(cpus) > 1, "need at least two cpus to isolate the client from the servers"
+    return cpus[-1:], cpus[:-1]
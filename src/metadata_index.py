@@ -0,0 +1,120 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from src.database import Database
+from src.results_log import ResultsManifest
+
+METADATA_INDEX_PATH = "data/metadata_index"
+# upper bounds (in seconds) of the runtime buckets, the last bucket is unbounded
+RUNTIME_BUCKETS = [0.001, 0.01, 0.1, 1.0]
+
+
+@dataclass
+class QueryMetadata:
+    db: str
+    category: str
+    name: str
+    median_runtime: float  # in seconds
+    query_hash: str
+
+    def get_runtime_bucket(self) -> str:
+        return get_runtime_bucket(self.median_runtime)
+
+
+def get_runtime_bucket(runtime: float) -> str:
+    lower = 0.0
+    for upper in RUNTIME_BUCKETS:
+        if runtime < upper:
+            return f"{lower * 1000:g}-{upper * 1000:g} ms"
+        lower = upper
+    return f">= {lower * 1000:g} ms"
+
+
+def get_query_hash(query_text: str) -> str:
+    return hashlib.sha1(query_text.encode("utf-8")).hexdigest()
+
+
+class MetadataIndex:
+    """
+    Median runtime, category and query text hash of each benchmarked query of a database, the query texts are stored
+    once per hash. The index is updated incrementally: only results that are new or were run again since the last
+    update (see ResultsManifest.get_version) are read.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.path = Path(f"{METADATA_INDEX_PATH}/{db.get_path()}.json")
+        self.entries: dict[str, tuple[str, float, str]] = {}
+        self.queries: dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.entries = {k: tuple(v) for k, v in data["entries"].items()}
+            self.queries = data["queries"]
+
+    def write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({"entries": self.entries, "queries": self.queries}, f)
+
+    def update(self):
+        manifest = ResultsManifest(self.db)
+        keys = manifest.get_keys()
+        versions = {f"{c}/{n}": manifest.get_version(c, n) for c, n in keys}
+        missing = [(c, n) for c, n in keys if self.entries.get(f"{c}/{n}", (None,))[0] != versions[f"{c}/{n}"]]
+        removed = [k for k in self.entries if k not in versions]
+        for k in removed:
+            del self.entries[k]
+        for category, name, benchmark_json in manifest.iterate(missing):
+            query_text = benchmark_json["plan"]["query_text"]
+            query_hash = get_query_hash(query_text)
+            median_runtime = float(np.median([b["executionTime"] for b in benchmark_json["benchmarks"]]))
+            self.entries[f"{category}/{name}"] = (versions[f"{category}/{name}"], median_runtime, query_hash)
+            self.queries[query_hash] = query_text
+        if len(missing) > 0 or len(removed) > 0:
+            used = {e[2] for e in self.entries.values()}
+            self.queries = {h: q for h, q in self.queries.items() if h in used}
+            self.write()
+
+    def get_metadata(self) -> list[QueryMetadata]:
+        """
+        ordered by category and name
+        """
+        result = []
+        for key in sorted(self.entries, key=lambda k: tuple(k.split("/", 1))):
+            category, name = key.split("/", 1)
+            _, median_runtime, query_hash = self.entries[key]
+            result.append(QueryMetadata(self.db.get_search_path(), category, name, median_runtime, query_hash))
+        return result
+
+    def get_query(self, query_hash: str) -> str:
+        return self.queries[query_hash]
+
+    def get_query_texts(self) -> frozenset[str]:
+        return frozenset(self.queries.values())
+
+
+def get_metadata_indexes(dbs: list[Database]) -> list[MetadataIndex]:
+    result = []
+    for db in dbs:
+        index = MetadataIndex(db)
+        index.update()
+        result.append(index)
+    return result
+
+
+def group_metadata(
+    metadata: list[QueryMetadata], key: Callable[[QueryMetadata], str]
+) -> dict[str, list[QueryMetadata]]:
+    """
+    slices the metadata, e.g. by db, category or runtime bucket, the groups keep the order of the metadata
+    """
+    result = {}
+    for m in metadata:
+        result.setdefault(key(m), []).append(m)
+    return result
@@ -1,4 +1,7 @@
+import numpy as np
+
 Q_ERROR_CUTOFF = 1e-10
+STATISTICS_QUANTILES = {"p10": 0.1, "p50": 0.5, "p90": 0.9, "p95": 0.95}
 
 
 def q_error(real: float, estimate: float) -> float:
@@ -13,3 +16,64 @@ def q_error(real: float, estimate: float) -> float:
 
 def abs_error(real: float, estimate: float) -> float:
     return max(real - estimate, estimate - real)
+
+
+def q_errors(real, estimates) -> np.ndarray:
+    """
+    vectorized q_error
+    """
+    real = np.asarray(real, dtype=float)
+    estimates = np.asarray(estimates, dtype=float)
+    assert np.all(real >= 0), f"real runtimes should be >= 0 but the minimum is {np.min(real)}"
+    assert np.all(estimates >= 0)
+    real = np.maximum(real, Q_ERROR_CUTOFF)
+    estimates = np.maximum(estimates, Q_ERROR_CUTOFF)
+    return np.maximum(real / estimates, estimates / real)
+
+
+def abs_errors(real, estimates) -> np.ndarray:
+    """
+    vectorized abs_error
+    """
+    return np.abs(np.asarray(real, dtype=float) - np.asarray(estimates, dtype=float))
+
+
+def error_statistics(errors) -> dict[str, float]:
+    """
+    empty for no errors (e.g. an empty category or database split)
+    """
+    errors = np.asarray(errors, dtype=float)
+    if len(errors) == 0:
+        return {}
+    quantiles = np.quantile(errors, list(STATISTICS_QUANTILES.values()))
+    result = {"Avg": float(np.average(errors))}
+    result.update({name: float(q) for name, q in zip(STATISTICS_QUANTILES.keys(), quantiles)})
+    result["Max"] = float(np.max(errors))
+    return result
+
+
+def grouped_error_statistics(errors, groups) -> dict:
+    """
+    error_statistics per group, groups are labels (e.g. database or category names) with one entry per error
+    """
+    errors = np.asarray(errors, dtype=float)
+    groups = np.asarray(groups)
+    assert len(errors) == len(groups)
+    if len(errors) == 0:
+        return {}
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    boundaries = np.flatnonzero(sorted_groups[1:] != sorted_groups[:-1]) + 1
+    starts = np.concatenate([[0], boundaries])
+    return {
+        sorted_groups[start].item(): error_statistics(group_errors)
+        for start, group_errors in zip(starts, np.split(errors[order], boundaries))
+    }
+
+
+def statistics_table(reports: dict[str, dict[str, float]], group_name: str) -> list[list]:
+    """
+    one row per group with all statistics, the first row is the header
+    """
+    columns = ["Avg", *STATISTICS_QUANTILES.keys(), "Max"]
+    return [[group_name, *columns]] + [[group, *(report[c] for c in columns)] for group, report in reports.items()]
@@ -1,3 +1,4 @@
+import hashlib
 from abc import ABC, abstractmethod
 
 import lightgbm as lgb
@@ -22,6 +23,15 @@ class Model(ABC):
     def get_feature_mapper(self) -> FeatureMapper:
         pass
 
+    def estimate_many_pipeline_runtimes(self, queries: list["BenchmarkedQuery"]) -> list[list[float]]:
+        return [self.estimate_pipeline_runtime(q) for q in queries]
+
+    def get_hash(self) -> str:
+        """
+        identifies the trained model, e.g. to persist its estimates
+        """
+        return hashlib.md5(f"{type(self).__name__}\n{self.tree.model_to_string()}".encode("utf-8")).hexdigest()
+
 
 class TreeModel(Model):
     """
@@ -92,6 +102,18 @@ class PerTupleTreeModel(Model):
         pred = self.predict(x, scan_sizes)
         return [max(0.0, float(e)) for e in pred]
 
+    def estimate_many_pipeline_runtimes(self, queries: list["BenchmarkedQuery"]) -> list[list[float]]:
+        """
+        a single predict call for the pipelines of all queries
+        """
+        if len(queries) == 0:
+            return []
+        feature_matrices = [q.get_feature_matrix(self._feature_mapper) for q in queries]
+        scan_sizes = np.concatenate([self._feature_mapper.get_pipeline_scan_sizes(q.query_plan) for q in queries])
+        pred = self.predict(np.vstack(feature_matrices), scan_sizes)
+        splits = np.cumsum([len(m) for m in feature_matrices])[:-1]
+        return [[max(0.0, float(e)) for e in query_pred] for query_pred in np.split(pred, splits)]
+
     def predict(
         self,
         x,
@@ -106,22 +128,67 @@ class PerTupleTreeModel(Model):
         pred[pred < 0] = 0.0
         return pred
 
-    def estimate_many(self, queries: list[QueryPlan]) -> list[float]:
+    def predict_contributions(self, x) -> np.ndarray:
+        """
+        Contribution of each feature to the log of the per-tuple time (positive values make a pipeline slower),
+        the last column is the expected value. exp(sum) * scan size is the prediction of non-empty pipelines.
+        """
+        return -self.tree.predict(x, pred_contrib=True)
+
+    @staticmethod
+    def get_estimation_data(
+        feature_mapper: FeatureMapper, queries: list[QueryPlan]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        pipeline vectors and scan sizes of all queries, labels map each pipeline to the index of its query
+        """
         labels = []
         scan_sizes = []
         pipeline_vectors = []
         for i, q in enumerate(queries):
-            current_pipeline_vectors = self._feature_mapper.get_pipeline_estimation_matrix(q)
-            current_scan_sizes = self._feature_mapper.get_pipeline_scan_sizes(q)
+            current_pipeline_vectors = feature_mapper.get_pipeline_estimation_matrix(q)
+            current_scan_sizes = feature_mapper.get_pipeline_scan_sizes(q)
             pipeline_vectors += [v for v in current_pipeline_vectors]
             scan_sizes += [s for s in current_scan_sizes]
             labels += [i] * len(current_scan_sizes)
-        scan_sizes = np.array(scan_sizes)
-        pipeline_vectors = np.array(pipeline_vectors)
-        labels = np.array(labels)
+        return np.array(pipeline_vectors), np.array(scan_sizes), np.array(labels)
+
+    def estimate_many(self, queries: list[QueryPlan]) -> list[float]:
+        pipeline_vectors, scan_sizes, labels = self.get_estimation_data(self._feature_mapper, queries)
         pred = self.predict(pipeline_vectors, scan_sizes)
         query_preds = np.bincount(labels, weights=pred)
         return query_preds
 
     def get_feature_mapper(self) -> FeatureMapper:
         return self._feature_mapper
+
+
+class PerTupleTreeEnsemble:
+    """
+    Per tuple tree models trained on bootstrap samples, the spread of their estimates measures the model uncertainty
+    """
+
+    def __init__(self, trees: list[lgb.Booster]):
+        self.models: list[PerTupleTreeModel] = [PerTupleTreeModel(tree) for tree in trees]
+        self._feature_mapper = FeatureMapper()
+
+    def estimate_many(self, queries: list[QueryPlan]) -> np.ndarray:
+        """
+        returns a matrix with one row of query estimates per model
+        """
+        pipeline_vectors, scan_sizes, labels = PerTupleTreeModel.get_estimation_data(self._feature_mapper, queries)
+        result = []
+        for model in self.models:
+            pred = model.predict(pipeline_vectors, scan_sizes)
+            result.append(np.bincount(labels, weights=pred, minlength=len(queries)))
+        return np.vstack(result)
+
+    def get_uncertainty(self, queries: list[QueryPlan]) -> np.ndarray:
+        """
+        standard deviation of the log estimates, i.e. the disagreement of the models relative to the runtime
+        """
+        estimates = np.maximum(self.estimate_many(queries), 1e-6)
+        return np.std(np.log(estimates), axis=0)
+
+    def get_feature_mapper(self) -> FeatureMapper:
+        return self._feature_mapper
@@ -94,10 +94,16 @@ class Pipeline:
             if op.operator.op_id == op_id:
                 return op
 
+    def scans_output_cardinality(self) -> bool:
+        """
+        pipelines starting with a materializing operator scan its output, all others scan the input of the first operator
+        """
+        return self.operators[0].operator.type in (OperatorType.GroupBy, OperatorType.Sort, OperatorType.Temp)
+
     def get_pipeline_scan_cardinality(self) -> float:
         if len(self.operators) == 0:
             return 0
-        if self.operators[0].operator.type in (OperatorType.GroupBy, OperatorType.Sort, OperatorType.Temp):
+        if self.scans_output_cardinality():
             return self.operators[0].operator.output_cardinality
         return self.operators[0].operator.input_cardinality
 
@@ -83,6 +83,25 @@ class Operator:
         return 1
 
 
+@dataclass
+class CardinalityOverride:
+    """
+    what-if cardinalities of an operator, None keeps the current value
+    """
+
+    output_cardinality: Optional[float] = None
+    input_cardinality: Optional[float] = None
+    right_input_cardinality: Optional[float] = None
+
+    def apply(self, op: Operator):
+        if self.output_cardinality is not None:
+            op.output_cardinality = self.output_cardinality
+        if self.input_cardinality is not None:
+            op.input_cardinality = self.input_cardinality
+        if self.right_input_cardinality is not None:
+            op.right_input_cardinality = self.right_input_cardinality
+
+
 def parse_operator_type(op: dict) -> OperatorType:
     name = op["operator"]
     name = name.rstrip(digits)
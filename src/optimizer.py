@@ -7,7 +7,7 @@ import lightgbm as lgb
 from sklearn.model_selection import train_test_split
 
 from src.metrics import q_error
-from src.model import FeatureMapper, TreeModel, PerTupleTreeModel, FlatTreeModel
+from src.model import FeatureMapper, TreeModel, PerTupleTreeModel, FlatTreeModel, PerTupleTreeEnsemble
 from src.operators import OperatorType
 from src.query_plan import QueryPlan
 from src.util import AutoNumber
@@ -221,8 +221,9 @@ def optimize_flat_tree_model(queries: list[BenchmarkedQuery], verbose: bool = Fa
     return FlatTreeModel(bst)
 
 
-def optimize_per_tuple_tree_model(queries: list[BenchmarkedQuery], verbose: bool = False) -> PerTupleTreeModel:
-    feature_mapper = FeatureMapper()
+def get_per_tuple_training_data(
+    queries: list[BenchmarkedQuery], feature_mapper: FeatureMapper
+) -> tuple[np.ndarray, np.ndarray]:
     x_vectors = []
     y_values = []
     for query in queries:
@@ -230,11 +231,18 @@ def optimize_per_tuple_tree_model(queries: list[BenchmarkedQuery], verbose: bool
             if np.any(x != 0):
                 x_vectors.append(x)
                 y_values.append(y)
+    assert len(x_vectors) > 0, "no benchmarked pipelines to train on"
     x = np.vstack(x_vectors)
     y = np.array(y_values)
     # log scale improves training
     y = np.maximum(y, 1e-15)
     y = -np.log(y)
+    return x, y
+
+
+def optimize_per_tuple_tree_model(queries: list[BenchmarkedQuery], verbose: bool = False) -> PerTupleTreeModel:
+    feature_mapper = FeatureMapper()
+    x, y = get_per_tuple_training_data(queries, feature_mapper)
     seed = 21
     param = {"objective": "mape", "verbose": 2 if verbose else -1}
     x_train, x_val, y_train, y_val = train_test_split(x, y, test_size=0.2, random_state=seed)
@@ -255,3 +263,25 @@ def optimize_per_tuple_tree_model(queries: list[BenchmarkedQuery], verbose: bool
         for bench, y_true, y_pred in list(zip(queries, y, bst.predict(x))):
             print(f"{bench.name}: estimated time: {y_pred:.3f}, true time: {y_true:.3f}")
     return PerTupleTreeModel(bst)
+
+
+def optimize_per_tuple_tree_ensemble(
+    queries: list[BenchmarkedQuery], n_models: int = 5, verbose: bool = False
+) -> PerTupleTreeEnsemble:
+    """
+    Trains each model on a bootstrap sample of the pipelines, the models are not written to model.txt
+    """
+    feature_mapper = FeatureMapper()
+    x, y = get_per_tuple_training_data(queries, feature_mapper)
+    param = {"objective": "mape", "verbose": 2 if verbose else -1}
+    trees = []
+    for seed in range(n_models):
+        sample = np.random.default_rng(seed).integers(0, len(y), len(y))
+        train_data = lgb.Dataset(x[sample], label=y[sample], feature_name=FeatureMapper.get_names(), params=param)
+        bst = lgb.Booster(param, train_data)
+        for _ in range(200):
+            bst.update()
+        if verbose:
+            print(seed + 1, bst.eval_train())
+        trees.append(bst)
+    return PerTupleTreeEnsemble(trees)
@@ -152,7 +152,7 @@ def sample_group_by_query(
         if not can_have_selection(in_table):
             return sample_group_by_query(schema, select_input, statement_separator, pseudo_group_by, complex_select)
         if complex_select:
-            where_clause = f"WHERE {sample_complex_selection(in_table).get_where_string()}"
+            where_clause = f"WHERE {sample_complex_selection(in_table).get_where_string()}{statement_separator}"
         else:
             selection = sample_uniform_selection(in_table)
             where_clause = f"WHERE {selection.get_where_string()}{statement_separator}"
@@ -0,0 +1,271 @@
+import json
+import random
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from src.database import Database
+from src.database_manager import DatabaseManager
+from src.optimizer import QueryCategory
+from src.query_generation.aggregations import sample_group_by_query
+from src.query_generation.join_agg import generate_join_agg_query, generate_join_simple_agg_query
+from src.query_generation.join_graph import generate_join_query
+from src.query_generation.prefilter import QueryPrefilter, read_max_estimated_work
+from src.query_generation.selections import SelectionFactory, sample_complex_selection_query
+from src.query_generation.window_function import WindowFunctionFactory
+
+CORPUS_PATH = "data/query_corpus"
+# number of rejected attempts per requested query before we give up on finding new distinct queries
+MAX_ATTEMPTS_PER_QUERY = 10
+# how the queries of a corpus were chosen from the generated ones
+UNIFORM_SELECTION = "uniform"
+UNCERTAINTY_SELECTION = "uncertainty"
+
+
+def get_category_generators(db: Database) -> dict[QueryCategory, Callable[[], str]]:
+    selection_factory = SelectionFactory(db.schema)
+    window_factory = WindowFunctionFactory(db.schema)
+    return {
+        QueryCategory.select: lambda: selection_factory.sample_selection_query(),
+        QueryCategory.join: lambda: generate_join_query(db.schema, False, False),
+        QueryCategory.select_join: lambda: generate_join_query(db.schema, True, False),
+        QueryCategory.pseudo_aggregate: lambda: sample_group_by_query(db.schema, False, pseudo_group_by=True),
+        QueryCategory.aggregate: lambda: sample_group_by_query(db.schema, False),
+        QueryCategory.select_aggregate: lambda: sample_group_by_query(db.schema, True),
+        QueryCategory.join_agg: lambda: generate_join_agg_query(db.schema, False, False),
+        QueryCategory.select_join_agg: lambda: generate_join_agg_query(db.schema, True, False),
+        QueryCategory.join_simple_agg: lambda: generate_join_simple_agg_query(db.schema, False, False),
+        QueryCategory.select_join_simple_agg: lambda: generate_join_simple_agg_query(db.schema, True, False),
+        QueryCategory.complex_select: lambda: sample_complex_selection_query(db.schema),
+        QueryCategory.complex_select_agg: lambda: sample_group_by_query(
+            db.schema, select_input=True, pseudo_group_by=True, complex_select=True
+        ),
+        QueryCategory.complex_select_join: lambda: generate_join_query(db.schema, True, True),
+        QueryCategory.complex_select_join_agg: lambda: generate_join_agg_query(db.schema, True, True),
+        QueryCategory.complex_select_join_simple_agg: lambda: generate_join_simple_agg_query(db.schema, True, True),
+        QueryCategory.window: lambda: window_factory.get_query(),
+    }
+
+
+def get_query_name(category: QueryCategory, i: int) -> str:
+    return f"{category.name}_{i:03d}"
+
+
+def get_category_seed(seed: int, db_name: str, category: QueryCategory) -> int:
+    """
+    every category of every database gets its own seed, so categories can be generated independently
+    """
+    return zlib.crc32(f"{seed}:{db_name}:{category.name}".encode("utf-8"))
+
+
+def set_seed(seed: int):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+@dataclass
+class CategoryCorpus:
+    queries: dict[str, str]  # query name to query text
+    spare_queries: list[str]  # replacements for queries that cannot be benchmarked
+
+    def to_json(self) -> dict:
+        return {"queries": self.queries, "spare_queries": self.spare_queries}
+
+    @staticmethod
+    def from_json(data: dict) -> "CategoryCorpus":
+        return CategoryCorpus(data["queries"], data["spare_queries"])
+
+
+class SpareQueriesExhaustedException(Exception):
+    def __init__(self, message="No spare queries left to replace a query"):
+        self.message = message
+        super().__init__(self.message)
+
+
+@dataclass
+class QueryCorpus:
+    database: str
+    seed: int
+    n_queries: int
+    n_spare_queries: int
+    max_estimated_work: Optional[float]
+    categories: dict[QueryCategory, CategoryCorpus]
+    selection: str = UNIFORM_SELECTION
+
+    @staticmethod
+    def get_path(db_name: str) -> Path:
+        return Path(f"{CORPUS_PATH}/{db_name}.json")
+
+    def write(self):
+        path = self.get_path(self.database)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        result = {
+            "database": self.database,
+            "seed": self.seed,
+            "n_queries": self.n_queries,
+            "n_spare_queries": self.n_spare_queries,
+            "max_estimated_work": self.max_estimated_work,
+            "selection": self.selection,
+            "categories": {c.name: corpus.to_json() for c, corpus in self.categories.items()},
+        }
+        with open(path, "w") as f:
+            json.dump(result, f, indent=1)
+
+    @staticmethod
+    def read(db_name: str) -> Optional["QueryCorpus"]:
+        path = QueryCorpus.get_path(db_name)
+        if not path.exists():
+            return None
+        with open(path, "r") as f:
+            data = json.load(f)
+        categories = {QueryCategory[c]: CategoryCorpus.from_json(corpus) for c, corpus in data["categories"].items()}
+        return QueryCorpus(
+            data["database"],
+            data["seed"],
+            data["n_queries"],
+            data["n_spare_queries"],
+            data.get("max_estimated_work"),
+            categories,
+            data.get("selection", UNIFORM_SELECTION),
+        )
+
+    def matches(
+        self, seed: int, n_queries: int, n_spare_queries: int, max_estimated_work: Optional[float], selection: str
+    ) -> bool:
+        return (
+            self.seed == seed
+            and self.n_queries == n_queries
+            and self.n_spare_queries == n_spare_queries
+            and self.max_estimated_work == max_estimated_work
+            and self.selection == selection
+        )
+
+    def get_query_texts(self) -> list[str]:
+        return [q for c in self.categories.values() for q in list(c.queries.values()) + c.spare_queries]
+
+    def get_queries(
+        self, benchmarked: frozenset[str] = frozenset()
+    ) -> dict[QueryCategory, dict[str, Callable[[], str]]]:
+        """
+        Each callable returns its own query first.
+        Further calls (e.g. after the query ran into the time limit) draw from the spare queries of the category.
+        Spare queries in benchmarked (query texts of stored results) already replaced a query in an earlier run and
+        are not drawn again.
+        """
+        result = {}
+        for category, corpus in self.categories.items():
+            spare_queries = [q for q in corpus.spare_queries if q not in benchmarked]
+            current_result = {}
+            for name, query in corpus.queries.items():
+                current_result[name] = self._get_query_callable(query, spare_queries, name)
+            result[category] = current_result
+        return result
+
+    @staticmethod
+    def _get_query_callable(query: str, spare_queries: list[str], name: str) -> Callable[[], str]:
+        used = False
+
+        def get_query() -> str:
+            nonlocal used
+            if not used:
+                used = True
+                return query
+            if len(spare_queries) == 0:
+                raise SpareQueriesExhaustedException(f"no spare queries left to replace {name}")
+            return spare_queries.pop(0)
+
+        return get_query
+
+
+def sample_distinct_queries(
+    generator: Callable[[], str], n: int, prefilter: QueryPrefilter, description: str, verbose: bool = False
+) -> list[str]:
+    result = []
+    attempts = 0
+    while len(result) < n and attempts < n * MAX_ATTEMPTS_PER_QUERY:
+        attempts += 1
+        try:
+            query = generator()
+        except Exception as e:
+            if verbose:
+                print(f"query generation failed: {e}")
+            continue
+        if prefilter.accept(query):
+            result.append(query)
+    if len(result) < n:
+        print(f"could only generate {len(result)} of {n} distinct queries for {description}")
+    return result
+
+
+def sample_database_corpus(
+    db_name: str, n_queries: int, n_spare_queries: int, seed: int, max_estimated_work: Optional[float]
+) -> QueryCorpus:
+    db = DatabaseManager.get_database(db_name)
+    categories = {}
+    prefilter = QueryPrefilter(db.schema, max_estimated_work)
+    for category, generator in get_category_generators(db).items():
+        set_seed(get_category_seed(seed, db_name, category))
+        description = f"{db_name} {category.name}"
+        queries = sample_distinct_queries(generator, n_queries, prefilter, description)
+        spare_queries = sample_distinct_queries(generator, n_spare_queries, prefilter, f"{description} (spare)")
+        named_queries = {get_query_name(category, i + 1): q for i, q in enumerate(queries)}
+        categories[category] = CategoryCorpus(named_queries, spare_queries)
+    print(f"{db_name}: {prefilter.get_summary()}")
+    return QueryCorpus(db_name, seed, n_queries, n_spare_queries, max_estimated_work, categories)
+
+
+def generate_database_corpus(
+    db_name: str, n_queries: int, n_spare_queries: int, seed: int, max_estimated_work: Optional[float]
+) -> QueryCorpus:
+    corpus = sample_database_corpus(db_name, n_queries, n_spare_queries, seed, max_estimated_work)
+    corpus.write()
+    return corpus
+
+
+def _generate_database_corpus_worker(args: tuple[str, int, int, int, Optional[float]]) -> str:
+    db_name, n_queries, n_spare_queries, seed, max_estimated_work = args
+    generate_database_corpus(db_name, n_queries, n_spare_queries, seed, max_estimated_work)
+    return db_name
+
+
+def generate_query_corpus(
+    dbs: list[Database],
+    n_queries: int,
+    n_spare_queries: int = 10,
+    seed: int = 0,
+    n_workers: Optional[int] = None,
+    max_estimated_work: Optional[float] = None,
+) -> dict[str, QueryCorpus]:
+    """
+    Generate the queries of all databases in parallel, existing corpora with the same configuration are reused.
+    Near-duplicates and queries with an estimated work above max_estimated_work are skipped (None disables the limit)
+    """
+    result = {}
+    missing = []
+    for db in dbs:
+        corpus = QueryCorpus.read(db.get_search_path())
+        if corpus is not None and corpus.matches(
+            seed, n_queries, n_spare_queries, max_estimated_work, UNIFORM_SELECTION
+        ):
+            result[corpus.database] = corpus
+        else:
+            missing.append(db.get_search_path())
+    if len(missing) > 0:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            args = [(db_name, n_queries, n_spare_queries, seed, max_estimated_work) for db_name in missing]
+            for db_name in executor.map(_generate_database_corpus_worker, args):
+                print(f"generated queries for {db_name}")
+                result[db_name] = QueryCorpus.read(db_name)
+    return result
+
+
+def main():
+    generate_query_corpus(DatabaseManager.get_all_databases(), 40, max_estimated_work=read_max_estimated_work())
+
+
+if __name__ == "__main__":
+    main()
@@ -44,7 +44,7 @@ def sample_compare(input: IntermediateResult) -> str:
     compare: Compare = np.random.choice([c for c in Compare])
     value = None
     if compare in (Compare.Equal, Compare.Unequal):
-        unique_samples = [e for e in set(column.column.samples) if e != "null" and e is not None]
+        unique_samples = [e for e in dict.fromkeys(column.column.samples) if e != "null" and e is not None]
         value = np.random.choice(unique_samples)
     else:
         value = get_random_column_value(column)
@@ -80,7 +80,7 @@ def sample_to_string(sample) -> str:
 def sample_in_expression(input: IntermediateResult) -> str:
     qualifying_columns = [c for c in input.columns if c.column.samples is not None and len(c.column.samples) > 1]
     column: BindingColumn = np.random.choice(qualifying_columns)
-    unique_samples = [e for e in set(column.column.samples) if e != "null" and e is not None]
+    unique_samples = [e for e in dict.fromkeys(column.column.samples) if e != "null" and e is not None]
     if len(unique_samples) == 0:
         raise ValueError
     n_samples = np.random.geometric(p=0.1)
@@ -120,33 +120,106 @@ def cardinality_factor(join: Join) -> float:
     return get_selectivity(join) * join.table2.table.size
 
 
+@dataclass
+class JoinEdge:
+    """
+    a join of a column with a column of another table, the other table will always be the new table
+    """
+
+    column1: str
+    table2: Table
+    column2: str
+    selectivity: float
+    cardinality_factor: float
+
+
+class JoinCatalog:
+    """
+    All possible joins of a schema with precomputed selectivities and cardinality factors.
+    The catalog uses the table sizes and column statistics of the schema at the time it is created.
+    """
+
+    def __init__(self, schema: Schema):
+        self.schema: Schema = schema
+        self.edges: dict[str, list[JoinEdge]] = {name: self._collect_edges(t) for name, t in schema.tables.items()}
+
+    def _collect_edges(self, table: Table) -> list[JoinEdge]:
+        result = []
+        binding_table = BindingTable(table, get_binding(0))
+        for join in get_possible_joins([binding_table], self.schema, get_binding(1)):
+            result.append(
+                JoinEdge(join.column1, join.table2.table, join.column2, get_selectivity(join), cardinality_factor(join))
+            )
+        return result
+
+    def get_start_tables(self, cardinality_limit: float) -> list[Table]:
+        """
+        tables that allow at least one join within the cardinality limit
+        """
+        return [
+            t
+            for name, t in self.schema.tables.items()
+            if any(t.size * e.cardinality_factor <= cardinality_limit for e in self.edges[name])
+        ]
+
+    def sample_joins(
+        self, start_table: Table, n_joins: int, cardinality_limit: float
+    ) -> Optional[tuple[list[BindingTable], list[Join]]]:
+        """
+        walk the join graph starting at start_table, returns None if the walk got stuck before n_joins
+        """
+        included_tables: list[BindingTable] = [BindingTable(start_table, get_binding(0))]
+        joins: list[Join] = []
+        cardinality = float(start_table.size)
+        for i in range(n_joins):
+            possible_joins = [
+                (t, e)
+                for t in included_tables
+                for e in self.edges[t.table.table_name]
+                if cardinality * e.cardinality_factor <= cardinality_limit
+            ]
+            if len(possible_joins) == 0:
+                return None
+            table, edge = random.choice(possible_joins)
+            new_table = BindingTable(edge.table2, get_binding(i + 1))
+            included_tables.append(new_table)
+            joins.append(Join(table, new_table, edge.column1, edge.column2))
+            cardinality *= edge.cardinality_factor
+        assert cardinality <= cardinality_limit * 1.01, f"exceeded cardinality limit ({cardinality})"
+        return included_tables, joins
+
+
+JOIN_CATALOGS: dict[str, JoinCatalog] = {}
+
+
+def get_join_catalog(schema: Schema) -> JoinCatalog:
+    if schema.name not in JOIN_CATALOGS:
+        JOIN_CATALOGS[schema.name] = JoinCatalog(schema)
+    return JOIN_CATALOGS[schema.name]
+
+
 def sample_join_graph(
     schema: Schema, use_selections: bool, use_complex_selections: bool = False, cardinality_limit=1e7, tries=20
 ) -> JoinGraph:
-    if tries < 1:
+    catalog = get_join_catalog(schema)
+    start_tables = catalog.get_start_tables(cardinality_limit)
+    sampled_joins = None
+    for _ in range(tries):
+        if len(start_tables) == 0:
+            break
+        start_table: Table = random.choice(start_tables)
+
+        n_joins = geometric(p=0.4)
+        n_joins = min(n_joins, 5)
+
+        sampled_joins = catalog.sample_joins(start_table, n_joins, cardinality_limit)
+        if sampled_joins is not None:
+            break
+    if sampled_joins is None:
         raise RuntimeError(f"could not sample join graph for schema {schema.name} after several tries")
-    tables = list(schema.tables.values())
-    start_table: Table = random.choice(tables)
-
-    n_joins = geometric(p=0.4)
-    n_joins = min(n_joins, 5)
+    included_tables, joins = sampled_joins
 
-    joins: list[Join] = []
-    included_tables: list[BindingTable] = [BindingTable(start_table, get_binding(0))]
     selections = []
-    for i in range(n_joins):
-        cardinality = get_cardinality(included_tables, joins)
-        possible_joins = get_possible_joins(included_tables, schema, get_binding(i + 1))
-        possible_joins = [j for j in possible_joins if cardinality * cardinality_factor(j) <= cardinality_limit]
-        if len(possible_joins) == 0:
-            return sample_join_graph(schema, use_selections, tries=tries - 1)
-        new_join = random.choice(possible_joins)
-        included_tables.append(new_join.table2)
-        joins.append(new_join)
-        assert get_cardinality(included_tables, joins) <= cardinality_limit * 1.01, (
-            f"exceeded cardinality limit ({get_cardinality(included_tables, joins)})\n"
-            f"{joins_to_sql(JoinGraph(included_tables, joins, selections, None), schema)}"
-        )
     if use_selections:
         for t in included_tables:
             irs = t.to_intermediate_result()
@@ -0,0 +1,174 @@
+import argparse
+import json
+import re
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from src.database import Database
+from src.database_manager import DatabaseManager
+from src.metadata_index import get_metadata_indexes
+from src.query_generation.join_graph import Join, get_cardinality
+from src.query_generation.query_structures import BindingTable
+from src.schemata import Schema
+
+# the upper bound for the number of tuples a query may touch is calibrated on existing benchmark results (see
+# calibrate_max_estimated_work), without a calibration no query is rejected as too expensive
+CALIBRATION_PATH = "data/query_corpus/max_estimated_work.json"
+# shorter runs are dominated by the fixed overhead of a query and say little about its throughput
+MIN_CALIBRATION_RUNTIME = 0.01
+# quantile of the observed throughputs, with the median a query above the threshold exceeds the time limit for most
+# of the observed throughputs
+CALIBRATION_QUANTILE = 0.5
+# number literals are rounded to this many significant digits before queries are compared
+NEAR_DUPLICATE_DIGITS = 2
+
+# identifiers are either plain or quoted (e.g. "L_AIRPORT"), quotes are part of the table and column names of a schema
+IDENTIFIER = r'(?:\w+|"[^"]+")'
+TABLE_REFERENCE_PATTERN = re.compile(rf"(?<![\w.\"])(?:{IDENTIFIER}\.)?({IDENTIFIER}) (t\d+)\b")
+JOIN_CONDITION_PATTERN = re.compile(rf"\b(t\d+)\.({IDENTIFIER}) = (t\d+)\.({IDENTIFIER})")
+NUMBER_PATTERN = re.compile(r"(?<![\w.'])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?(?![\w.'])")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def get_referenced_tables(schema: Schema, query: str) -> dict[str, BindingTable]:
+    """
+    maps from binding name to table for all tables in the from clauses of a generated query
+    """
+    result = {}
+    for table_name, binding in TABLE_REFERENCE_PATTERN.findall(query):
+        if table_name in schema.tables and binding not in result:
+            result[binding] = BindingTable(schema.tables[table_name], binding)
+    return result
+
+
+def get_join_conditions(tables: dict[str, BindingTable], query: str) -> list[Join]:
+    result = []
+    for binding1, column1, binding2, column2 in JOIN_CONDITION_PATTERN.findall(query):
+        if binding1 == binding2 or binding1 not in tables or binding2 not in tables:
+            continue
+        if column1 not in tables[binding1].table.columns or column2 not in tables[binding2].table.columns:
+            continue
+        result.append(Join(tables[binding1], tables[binding2], column1, column2))
+    return result
+
+
+def estimate_work(schema: Schema, query: str) -> float:
+    """
+    Number of scanned tuples plus the estimated join output.
+    Selections are ignored, so this is an upper bound of the tuples the query has to process.
+    """
+    tables = get_referenced_tables(schema, query)
+    if len(tables) == 0:
+        return 0.0
+    scanned = sum(float(t.table.size) for t in tables.values())
+    if len(tables) == 1:
+        return scanned
+    joins = get_join_conditions(tables, query)
+    return scanned + get_cardinality(list(tables.values()), joins)
+
+
+def round_number(match: re.Match) -> str:
+    return f"{float(match.group(0)):.{NEAR_DUPLICATE_DIGITS}g}"
+
+
+def get_near_duplicate_key(query: str) -> str:
+    """
+    queries that only differ in whitespace or slightly different number literals get the same key
+    """
+    query = WHITESPACE_PATTERN.sub(" ", query).strip().rstrip(";")
+    return NUMBER_PATTERN.sub(round_number, query)
+
+
+class QueryPrefilter:
+    """
+    Rejects near-duplicates and queries that are expected to exceed the CPU time limit of the server.
+    One prefilter is used for all queries of a database, so no two categories share a query.
+    """
+
+    def __init__(self, schema: Schema, max_estimated_work: Optional[float] = None):
+        self.schema: Schema = schema
+        self.max_estimated_work: Optional[float] = max_estimated_work
+        self.keys: set[str] = set()
+        self.n_duplicates: int = 0
+        self.n_too_expensive: int = 0
+
+    def accept(self, query: str) -> bool:
+        key = get_near_duplicate_key(query)
+        if key in self.keys:
+            self.n_duplicates += 1
+            return False
+        if self.max_estimated_work is not None and estimate_work(self.schema, query) > self.max_estimated_work:
+            self.n_too_expensive += 1
+            return False
+        self.keys.add(key)
+        return True
+
+    def get_summary(self) -> str:
+        return f"skipped {self.n_duplicates} near-duplicates and {self.n_too_expensive} too expensive queries"
+
+
+def get_throughputs(dbs: list[Database]) -> list[float]:
+    """
+    estimated work per second of the benchmarked queries that ran at least MIN_CALIBRATION_RUNTIME
+    """
+    result = []
+    for db, index in zip(dbs, get_metadata_indexes(dbs)):
+        for m in index.get_metadata():
+            if m.median_runtime < MIN_CALIBRATION_RUNTIME:
+                continue
+            work = estimate_work(db.schema, index.get_query(m.query_hash))
+            # e.g. fixed queries that do not use the bindings of the generated queries
+            if work > 0:
+                result.append(work / m.median_runtime)
+    return result
+
+
+def calibrate_max_estimated_work(dbs: list[Database], cpu_time_limit: float) -> Optional[float]:
+    """
+    The runtime of a query grows with its work, so each benchmarked query gives a throughput (estimated work per
+    second of its median runtime). A query needs more than cpu_time_limit seconds if its estimated work exceeds the
+    throughput times the limit, the threshold uses the CALIBRATION_QUANTILE of the throughputs of all databases.
+    Selections are ignored by estimate_work, so the throughputs are upper bounds and so is the threshold.
+    None if there are no results to calibrate on.
+    """
+    throughputs = get_throughputs(dbs)
+    if len(throughputs) == 0:
+        return None
+    return float(np.quantile(throughputs, CALIBRATION_QUANTILE)) * cpu_time_limit
+
+
+def write_max_estimated_work(max_estimated_work: float, cpu_time_limit: float):
+    path = Path(CALIBRATION_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"max_estimated_work": max_estimated_work, "cpu_time_limit": cpu_time_limit}, f, indent=1)
+
+
+def read_max_estimated_work() -> Optional[float]:
+    """
+    the calibrated threshold, None (no limit) if it was not calibrated yet
+    """
+    path = Path(CALIBRATION_PATH)
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        return json.load(f)["max_estimated_work"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="calibrate the work threshold of the prefilter on existing results")
+    parser.add_argument("--cpu-time-limit", type=float, required=True, help="CPU time limit of the server in seconds")
+    args = parser.parse_args()
+    max_estimated_work = calibrate_max_estimated_work(DatabaseManager.get_all_databases(), args.cpu_time_limit)
+    if max_estimated_work is None:
+        raise RuntimeError(
+            f"no benchmark results with a runtime of at least {MIN_CALIBRATION_RUNTIME}s to calibrate on"
+        )
+    write_max_estimated_work(max_estimated_work, args.cpu_time_limit)
+    print(f"max estimated work: {max_estimated_work:.3g}")
+
+
+if __name__ == "__main__":
+    main()
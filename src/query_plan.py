@@ -1,11 +1,12 @@
 import math
+from contextlib import contextmanager
 from functools import cmp_to_key
-from typing import Tuple, Optional
+from typing import Iterator, Tuple, Optional
 
 from src.database import Database
 from src.operator_stages import ExecutionPhase, build_pipeline, OperatorStage
 from src.operator_stages import Pipeline
-from src.operators import Operator, Expressions
+from src.operators import Operator, Expressions, CardinalityOverride
 from src.operators import OperatorType
 from src.operators import parse_operator_type
 
@@ -403,3 +404,62 @@ class QueryPlan:
             result.append(build_pipeline(ops, start, stop))
         self.pipelines = result
         self.fix_union_all()
+
+    def get_cardinality_dependencies(self) -> dict[int, dict[int, list[int]]]:
+        """
+        Maps from operator id to the pipelines (by index) and their execution phases (by index within the pipeline)
+        whose feature vectors change with the cardinalities of the operator.
+        All phases of a pipeline depend on the operator that determines its scan cardinality (percentages).
+        """
+        result: dict[int, dict[int, list[int]]] = {op_id: {} for op_id in self.operators}
+        for i, pipeline in enumerate(self.pipelines):
+            if len(pipeline.operators) == 0:
+                continue
+            all_phases = list(range(len(pipeline.operators)))
+            result[pipeline.operators[0].operator.op_id][i] = all_phases
+            for j, phase in enumerate(pipeline.operators[1:], start=1):
+                phases = result[phase.operator.op_id].setdefault(i, [])
+                if phases is not all_phases:
+                    phases.append(j)
+        return result
+
+    def get_misestimation_overrides(self, op_id: int, factor: float) -> dict[int, CardinalityOverride]:
+        """
+        The output cardinality of the operator is off by factor, so is the input of the operators consuming it.
+        The estimates of all other operators stay the same.
+        """
+        op = self.operators[op_id]
+        result = {op_id: CardinalityOverride(output_cardinality=op.output_cardinality * factor)}
+        for parent in op.parents:
+            if parent.right_input_op is op and parent.right_input_cardinality is not None:
+                override = result.setdefault(parent.op_id, CardinalityOverride())
+                override.right_input_cardinality = parent.right_input_cardinality * factor
+            elif parent.input_op is op and parent.type not in (
+                OperatorType.PipelineBreakerScan,
+                OperatorType.MultiWayJoin,
+                OperatorType.SetOperation,
+            ):
+                # the input cardinality of the excluded operators is derived from their own output or always 0
+                override = result.setdefault(parent.op_id, CardinalityOverride())
+                override.input_cardinality = parent.input_cardinality * factor
+        return result
+
+    @contextmanager
+    def override_cardinalities(self, overrides: dict[int, CardinalityOverride]) -> Iterator["QueryPlan"]:
+        """
+        apply the overrides (by operator id) in place and restore the original cardinalities afterwards
+        """
+        previous = {}
+        for op_id in overrides:
+            op = self.operators[op_id]
+            previous[op_id] = (op.output_cardinality, op.input_cardinality, op.right_input_cardinality)
+        try:
+            for op_id, override in overrides.items():
+                override.apply(self.operators[op_id])
+            yield self
+        finally:
+            for op_id, (output_cardinality, input_cardinality, right_input_cardinality) in previous.items():
+                op = self.operators[op_id]
+                op.output_cardinality = output_cardinality
+                op.input_cardinality = input_cardinality
+                op.right_input_cardinality = right_input_cardinality
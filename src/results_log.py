@@ -0,0 +1,214 @@
+import json
+import os
+from contextlib import ExitStack
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+import lz4.frame
+
+from src.database import Database
+from src.database_manager import DatabaseManager
+from src.integrity import IntegrityVerdict
+
+RESULTS_LOG_NAME = "results.jsonl.lz4"
+RESULTS_INDEX_NAME = "results.index"
+# the verdicts are not stored next to the results, so checking them does not change the inputs of the stages
+INTEGRITY_CACHE_PATH = "data/integrity_cache"
+
+
+class ResultsLog:
+    """
+    Append-only log of the benchmark results of one database. Each result is a json line in its own lz4 frame and
+    the index holds category, name, offset and length of each frame. A result is synced to the log before its index
+    entry is written, so a write that was interrupted is ignored by readers and cut off when the log is opened for
+    writing again.
+    The per-query json files (data/<db>/<category>/<name>) are an export format of the log.
+    """
+
+    def __init__(self, path: Path, writable: bool = False):
+        self.path = path
+        self.log_path = path / RESULTS_LOG_NAME
+        self.index_path = path / RESULTS_INDEX_NAME
+        self.index: dict[tuple[str, str], tuple[int, int]] = {}
+        self.read_index(repair=writable)
+
+    @staticmethod
+    def get_path(db: Database) -> Path:
+        return Path(f"data/{db.get_path()}")
+
+    @staticmethod
+    def for_database(db: Database, writable: bool = False) -> "ResultsLog":
+        return ResultsLog(ResultsLog.get_path(db), writable)
+
+    def read_index(self, repair: bool):
+        """
+        skips incomplete index lines and frames, with repair they are also removed from the files
+        """
+        log_size = self.log_path.stat().st_size if self.log_path.exists() else 0
+        lines = [""]
+        if self.index_path.exists():
+            with open(self.index_path, "r") as f:
+                lines = f.read().split("\n")
+        valid_lines = []
+        end = 0
+        # the last element is empty if the index ends with a complete line
+        for line in lines[:-1]:
+            category, name, offset, length = line.split("\t")
+            offset, length = int(offset), int(length)
+            if offset + length > log_size:
+                break
+            self.index[(category, name)] = (offset, length)
+            valid_lines.append(line)
+            end = max(end, offset + length)
+        if not repair:
+            return
+        if len(valid_lines) != len(lines) - 1 or lines[-1] != "":
+            with open(self.index_path, "w") as f:
+                f.write("".join(f"{line}\n" for line in valid_lines))
+        if log_size > end:
+            os.truncate(self.log_path, end)
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def append(self, category: str, name: str, result: dict):
+        frame = lz4.frame.compress(f"{json.dumps(result)}\n".encode("utf-8"))
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, "ab") as f:
+            offset = f.tell()
+            f.write(frame)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, "a") as f:
+            f.write(f"{category}\t{name}\t{offset}\t{len(frame)}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.index[(category, name)] = (offset, len(frame))
+
+    @staticmethod
+    def read_frame(f: BinaryIO, offset: int, length: int) -> dict:
+        f.seek(offset)
+        return json.loads(lz4.frame.decompress(f.read(length)))
+
+    def read(self, category: str, name: str) -> dict:
+        with open(self.log_path, "rb") as f:
+            return self.read_frame(f, *self.index[(category, name)])
+
+    def __iter__(self) -> Iterator[tuple[str, str, dict]]:
+        """
+        (category, name, result) of all results in log order, a rerun query is only returned with its last result
+        """
+        if len(self.index) == 0:
+            return
+        with open(self.log_path, "rb") as f:
+            for (category, name), (offset, length) in sorted(self.index.items(), key=lambda e: e[1][0]):
+                yield category, name, self.read_frame(f, offset, length)
+
+    def export(self, path: Optional[Path] = None):
+        """
+        writes each result to its own json file in the per-query layout
+        """
+        path = path if path is not None else self.path
+        for category, name, result in self:
+            (path / category).mkdir(parents=True, exist_ok=True)
+            with open(path / category / name, "w") as f:
+                json.dump(result, f)
+
+
+def get_result_files(path: Path) -> dict[tuple[str, str], Path]:
+    """
+    per-query json files by category and name, e.g. downloaded or exported results
+    """
+    if not path.exists():
+        return {}
+    return {(f.parent.name, f.name): f for f in path.glob("*/*.json")}
+
+
+class ResultsManifest:
+    """
+    The completed queries of a database (in the log or in per-query files) with the integrity verdicts of their
+    results from the last check. A verdict belongs to the version of the result it was checked for (its log offset or
+    the modification time of its file), so it no longer applies once the query is run again.
+    """
+
+    def __init__(self, db: Database, writable: bool = False):
+        self.log = ResultsLog.for_database(db, writable)
+        self.files = get_result_files(self.log.path)
+        self.status_path = Path(f"{INTEGRITY_CACHE_PATH}/{db.get_path()}.json")
+        self.status: dict[str, tuple[str, bool, bool]] = {}
+        if self.status_path.exists():
+            with open(self.status_path, "r") as f:
+                self.status = {k: tuple(v) for k, v in json.load(f).items()}
+
+    def write(self):
+        self.status_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.status_path, "w") as f:
+            json.dump(self.status, f, indent=1)
+
+    def get_keys(self) -> list[tuple[str, str]]:
+        return sorted(set(self.log.index) | set(self.files))
+
+    def is_completed(self, category: str, name: str) -> bool:
+        return (category, name) in self.log or (category, name) in self.files
+
+    def get_version(self, category: str, name: str) -> str:
+        if (category, name) in self.log:
+            return f"log:{self.log.index[(category, name)][0]}"
+        return f"file:{self.files[(category, name)].stat().st_mtime_ns}"
+
+    def get_verdict(self, category: str, name: str) -> Optional[IntegrityVerdict]:
+        """
+        the cached verdict, None if the current result was not checked yet
+        """
+        status = self.status.get(f"{category}/{name}")
+        if status is None or status[0] != self.get_version(category, name):
+            return None
+        return IntegrityVerdict(*status[1:])
+
+    def set_verdict(self, category: str, name: str, verdict: IntegrityVerdict):
+        self.status[f"{category}/{name}"] = (
+            self.get_version(category, name),
+            verdict.runtimes,
+            verdict.analyze_plan_duration,
+        )
+
+    def is_valid(self, category: str, name: str) -> Optional[bool]:
+        verdict = self.get_verdict(category, name)
+        return verdict.is_valid() if verdict is not None else None
+
+    def __iter__(self) -> Iterator[tuple[str, str, dict]]:
+        return self.iterate(self.get_keys())
+
+    def iterate(self, keys: list[tuple[str, str]]) -> Iterator[tuple[str, str, dict]]:
+        """
+        (category, name, result) of the completed queries, results from the log take precedence over per-query files
+        """
+        with ExitStack() as stack:
+            f = stack.enter_context(open(self.log.log_path, "rb")) if len(self.log) > 0 else None
+            for key in keys:
+                if key in self.log:
+                    yield *key, self.log.read_frame(f, *self.log.index[key])
+                else:
+                    with open(self.files[key], "r") as result_file:
+                        yield *key, json.load(result_file)
+
+
+def iterate_results(db: Database) -> Iterator[tuple[str, str, dict]]:
+    """
+    all results of the database ordered by category and name
+    """
+    return iter(ResultsManifest(db))
+
+
+def main():
+    for db in DatabaseManager.get_all_databases():
+        log = ResultsLog.for_database(db)
+        print(f"exporting {len(log)} results of {db.schema.name}")
+        log.export()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,241 @@
-from time import sleep
+import atexit
+import os
+import signal
+import socket
+import subprocess
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Optional
 
-from invoke import run
+import requests
 
+SERVER_PATH = "./webserver"
+DB_PATH = "benchmark_setup/db/all.db"
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_ADDRESS = f"http://{SERVER_HOST}:{SERVER_PORT}"
+READY_TIMEOUT = 120.0
+READY_POLL_INTERVAL = 0.01
+STOP_TIMEOUT = 10.0
+# restarts wait RESTART_BACKOFF * 2^(restarts in a row), restarts further apart than RESTART_RESET do not count
+RESTART_BACKOFF = 0.1
+RESTART_BACKOFF_MAX = 30.0
+RESTART_RESET = 60.0
+MAX_RESTARTS = 10
 
-def start_webserver_new():
-    run(f"setsid nohup sh -c './webserver benchmark_setup/db/all.db' > /dev/null 2>&1 & ", disown=True)
-    sleep(2)
 
+class WebServer:
+    """
+    A webserver process owned by this python process, optionally pinned to a set of cpus.
+    The server runs in its own process group, which is killed on stop and at exit, so no stray server survives a run.
+    """
 
-def kill_webserver_new():
-    r1 = run(f"ps -ef | grep 'webserver benchmark_setup/db/all.db' | head -n 1 | awk '{{ print $2 }}'")
-    pid = r1.stdout.strip()
-    run(f"kill {pid}")
+    def __init__(
+        self,
+        address: str = SERVER_ADDRESS,
+        server_path: str = SERVER_PATH,
+        db_path: str = DB_PATH,
+        args: Optional[list[str]] = None,
+        env: Optional[dict[str, str]] = None,
+        cpus: Optional[list[int]] = None,
+    ):
+        self.address = address
+        self.db_path = db_path
+        self.command = [server_path, db_path] + (args if args is not None else [])
+        if cpus is not None:
+            # pinned by taskset before exec, so all threads of the server inherit the cpu set
+            self.command = ["taskset", "--cpu-list", ",".join(str(c) for c in cpus)] + self.command
+        self.env = env
+        self.cpus = cpus
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts_in_a_row = 0
+        self.last_restart = 0.0
+        atexit.register(self.stop)
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process is not None else None
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def is_ready(self) -> bool:
+        """
+        the server is ready as soon as it answers a query
+        """
+        try:
+            requests.post(f"{self.address}/query", "select 1;".encode("utf-8"), timeout=1)
+            return True
+        except (requests.ConnectionError, requests.Timeout):
+            return False
+
+    def launch(self):
+        """
+        starts the process without waiting for it to be ready
+        """
+        assert not self.is_running(), f"webserver is already running with pid {self.pid}"
+        env = dict(os.environ, **self.env) if self.env is not None else None
+        # no preexec_fn, the server is restarted from the benchmark threads
+        self.process = subprocess.Popen(
+            self.command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            env=env,
+        )
+
+    def start(self, timeout: float = READY_TIMEOUT):
+        self.launch()
+        self.wait_ready(timeout)
+
+    def wait_ready(self, timeout: float = READY_TIMEOUT):
+        deadline = monotonic() + timeout
+        while not self.is_ready():
+            if not self.is_running():
+                raise RuntimeError(f"webserver exited with code {self.process.returncode} during startup")
+            if monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"webserver did not become ready within {timeout}s")
+            sleep(READY_POLL_INTERVAL)
+
+    def stop(self, timeout: float = STOP_TIMEOUT):
+        if self.process is None:
+            return
+        if self.is_running():
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+        self.process = None
+
+    def restart(self):
+        """
+        restarts in a row wait exponentially longer, a server that keeps crashing raises after MAX_RESTARTS
+        """
+        if monotonic() - self.last_restart > RESTART_RESET:
+            self.restarts_in_a_row = 0
+        if self.restarts_in_a_row >= MAX_RESTARTS:
+            raise RuntimeError(f"webserver crashed {self.restarts_in_a_row} times in a row")
+        self.stop()
+        sleep(min(RESTART_BACKOFF_MAX, RESTART_BACKOFF * 2**self.restarts_in_a_row))
+        self.restarts_in_a_row += 1
+        self.last_restart = monotonic()
+        self.start()
+
+    def ensure_running(self):
+        """
+        restarts the server only if it crashed or does not answer anymore
+        """
+        if self.is_running() and self.is_ready():
+            return
+        self.restart()
+
+    def get_environment(self) -> dict:
+        """
+        description of the server that is stored with each benchmark result
+        """
+        return {
+            "address": self.address,
+            "host": socket.gethostname(),
+            "command": self.command,
+            "pid": self.pid,
+            "cpus": sorted(os.sched_getaffinity(self.pid)) if self.is_running() else self.cpus,
+        }
+
+    def __enter__(self) -> "WebServer":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class WebServerPool:
+    """
+    Several webservers that are started concurrently and stopped together
+    """
+
+    def __init__(self, webservers: list[WebServer]):
+        self.webservers = webservers
+
+    def __enter__(self) -> list[WebServer]:
+        try:
+            for w in self.webservers:
+                w.launch()
+            for w in self.webservers:
+                w.wait_ready()
+        except Exception:
+            self.stop()
+            raise
+        return self.webservers
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def stop(self):
+        for w in self.webservers:
+            w.stop()
+
+
+def get_cpu_sets(n_sets: int, cpus: Optional[list[int]] = None) -> list[list[int]]:
+    """
+    splits the cpus (all available to this process if None) into contiguous disjoint sets
+    """
+    cpus = sorted(cpus if cpus is not None else os.sched_getaffinity(0))
+    assert n_sets <= len(cpus), f"cannot split {len(cpus)} cpus into {n_sets} sets"
+    size, remainder = divmod(len(cpus), n_sets)
+    starts = [i * size + min(i, remainder) for i in range(n_sets + 1)]
+    return [cpus[starts[i] : starts[i + 1]] for i in range(n_sets)]
+
+
+def get_db_copy_path(i: int) -> Path:
+    path = Path(DB_PATH)
+    return path.with_name(f"{path.stem}_{i}{path.suffix}")
+
+
+def get_db_copy(i: int) -> str:
+    """
+    the i-th server holds its own copy of the database file, the first one uses the original.
+    The copy is made again if the original changed since (different size or newer)
+    """
+    if i == 0:
+        return DB_PATH
+    path = Path(DB_PATH)
+    copy_path = get_db_copy_path(i)
+    if copy_path.exists():
+        stat, copy_stat = path.stat(), copy_path.stat()
+        if stat.st_size == copy_stat.st_size and stat.st_mtime_ns <= copy_stat.st_mtime_ns:
+            return str(copy_path)
+    print(f"Copying {path} to {copy_path}")
+    tmp_path = copy_path.with_name(f"{copy_path.name}.part")
+    subprocess.run(["cp", "--reflink=auto", str(path), str(tmp_path)], check=True)
+    tmp_path.rename(copy_path)
+    return str(copy_path)
+
+
+def remove_db_copies():
+    path = Path(DB_PATH)
+    for copy_path in path.parent.glob(f"{path.stem}_*{path.suffix}*"):
+        copy_path.unlink()
+
+
+def get_local_webservers(
+    n_servers: int, cpus: Optional[list[int]] = None, port_args: Optional[list[str]] = None
+) -> list[WebServer]:
+    """
+    n_servers local servers on consecutive ports, each pinned to its own part of the cpus and with its own database
+    file. The webserver binary is not part of this repository, so the arguments that select its port have to be
+    given for more than one server, "{port}" is replaced by the port (e.g. ["--port", "{port}"])
+    """
+    if n_servers > 1 and port_args is None:
+        raise RuntimeError(
+            f"{n_servers} servers need different ports, but the port arguments of {SERVER_PATH} are not configured"
+        )
+    result = []
+    for i, server_cpus in enumerate(get_cpu_sets(n_servers, cpus)):
+        port = SERVER_PORT + i
+        args = [a.format(port=port) for a in port_args] if port != SERVER_PORT else []
+        result.append(WebServer(f"http://{SERVER_HOST}:{port}", db_path=get_db_copy(i), args=args, cpus=server_cpus))
+    return result
@@ -0,0 +1,145 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+STAGE_STATE_PATH = "stage_state.json"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+@dataclass
+class Stage:
+    """
+    A step of the pipeline, it is only run again if the content of its inputs or its parameters changed
+    or if one of its outputs is missing. Inputs and outputs are files or directories.
+    Inputs can be given as a function, if they are only known once the previous stages ran.
+    Files that are too large to be read for a content hash (e.g. the database file) are stat inputs, they are only
+    identified by size and modification time.
+    """
+
+    name: str
+    description: str
+    run: Callable[[], None]
+    inputs: Union[list[Path], Callable[[], list[Path]]] = field(default_factory=list)
+    outputs: list[Path] = field(default_factory=list)
+    dependencies: list[str] = field(default_factory=list)
+    parameters: dict = field(default_factory=dict)
+    stat_inputs: list[Path] = field(default_factory=list)
+
+    def get_inputs(self) -> list[Path]:
+        return self.inputs() if callable(self.inputs) else self.inputs
+
+
+class StageRunner:
+    """
+    Runs stages in dependency order and records the hash of their inputs in the stage state file.
+    Content hashes of files are cached by path, size and modification time, so unchanged files are not read again.
+    """
+
+    def __init__(self, state_path: Path = Path(STAGE_STATE_PATH)):
+        self.state_path = state_path
+        self.stage_hashes: dict[str, str] = {}
+        self.file_hashes: dict[str, tuple[int, int, str]] = {}
+        if state_path.exists():
+            with open(state_path, "r") as f:
+                state = json.load(f)
+            self.stage_hashes = state["stages"]
+            self.file_hashes = {p: tuple(v) for p, v in state["files"].items()}
+
+    def write(self):
+        with open(self.state_path, "w") as f:
+            json.dump({"stages": self.stage_hashes, "files": self.file_hashes}, f, indent=1)
+
+    def invalidate(self, name: str):
+        """
+        the stage is run again, even if its inputs did not change
+        """
+        self.stage_hashes.pop(name, None)
+
+    def hash_file(self, path: Path) -> str:
+        stat = path.stat()
+        cached = self.file_hashes.get(str(path))
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                sha1.update(chunk)
+        self.file_hashes[str(path)] = (stat.st_size, stat.st_mtime_ns, sha1.hexdigest())
+        return sha1.hexdigest()
+
+    def hash_path(self, path: Path) -> Optional[str]:
+        """
+        content hash of a file or of all files in a directory (including their relative paths), None if missing
+        """
+        if path.is_file():
+            return self.hash_file(path)
+        if not path.is_dir():
+            return None
+        sha1 = hashlib.sha1()
+        for file in sorted(f for f in path.rglob("*") if f.is_file()):
+            sha1.update(f"{file.relative_to(path)}\n{self.hash_file(file)}\n".encode("utf-8"))
+        return sha1.hexdigest()
+
+    @staticmethod
+    def get_fingerprint(path: Path) -> Optional[tuple[int, int]]:
+        """
+        size and modification time of a file, None if missing
+        """
+        if not path.is_file():
+            return None
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def get_input_hash(self, stage: Stage) -> str:
+        content = {
+            "inputs": {str(p): self.hash_path(p) for p in stage.get_inputs()},
+            "parameters": stage.parameters,
+        }
+        # only added if used, so the hashes of the other stages stay valid
+        if len(stage.stat_inputs) > 0:
+            content["stat_inputs"] = {str(p): self.get_fingerprint(p) for p in stage.stat_inputs}
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def is_stale(self, stage: Stage) -> bool:
+        if self.stage_hashes.get(stage.name) != self.get_input_hash(stage):
+            return True
+        return any(not p.exists() for p in stage.outputs)
+
+    @staticmethod
+    def sort_stages(stages: list[Stage]) -> list[Stage]:
+        """
+        topological order, stages without dependencies between them keep their order
+        """
+        by_name = {s.name: s for s in stages}
+        result = []
+        visited = set()
+
+        def visit(stage: Stage, path: tuple[str, ...]):
+            assert stage.name not in path, f"cyclic stage dependencies: {' -> '.join(path + (stage.name,))}"
+            if stage.name in visited:
+                return
+            for d in stage.dependencies:
+                if d in by_name:
+                    visit(by_name[d], path + (stage.name,))
+            visited.add(stage.name)
+            result.append(stage)
+
+        for s in stages:
+            visit(s, ())
+        return result
+
+    def run(self, stages: list[Stage], force: bool = False):
+        """
+        runs all stale stages (all stages if forced), the state is written after each stage
+        """
+        for stage in self.sort_stages(stages):
+            if not force and not self.is_stale(stage):
+                print(f"{stage.description} (up to date)")
+                continue
+            print(stage.description)
+            stage.run()
+            # outputs of this stage might be inputs of the same stage (e.g. caches), so hash after running
+            self.stage_hashes[stage.name] = self.get_input_hash(stage)
+            self.write()
@@ -4,7 +4,10 @@ from src.model import Model
 from src.optimizer import optimize_per_tuple_tree_model
 
 
-def optimize_all(predicted_cardinalities: bool = False) -> Model:
+def optimize_all(predicted_cardinalities: bool = False, clean_only: bool = False) -> Model:
+    """
+    with clean_only, the model is only trained on queries that pass the integrity checks
+    """
     excluded_from_train = [
         # QueryCategory.fixed,
         # QueryCategory.select,
@@ -23,6 +26,9 @@ def optimize_all(predicted_cardinalities: bool = False) -> Model:
         # QueryCategory.complex_select_join_simple_agg,
     ]
     benchmarks = DataCollector.collect_benchmarks(
-        DatabaseManager.get_train_databases(), predicted_cardinalities, exclude_query_category=excluded_from_train
+        DatabaseManager.get_train_databases(),
+        predicted_cardinalities,
+        exclude_query_category=excluded_from_train,
+        clean_only=clean_only,
     )
     return optimize_per_tuple_tree_model(benchmarks)
@@ -0,0 +1,128 @@
+from typing import Optional
+
+import numpy as np
+
+from src.data_collection import DataCollector
+from src.database_manager import DatabaseManager
+from src.model import PerTupleTreeModel
+from src.operators import CardinalityOverride
+from src.optimizer import optimize_per_tuple_tree_model
+from src.query_plan import QueryPlan
+
+
+class CardinalityWhatIf:
+    """
+    Estimates the runtime of a query plan under cardinality overrides.
+    The plan is featurized once, an override set only refeaturizes the execution phases depending on the overridden
+    operators (see QueryPlan.get_cardinality_dependencies) and only the affected pipelines are estimated again.
+    """
+
+    def __init__(self, model: PerTupleTreeModel, query_plan: QueryPlan):
+        self.model: PerTupleTreeModel = model
+        self.query_plan: QueryPlan = query_plan
+        self.feature_mapper = model.get_feature_mapper()
+        self.dependencies = query_plan.get_cardinality_dependencies()
+        # one row per execution phase after an empty row, so the sum is the pipeline vector (even for empty pipelines)
+        self.phase_vectors: list[np.ndarray] = [
+            np.vstack(
+                [self.feature_mapper.get_empty_feature_vector()]
+                + [self.feature_mapper.get_estimation_vector(phase) for phase in pipeline.operators]
+            )
+            for pipeline in query_plan.pipelines
+        ]
+        self.pipeline_matrix = np.vstack([np.sum(v, axis=0) for v in self.phase_vectors])
+        self.scan_sizes = self.feature_mapper.get_pipeline_scan_sizes(query_plan).astype(float)
+        self.pipeline_runtimes = model.predict(self.pipeline_matrix, self.scan_sizes.copy())
+        self.runtime = float(np.sum(self.pipeline_runtimes))
+
+    def get_affected_phases(self, overrides: dict[int, CardinalityOverride]) -> dict[int, set[int]]:
+        """
+        execution phases (by index within the pipeline) to refeaturize by pipeline index
+        """
+        result: dict[int, set[int]] = {}
+        for op_id in overrides:
+            for pipeline, phases in self.dependencies[op_id].items():
+                result.setdefault(pipeline, set()).update(phases)
+        return result
+
+    def get_pipeline_rows(self, overrides: dict[int, CardinalityOverride]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        indices, feature vectors and scan sizes of the pipelines affected by the overrides
+        """
+        affected = self.get_affected_phases(overrides)
+        pipelines = np.array(sorted(affected), dtype=int)
+        rows = np.zeros((len(pipelines), self.feature_mapper.n_features), dtype=float)
+        scan_sizes = np.zeros(len(pipelines), dtype=float)
+        with self.query_plan.override_cardinalities(overrides):
+            for j, i in enumerate(pipelines):
+                pipeline = self.query_plan.pipelines[i]
+                phase_vectors = self.phase_vectors[i].copy()
+                for k in affected[i]:
+                    phase_vectors[k + 1] = self.feature_mapper.get_estimation_vector(pipeline.operators[k])
+                rows[j] = np.sum(phase_vectors, axis=0)
+                scan_sizes[j] = pipeline.get_pipeline_scan_cardinality()
+        return pipelines, rows, scan_sizes
+
+    def get_pipeline_estimation_matrix(
+        self, overrides: dict[int, CardinalityOverride]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        same as FeatureMapper.get_pipeline_estimation_matrix and get_pipeline_scan_sizes with the overrides applied
+        """
+        pipelines, rows, scan_sizes = self.get_pipeline_rows(overrides)
+        matrix = self.pipeline_matrix.copy()
+        matrix[pipelines] = rows
+        result_scan_sizes = self.scan_sizes.copy()
+        result_scan_sizes[pipelines] = scan_sizes
+        return matrix, result_scan_sizes
+
+    def estimate_runtimes(self, override_sets: list[dict[int, CardinalityOverride]]) -> np.ndarray:
+        """
+        estimated runtime of the plan for each set of overrides, with a single predict call for all affected pipelines
+        """
+        if len(override_sets) == 0:
+            return np.zeros(0, dtype=float)
+        pipelines, rows, scan_sizes, labels = [], [], [], []
+        for i, overrides in enumerate(override_sets):
+            current_pipelines, current_rows, current_scan_sizes = self.get_pipeline_rows(overrides)
+            pipelines.append(current_pipelines)
+            rows.append(current_rows)
+            scan_sizes.append(current_scan_sizes)
+            labels += [i] * len(current_pipelines)
+        pipelines = np.concatenate(pipelines)
+        labels = np.array(labels, dtype=int)
+        if len(labels) == 0:
+            return np.full(len(override_sets), self.runtime)
+        pred = self.model.predict(np.vstack(rows), np.concatenate(scan_sizes))
+        # replace the original estimates of the affected pipelines
+        delta = pred - self.pipeline_runtimes[pipelines]
+        return self.runtime + np.bincount(labels, weights=delta, minlength=len(override_sets))
+
+    def get_sensitivity(self, factors: np.ndarray, op_ids: Optional[list[int]] = None) -> dict[int, np.ndarray]:
+        """
+        Estimated runtime if the cardinality estimate of a single operator is off by each factor.
+        Returns the runtimes for each factor by operator id (all operators unless op_ids are given).
+        """
+        if op_ids is None:
+            op_ids = list(self.query_plan.operators.keys())
+        override_sets = [
+            self.query_plan.get_misestimation_overrides(op_id, float(factor)) for op_id in op_ids for factor in factors
+        ]
+        runtimes = self.estimate_runtimes(override_sets).reshape(len(op_ids), len(factors))
+        return {op_id: r for op_id, r in zip(op_ids, runtimes)}
+
+
+def main():
+    queries = DataCollector.collect_benchmarks(DatabaseManager.get_train_databases(), False)
+    model = optimize_per_tuple_tree_model(queries)
+    test_query = DataCollector.collect_benchmarks(DatabaseManager.get_test_databases(), False)[0]
+    what_if = CardinalityWhatIf(model, test_query.query_plan)
+    factors = np.array([0.01, 0.1, 0.5, 2, 10, 100])
+    print(f"{test_query.name}: {what_if.runtime:.4f}s estimated")
+    for op_id, runtimes in what_if.get_sensitivity(factors).items():
+        op = test_query.query_plan.operators[op_id]
+        print(f" {op.operator_name}: " + " ".join(f"x{f:g}: {r:.4f}s" for f, r in zip(factors, runtimes)))
+
+
+if __name__ == "__main__":
+    main()